@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ImageAnalyzer.settings')
 
 application = get_asgi_application()
+
+# Jobs left queued or running by a previous server process
+from api.jobs.queue import recover_jobs  # noqa: E402
+recover_jobs()
@@ -142,3 +142,89 @@ CORS_ALLOW_CREDENTIALS = True
 import os
 ML_TRAIN_PATH = os.environ.get('ML_TRAIN_PATH', os.path.expanduser("~/Downloads/train"))
 ML_TEST_PATH = os.environ.get('ML_TEST_PATH', os.path.expanduser("~/Downloads/test"))
+
+# ML Inference Configuration
+# Tiled inference classifies the scene window by window so peak memory depends on the tile size
+ML_TILED_INFERENCE = os.environ.get('ML_TILED_INFERENCE', 'False').lower() in ('1', 'true', 'yes')
+ML_TILE_SIZE = int(os.environ.get('ML_TILE_SIZE', '0')) or None
+# Worker processes for tiled inference; values above 1 classify windows on a process pool
+ML_INFERENCE_WORKERS = int(os.environ.get('ML_INFERENCE_WORKERS', '1'))
+# Start method of the inference, evaluation and training process pools (spawn or forkserver;
+# fork is unsafe because pools are started from job queue threads)
+ML_POOL_START_METHOD = os.environ.get('ML_POOL_START_METHOD') or 'spawn'
+# Predict with the Random Forest compiled into flat NumPy arrays instead of scikit-learn.
+# Off by default: the memory-mapped artifact loads in about 1 ms instead of 0.75 s and its
+# pages are shared by all workers, but its NumPy traversal predicts about 2.4x slower
+# than scikit-learn's compiled trees (3.2 s vs 1.35 s for 100k pixels and 200 trees on one
+# core). Worth it for many short-lived workers or tight memory, not for throughput.
+# Training only writes the artifact when this is on; otherwise run convert_model.
+ML_COMPILED_FOREST = os.environ.get('ML_COMPILED_FOREST', 'False').lower() in ('1', 'true', 'yes')
+# Directory of the precompiled model artifact (memory-mapped .npy node arrays)
+ML_MODEL_ARTIFACT_PATH = os.environ.get('ML_MODEL_ARTIFACT_PATH') or None
+
+# Skip empty pixels (nodata value, internal mask / alpha, NaN or all-zero fill) at prediction time;
+# they are written with the nodata class (255) instead of being classified
+ML_NODATA_MASKING = os.environ.get('ML_NODATA_MASKING', 'True').lower() in ('1', 'true', 'yes')
+
+# Per-stage timing (wall / CPU time, peak RSS) logged as JSON by api.ml.instrumentation and sent as a
+# Server-Timing header by the analyze endpoints; tracemalloc peaks are opt-in as they slow Python code down.
+# ML_METRICS_ENDPOINT serves the per-process stage totals at /api/metrics (Prometheus text format)
+ML_INSTRUMENTATION = os.environ.get('ML_INSTRUMENTATION', 'False').lower() in ('1', 'true', 'yes')
+ML_INSTRUMENTATION_TRACEMALLOC = os.environ.get('ML_INSTRUMENTATION_TRACEMALLOC', 'False').lower() in ('1', 'true', 'yes')
+ML_METRICS_ENDPOINT = os.environ.get('ML_METRICS_ENDPOINT', 'False').lower() in ('1', 'true', 'yes')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.ml.instrumentation': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# Background jobs (sqlite-backed, local thread pool)
+ML_JOB_WORKERS = int(os.environ.get('ML_JOB_WORKERS', '1'))
+ML_JOB_QUEUE_DEPTH = int(os.environ.get('ML_JOB_QUEUE_DEPTH', '20'))
+# Processes extracting training samples in parallel (defaults to the number of CPUs)
+ML_TRAIN_WORKERS = int(os.environ.get('ML_TRAIN_WORKERS', '0')) or None
+# Out-of-core training: samples kept per scene (0 = all), memory limit for the fitted samples
+# (0 = fit everything at once; above it the forest is grown chunk by chunk with warm_start)
+# and directory of the disk-backed sample files (defaults to the system temp dir)
+ML_TRAIN_MAX_SAMPLES_PER_SCENE = int(os.environ.get('ML_TRAIN_MAX_SAMPLES_PER_SCENE', '0')) or None
+ML_TRAIN_MEMORY_BYTES = int(os.environ.get('ML_TRAIN_MEMORY_MB', '0')) * 1024 * 1024 or None
+ML_TRAIN_TMP_DIR = os.environ.get('ML_TRAIN_TMP_DIR') or None
+# Opt-in store of the raw training bands (in the scene's dtype), memory-mapped on later runs
+# and keyed by path, size and mtime. Defaults to MEDIA_ROOT/feature_cache; once full, new
+# scenes are read without being stored instead of evicting the ones already there
+ML_FEATURE_CACHE_ENABLED = os.environ.get('ML_FEATURE_CACHE_ENABLED', 'False').lower() in ('1', 'true', 'yes')
+ML_FEATURE_CACHE_DIR = os.environ.get('ML_FEATURE_CACHE_DIR') or None
+ML_FEATURE_CACHE_MAX_BYTES = int(os.environ.get('ML_FEATURE_CACHE_MAX_MB', '10240')) * 1024 * 1024
+
+# Classification result cache, keyed by upload content hash and model version
+ML_RESULT_CACHE_ENABLED = os.environ.get('ML_RESULT_CACHE_ENABLED', 'True').lower() in ('1', 'true', 'yes')
+ML_RESULT_CACHE_DIR = os.environ.get('ML_RESULT_CACHE_DIR') or None
+ML_RESULT_CACHE_MAX_BYTES = int(os.environ.get('ML_RESULT_CACHE_MAX_MB', '2048')) * 1024 * 1024
+# Results used within this many seconds are never evicted, so URLs already returned keep working
+ML_RESULT_CACHE_MIN_AGE_SECONDS = int(os.environ.get('ML_RESULT_CACHE_MIN_AGE_SECONDS', '3600'))
+# Longest side in pixels of the rendered classification PNG (None keeps full resolution)
+ML_RESULT_PREVIEW_MAX_SIZE = int(os.environ.get('ML_RESULT_PREVIEW_MAX_SIZE', '2048')) or None
+# Classification GeoTIFFs are written as Cloud-Optimized GeoTIFFs (tiled, compressed, internal overviews)
+ML_OUTPUT_COG = os.environ.get('ML_OUTPUT_COG', 'True').lower() in ('1', 'true', 'yes')
+# COG compression: DEFLATE (default), LZW, ZSTD...
+ML_OUTPUT_COMPRESS = os.environ.get('ML_OUTPUT_COMPRESS') or None
+# Multi-file analysis (/api/analyze-batch/): files per request, feature buffer shared by the batch,
+# and directories server-side paths may be read from (defaults to MEDIA_ROOT and the train/test paths)
+ML_BATCH_MAX_FILES = int(os.environ.get('ML_BATCH_MAX_FILES', '50'))
+ML_BATCH_MEMORY_MB = int(os.environ.get('ML_BATCH_MEMORY_MB', '512'))
+ML_BATCH_PATH_ROOTS = [p for p in os.environ.get('ML_BATCH_PATH_ROOTS', '').split(os.pathsep) if p] or None
+# Resumable chunked uploads (/api/uploads/): default chunk size, largest accepted file,
+# hours an idle session is kept and session directory (defaults to MEDIA_ROOT/.uploads,
+# it must be on the same filesystem as MEDIA_ROOT)
+ML_UPLOAD_CHUNK_BYTES = int(os.environ.get('ML_UPLOAD_CHUNK_MB', '8')) * 1024 * 1024
+ML_UPLOAD_MAX_BYTES = int(os.environ.get('ML_UPLOAD_MAX_MB', '20480')) * 1024 * 1024 or None
+ML_UPLOAD_EXPIRY_HOURS = int(os.environ.get('ML_UPLOAD_EXPIRY_HOURS', '24'))
+ML_UPLOAD_DIR = os.environ.get('ML_UPLOAD_DIR') or None
+# Encoded XYZ map tiles kept in memory per process (LRU)
+ML_TILE_CACHE_SIZE = int(os.environ.get('ML_TILE_CACHE_SIZE', '1024'))
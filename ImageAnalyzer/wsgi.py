@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ImageAnalyzer.settings')
 
 application = get_wsgi_application()
+
+# Jobs left queued or running by a previous server process
+from api.jobs.queue import recover_jobs  # noqa: E402
+recover_jobs()
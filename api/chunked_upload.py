@@ -0,0 +1,250 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+import rasterio
+from django.conf import settings
+from api.ml.result_cache import hash_file
+from api.upload_handler import BYTES_CABECERA, validar_cabecera_tiff
+
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 256 * 1024 * 1024
+BLOQUE_LECTURA = 1024 * 1024
+
+class UploadError(ValueError):
+    """
+    A rejected chunked upload operation (bad range, checksum mismatch, invalid file...).
+    """
+
+class ChunkedUpload:
+    """
+    A resumable upload session: a directory with meta.json, the preallocated data file and
+    one marker per verified chunk (chunks/<index>, holding its sha256). Chunks are written in
+    place at their offsets, so any number of them can be uploaded in parallel and in any order.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.id = os.path.basename(path)
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+
+    @property
+    def data_path(self):
+        return os.path.join(self.path, 'data.part')
+
+    @property
+    def size(self):
+        return self.meta['size']
+
+    @property
+    def chunk_size(self):
+        return self.meta['chunk_size']
+
+    @property
+    def chunks(self):
+        return max(1, -(-self.size // self.chunk_size))
+
+    @property
+    def completed(self):
+        return 'content_hash' in self.meta
+
+    def chunk_range(self, index):
+        inicio = index * self.chunk_size
+        return inicio, min(inicio + self.chunk_size, self.size) - 1
+
+    def received(self):
+        directorio = os.path.join(self.path, 'chunks')
+        if not os.path.isdir(directorio):
+            return []
+        return sorted(int(nombre) for nombre in os.listdir(directorio) if nombre.isdigit())
+
+    def missing(self):
+        recibidos = set(self.received())
+        return [i for i in range(self.chunks) if i not in recibidos]
+
+    def write_chunk(self, index, stream, checksum):
+        """
+        Streams one chunk from stream into its offset of the data file while hashing it, and
+        records it as received only if its sha256 matches checksum. The chunk's marker is
+        removed before its bytes are overwritten, so a failed re-send leaves it missing instead
+        of marked as verified over corrupt data. The first chunk must start with a TIFF header,
+        so a wrong file is rejected before the rest is uploaded.
+        """
+        if self.completed:
+            raise UploadError("La subida ya fue completada")
+        if not 0 <= index < self.chunks:
+            raise UploadError(f"Chunk fuera de rango: {index}")
+        inicio, fin = self.chunk_range(index)
+        restante = fin - inicio + 1
+        marcador = os.path.join(self.path, 'chunks', str(index))
+        try:
+            os.remove(marcador)
+        except FileNotFoundError:
+            pass
+
+        sha256 = hashlib.sha256()
+        try:
+            fd = os.open(self.data_path, os.O_WRONLY)
+        except FileNotFoundError:
+            raise UploadError("La subida ya se está completando")
+        try:
+            offset = inicio
+            while restante > 0:
+                datos = stream.read(min(BLOQUE_LECTURA, restante))
+                if not datos:
+                    raise UploadError(f"Chunk {index} incompleto: faltan {restante} bytes")
+                if offset == 0 and self.meta.get('validate_geotiff', True):
+                    error = validar_cabecera_tiff(datos[:BYTES_CABECERA])
+                    if error is not None:
+                        raise UploadError(error)
+                sha256.update(datos)
+                os.pwrite(fd, datos, offset)
+                offset += len(datos)
+                restante -= len(datos)
+        finally:
+            os.close(fd)
+
+        digest = sha256.hexdigest()
+        if digest != checksum.lower():
+            raise UploadError(f"Checksum del chunk {index} no coincide (recibido {digest})")
+
+        temporal = f"{marcador}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(temporal, 'w') as f:
+            f.write(digest)
+        os.replace(temporal, marcador)
+        # Keeps an active session from expiring
+        os.utime(os.path.join(self.path, 'meta.json'))
+        return digest
+
+    def complete(self, media_root):
+        """
+        Checks that every chunk arrived, hashes the assembled file (and compares it with the
+        sha256 given at init, if any), validates it as a GeoTIFF and moves it into media_root
+        under its content hash. Returns the updated meta; completing twice returns the same.
+        """
+        if self.completed:
+            return self.meta
+        faltantes = self.missing()
+        if faltantes:
+            raise UploadError(f"Faltan {len(faltantes)} chunks: {faltantes[:20]}")
+
+        # Claims the data file, so concurrent completions don't assemble it twice
+        armado = os.path.join(self.path, 'data.assembling')
+        try:
+            os.rename(self.data_path, armado)
+        except FileNotFoundError:
+            raise UploadError("La subida ya se está completando")
+
+        try:
+            content_hash = hash_file(armado)
+            # A chunk re-sent while the file was being hashed drops its marker first
+            faltantes = self.missing()
+            if faltantes:
+                raise UploadError(f"Chunks reenviados durante el armado: {faltantes[:20]}")
+            esperado = self.meta.get('sha256')
+            if esperado and esperado.lower() != content_hash:
+                raise UploadError(f"Checksum del archivo no coincide (calculado {content_hash})")
+            if self.meta.get('validate_geotiff', True):
+                try:
+                    with rasterio.open(armado):
+                        pass
+                except Exception as e:
+                    raise UploadError(f"El archivo no es un GeoTIFF legible: {e}")
+        except Exception:
+            os.rename(armado, self.data_path)
+            raise
+
+        storage_name = f"{content_hash}{os.path.splitext(self.meta['filename'])[1].lower()}"
+        destino = os.path.join(str(media_root), storage_name)
+        if os.path.exists(destino):
+            os.remove(armado)
+        else:
+            os.replace(armado, destino)
+        shutil.rmtree(os.path.join(self.path, 'chunks'), ignore_errors=True)
+
+        self.meta.update(content_hash=content_hash, storage_name=storage_name, completed_at=time.time())
+        self.save_meta()
+        return self.meta
+
+    def save_meta(self):
+        temporal = os.path.join(self.path, f".meta.json.tmp-{os.getpid()}-{threading.get_ident()}")
+        with open(temporal, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(temporal, os.path.join(self.path, 'meta.json'))
+
+class ChunkedUploadStore:
+    """
+    Upload sessions on disk. It must live on the same filesystem as MEDIA_ROOT so completed
+    files are renamed into place, not copied. Sessions idle for longer than max_age are purged.
+    """
+    def __init__(self, root, max_age):
+        self.root = str(root)
+        self.max_age = max_age
+
+    @staticmethod
+    def valid_id(upload_id):
+        return len(upload_id) == 32 and all(c in '0123456789abcdef' for c in upload_id)
+
+    def create(self, filename, size, chunk_size, sha256=None, validate_geotiff=True):
+        self.purge()
+        path = os.path.join(self.root, uuid.uuid4().hex)
+        os.makedirs(os.path.join(path, 'chunks'))
+        with open(os.path.join(path, 'data.part'), 'wb') as f:
+            # Reserve the space up front, so a full disk fails here and not halfway through
+            if size and hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(f.fileno(), 0, size)
+            else:
+                f.truncate(size)
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump({
+                'filename': os.path.basename(filename),
+                'size': size,
+                'chunk_size': chunk_size,
+                'sha256': sha256,
+                'validate_geotiff': validate_geotiff,
+                'created_at': time.time(),
+            }, f)
+        return ChunkedUpload(path)
+
+    def get(self, upload_id):
+        if not self.valid_id(upload_id):
+            return None
+        try:
+            return ChunkedUpload(os.path.join(self.root, upload_id))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def delete(self, upload_id):
+        if self.valid_id(upload_id):
+            shutil.rmtree(os.path.join(self.root, upload_id), ignore_errors=True)
+
+    def purge(self):
+        if not self.max_age or not os.path.isdir(self.root):
+            return
+        limite = time.time() - self.max_age
+        for nombre in os.listdir(self.root):
+            try:
+                if os.stat(os.path.join(self.root, nombre, 'meta.json')).st_mtime < limite:
+                    shutil.rmtree(os.path.join(self.root, nombre), ignore_errors=True)
+            except FileNotFoundError:
+                continue
+
+def get_upload_store():
+    root = getattr(settings, 'ML_UPLOAD_DIR', None) or os.path.join(settings.MEDIA_ROOT, '.uploads')
+    return ChunkedUploadStore(root, getattr(settings, 'ML_UPLOAD_EXPIRY_HOURS', 24) * 3600)
+
+def parse_content_range(valor):
+    """
+    Parses "bytes <start>-<end>/<total>" into (start, end, total), or None.
+    """
+    if not valor or not valor.startswith('bytes '):
+        return None
+    try:
+        rango, total = valor[6:].split('/')
+        inicio, fin = rango.split('-')
+        return int(inicio), int(fin), int(total)
+    except ValueError:
+        return None
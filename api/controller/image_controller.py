@@ -5,9 +5,12 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from api.services.i_image_service import IImageService
 from api.implement.image_service_impl import ImageServiceImpl
 from api.model.image_dto import UploadedImageDto
+from api.upload_handler import StreamingUploadMixin
 
-class ImageController(APIView):
+class ImageController(StreamingUploadMixin, APIView):
     parser_classes = (MultiPartParser, FormParser)
+    # Any image type is accepted here, the upload is only stored
+    validate_geotiff = False
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
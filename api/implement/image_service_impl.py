@@ -4,5 +4,9 @@ from api.services.i_image_service import IImageService
 
 class ImageServiceImpl(IImageService):
     def save_image(self, image_file: UploadedFile) -> UploadedImage:
-        uploaded_image = UploadedImage.objects.create(image=image_file)
+        if getattr(image_file, 'content_hash', None):
+            # Already streamed into MEDIA_ROOT by the upload handler, reference it instead of copying
+            uploaded_image = UploadedImage.objects.create(image=image_file.storage_name)
+        else:
+            uploaded_image = UploadedImage.objects.create(image=image_file)
         return uploaded_image
@@ -0,0 +1,33 @@
+from api.ml.analysis import analyze_image, analyze_batch, build_result_payload, build_batch_payload
+from api.ml.trainer import train_model
+from api.entity.job import Job
+from api.ml.instrumentation import medir
+
+def run_analysis(params, progress):
+    """
+    Analyzes an already uploaded image, or a batch of them (params["files"]).
+    """
+    if 'files' in params:
+        with medir('job batch analysis'):
+            return run_batch_analysis(params, progress)
+    with medir('job analysis'):
+        result = analyze_image(params['file_path'], progress=progress, content_hash=params.get('content_hash'))
+    payload = build_result_payload(result['result_id'])
+    payload['cached'] = result['cached']
+    payload['uploaded_file_url'] = params.get('uploaded_file_url')
+    return payload
+
+def run_batch_analysis(params, progress):
+    batch = analyze_batch(params['files'], progress=progress)
+    return build_batch_payload(batch, [f.get('uploaded_file_url') for f in params['files']])
+
+def run_training(params, progress):
+    """
+    Trains the model from the given train/test directories.
+    """
+    return train_model(params['train_path'], params['test_path'], progress=progress)
+
+HANDLERS = {
+    Job.KIND_ANALYSIS: run_analysis,
+    Job.KIND_TRAINING: run_training,
+}
@@ -0,0 +1,175 @@
+import os
+import time
+import threading
+import contextlib
+try:
+    import fcntl
+except ImportError:  # Windows: the depth limit only holds within each process
+    fcntl = None
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections, connection, DatabaseError
+from django.utils import timezone
+from api.entity.job import Job
+
+class QueueFullError(Exception):
+    def __init__(self, message, pending_job=None):
+        super().__init__(message)
+        self.pending_job = pending_job
+
+class ProgressReporter:
+    """
+    Persists job progress, throttled so long runs don't turn into a stream of sqlite writes.
+    """
+    def __init__(self, job_id, min_interval=1.0):
+        self.job_id = job_id
+        self.min_interval = min_interval
+        self._last_write = 0.0
+        self._last_stage = None
+
+    def __call__(self, fraction, stage=None, **details):
+        now = time.monotonic()
+        if stage == self._last_stage and fraction < 1.0 and now - self._last_write < self.min_interval:
+            return
+        updates = {'progress': round(min(max(fraction, 0.0), 1.0), 4)}
+        if stage is not None:
+            updates['stage'] = stage
+        if details:
+            updates['details'] = details
+        Job.objects.filter(pk=self.job_id).update(**updates)
+        self._last_write = now
+        self._last_stage = stage
+
+class JobQueue:
+    """
+    Runs jobs of one kind on a local thread pool. Job state lives in the database, so the
+    queue depth limit is shared by every server process of this host (submissions are
+    serialized by a lock file in BASE_DIR) and any process can report status.
+    Handlers receive the job params and a ProgressReporter and return a JSON-serializable result.
+    """
+    def __init__(self, kind, handler, workers, max_depth):
+        self.kind = kind
+        self.handler = handler
+        self.max_depth = max_depth
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{kind}-job")
+        self._lock = threading.Lock()
+        self._recover()
+
+    def pending(self):
+        return Job.objects.filter(kind=self.kind, status__in=Job.PENDING_STATUSES).count()
+
+    def submit(self, params):
+        # The count and the insert run under a file lock, so processes can't both pass the check
+        with self._lock, _bloqueo_cola(self.kind):
+            if self.pending() >= self.max_depth:
+                pending_job = Job.objects.filter(kind=self.kind, status__in=Job.PENDING_STATUSES).first()
+                raise QueueFullError(
+                    f"The {self.kind} queue is full ({self.max_depth} pending jobs), try again later",
+                    pending_job
+                )
+            job = Job.objects.create(kind=self.kind, params=params)
+        self.executor.submit(self._run, job.pk)
+        return job
+
+    def _run(self, job_id):
+        close_old_connections()
+        try:
+            # Claim atomically so a job re-enqueued after a restart never runs twice
+            claimed = Job.objects.filter(pk=job_id, status=Job.STATUS_QUEUED).update(
+                status=Job.STATUS_RUNNING, started_at=timezone.now(), worker_pid=os.getpid()
+            )
+            if not claimed:
+                return
+            job = Job.objects.get(pk=job_id)
+            try:
+                result = self.handler(job.params, ProgressReporter(job_id))
+            except Exception as e:
+                print(f"{self.kind} job {job_id} failed: {e}")
+                Job.objects.filter(pk=job_id).update(
+                    status=Job.STATUS_FAILED, error=str(e), finished_at=timezone.now()
+                )
+                return
+            Job.objects.filter(pk=job_id).update(
+                status=Job.STATUS_DONE, progress=1.0, stage='done', result=result, finished_at=timezone.now()
+            )
+        finally:
+            connection.close()
+
+    def _recover(self):
+        """
+        Fails jobs whose worker process on this host is gone and re-enqueues jobs still waiting.
+        """
+        for job in Job.objects.filter(kind=self.kind, status=Job.STATUS_RUNNING).exclude(worker_pid=None):
+            if not _pid_alive(job.worker_pid):
+                Job.objects.filter(pk=job.pk, status=Job.STATUS_RUNNING).update(
+                    status=Job.STATUS_FAILED, error='Interrupted: the worker process stopped', finished_at=timezone.now()
+                )
+        for job_id in Job.objects.filter(kind=self.kind, status=Job.STATUS_QUEUED).values_list('pk', flat=True):
+            self.executor.submit(self._run, job_id)
+
+@contextlib.contextmanager
+def _bloqueo_cola(kind):
+    """
+    Exclusive lock shared by every process of this host that submits jobs of this kind.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(settings.BASE_DIR, f"cola_{kind}.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def _pid_alive(pid):
+    if pid == os.getpid():
+        # Same pid but a fresh queue: the job belonged to a previous run of this process
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+# (workers, max depth) per kind; training is single-flight, other kinds use the settings
+QUEUE_LIMITS = {
+    Job.KIND_TRAINING: (1, 1),
+}
+
+def get_queue(kind):
+    """
+    Returns the process-wide queue for a job kind, creating it on first use.
+    """
+    from api.jobs.handlers import HANDLERS
+
+    with _queues_lock:
+        if kind not in _queues:
+            workers, max_depth = QUEUE_LIMITS.get(kind, (
+                getattr(settings, 'ML_JOB_WORKERS', 1),
+                getattr(settings, 'ML_JOB_QUEUE_DEPTH', 20),
+            ))
+            _queues[kind] = JobQueue(kind, HANDLERS[kind], workers=workers, max_depth=max_depth)
+        return _queues[kind]
+
+def recover_jobs():
+    """
+    Startup recovery, run by the WSGI / ASGI entry points so management commands skip it:
+    creates the queue of every kind with pending jobs, which fails the running ones whose
+    worker process is gone and re-enqueues the queued ones. Kinds without pending jobs are
+    left alone, so their queues are still created lazily.
+    """
+    try:
+        kinds = set(Job.objects.filter(status__in=Job.PENDING_STATUSES).values_list('kind', flat=True))
+    except DatabaseError as e:
+        # e.g. the server started before running the migrations
+        print(f"Job recovery skipped: {e}")
+        return
+    for kind in sorted(kinds):
+        print(f"Recovering pending {kind} jobs")
+        get_queue(kind)
@@ -0,0 +1,567 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.ml.classifier import ClassifierService
+from api.ml.forest import CompiledForest
+from api.ml.model_loader import get_model, get_model_path, get_artifact_path, convert_model
+from django.conf import settings
+from django.test import override_settings
+from api.ml.trainer import iterar_muestras, umbrales, calcular_mascara_semilla, muestrear_negativos, reunir_caracteristicas
+from api.ml.cog import write_cog
+from api.ml.rendering import render_classification, render_original_preview
+from PIL import Image
+import io
+from api.ml.preprocessor import preprocess_image, leer_bandas, indices_bandas, CARACTERISTICAS, CLASE_SIN_DATOS
+from rasterio.transform import from_origin
+import numpy as np
+import rasterio
+import subprocess
+import tempfile
+import tracemalloc
+import sys
+import time
+import os
+
+def crear_escena_sintetica(ruta, alto, ancho, bandas=10, tiled=False, seed=0):
+    """
+    Writes a synthetic uint16 multispectral GeoTIFF with Sentinel-2-like reflectance values.
+    """
+    rng = np.random.default_rng(seed)
+    perfil = {
+        'driver': 'GTiff',
+        'height': alto,
+        'width': ancho,
+        'count': bandas,
+        'dtype': 'uint16',
+        'crs': 'EPSG:32618',
+        'transform': from_origin(500000, 1000000, 10, 10),
+    }
+    if tiled:
+        perfil.update(tiled=True, blockxsize=256, blockysize=256)
+
+    with rasterio.open(ruta, 'w', **perfil) as dst:
+        for idx in range(1, bandas + 1):
+            dst.write(rng.integers(0, 3000, size=(alto, ancho), dtype=np.uint16), idx)
+    return ruta
+
+def _leer_bandas_por_banda(ruta_imagen):
+    """
+    Band-by-band reader used before band selection: reads band 1 for the shape and
+    every known band separately, each cast and scaled into a new array.
+    """
+    with rasterio.open(ruta_imagen) as src:
+        referencia_shape = src.read(1).shape
+        bandas = {}
+        for nombre, idx in indices_bandas(src.count).items():
+            bandas[nombre] = src.read(idx).astype(np.float32) / 10000.0
+    return bandas, referencia_shape
+
+def _preprocess_apilando(ruta_imagen):
+    """
+    Feature matrix built as before: per-band arrays and zero arrays, np.dstack, then reshape.
+    """
+    bandas, referencia_shape = _leer_bandas_por_banda(ruta_imagen)
+    bandas_nuevas = [bandas.get(nombre, np.zeros(referencia_shape, dtype=np.float32)) for nombre in CARACTERISTICAS]
+    bandas_apil = np.dstack(bandas_nuevas)
+    return bandas_apil.reshape(-1, bandas_apil.shape[2])
+
+def _muestrear_legacy(bandas, referencia_shape, seed):
+    """
+    Sampling as train_model did it before: one mask per band ORed together, np.where over the
+    whole scene, choice over every negative pixel and features gathered from a dstack copy.
+    """
+    mascaras = {}
+    for nombre in ['nir', 'swir1', 'swir2']:
+        if nombre in bandas:
+            umbral_inf, umbral_sup = umbrales[nombre]
+            mascaras[nombre] = (bandas[nombre] >= umbral_inf) & (bandas[nombre] <= umbral_sup)
+    mascara_semilla = np.zeros(referencia_shape, dtype=bool)
+    for m in mascaras.values():
+        mascara_semilla |= m
+
+    bandas_apiladas = np.dstack([bandas[b] for b in CARACTERISTICAS if b in bandas])
+    X_cienaga = bandas_apiladas[mascara_semilla]
+    no_cienaga_idx = np.where(~mascara_semilla)
+    num_no = min(X_cienaga.shape[0], len(no_cienaga_idx[0]))
+    seleccion_no = np.random.default_rng(seed).choice(len(no_cienaga_idx[0]), num_no, replace=False)
+    X_no = bandas_apiladas[no_cienaga_idx[0][seleccion_no], no_cienaga_idx[1][seleccion_no], :]
+    return np.vstack([X_cienaga, X_no]), mascara_semilla
+
+def _muestrear(bandas, referencia_shape, seed):
+    """
+    Current sampling engine of extraer_muestras, on bands already in memory.
+    """
+    mascara_semilla = calcular_mascara_semilla(bandas, referencia_shape)
+    indices_cienaga = np.flatnonzero(mascara_semilla)
+    num_no = min(len(indices_cienaga), mascara_semilla.size - len(indices_cienaga))
+    indices_no = muestrear_negativos(mascara_semilla, num_no, np.random.default_rng(seed))
+    return reunir_caracteristicas(bandas, np.concatenate([indices_cienaga, indices_no])), mascara_semilla
+
+def _render_matplotlib(classification_map):
+    """
+    Rendering used before the palette encoder: 8x8 inch coolwarm figure saved with a tight bbox.
+    """
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(8, 8))
+    ax = fig.add_subplot()
+    ax.imshow(classification_map, cmap="coolwarm")
+    ax.axis("off")
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', bbox_inches='tight')
+    return buf.getvalue()
+
+def _preview_completo(ruta_imagen, max_size=2048):
+    """
+    Preview built as before: bands 1-3 at full resolution, min/max normalization, LANCZOS resize.
+    """
+    with rasterio.open(ruta_imagen) as src:
+        rgb = np.dstack([src.read(i) for i in ([1, 2, 3] if src.count >= 3 else [1, 1, 1])])
+    rgb = np.nan_to_num(rgb.astype(np.float32), nan=0.0, posinf=0.0, neginf=0.0)
+    for i in range(3):
+        band = rgb[:, :, i]
+        band_min, band_max = np.min(band), np.max(band)
+        rgb[:, :, i] = (band - band_min) / (band_max - band_min) * 255 if band_max > band_min else 0
+    imagen = Image.fromarray(rgb.astype(np.uint8), mode='RGB')
+    if max(imagen.size) > max_size:
+        ratio = max_size / max(imagen.size)
+        imagen = imagen.resize((int(imagen.size[0] * ratio), int(imagen.size[1] * ratio)), Image.Resampling.LANCZOS)
+    buf = io.BytesIO()
+    imagen.save(buf, format='PNG')
+    return buf.getvalue()
+
+class Command(BaseCommand):
+    help = 'Benchmark the ML pipeline on a real or synthetic image'
+
+    def add_arguments(self, parser):
+        parser.add_argument('suite', choices=['parallel', 'forest', 'startup', 'read', 'preprocess', 'extract', 'render', 'preview', 'cog', 'features', 'sampling', 'nodata'], help='Benchmark to run')
+        parser.add_argument('--image', type=str, required=False, help='Image to use instead of a synthetic scene')
+        parser.add_argument('--size', type=int, default=2048, help='Side in pixels of the synthetic scene')
+        parser.add_argument('--workers', type=str, default='1,2,4', help='Comma separated worker counts')
+        parser.add_argument('--tile-size', type=int, required=False, help='Tile size in pixels for tiled inference')
+        parser.add_argument('--sizes', type=str, default='512,2048,4096', help='render/preview: comma separated output sides')
+        parser.add_argument('--scenes', type=int, default=8, help='Number of synthetic training scenes')
+        parser.add_argument('--max-peak-ratio', type=float, default=1.25,
+                            help='preprocess: fail when peak traced memory exceeds this multiple of the feature matrix')
+        parser.add_argument('--empty', type=str, default='0,0.25,0.5,0.75', help='nodata: comma separated fractions of empty border')
+        parser.add_argument('--repeat', type=int, default=1, help='Runs per configuration, the best one is reported')
+
+    def handle(self, *args, **options):
+        # Parity failures are reported as they happen and fail the command at the end,
+        # after the whole table is printed
+        self.fallos = []
+        with tempfile.TemporaryDirectory() as tmp:
+            image_path = options['image']
+            if not image_path:
+                image_path = crear_escena_sintetica(
+                    os.path.join(tmp, 'escena.tif'), options['size'], options['size'], tiled=True
+                )
+                self.stdout.write(f"Synthetic scene: {options['size']}x{options['size']}, 10 bands")
+
+            options['tmp'] = tmp
+            getattr(self, f"bench_{options['suite']}")(image_path, options)
+        if self.fallos:
+            raise CommandError(f"{len(self.fallos)} parity check(s) failed: {'; '.join(self.fallos)}")
+
+    def _fallo(self, mensaje):
+        self.stdout.write(self.style.ERROR(mensaje))
+        self.fallos.append(mensaje)
+
+    def _medir(self, funcion, repeat):
+        mejor, resultado = None, None
+        for _ in range(max(repeat, 1)):
+            inicio = time.perf_counter()
+            resultado = funcion()
+            duracion = time.perf_counter() - inicio
+            mejor = duracion if mejor is None else min(mejor, duracion)
+        return mejor, resultado
+
+    def bench_parallel(self, image_path, options):
+        """
+        Throughput of tiled inference against the number of pool workers.
+        """
+        service = ClassifierService()
+        tile_size = options['tile_size']
+
+        base_time, referencia = self._medir(
+            lambda: service.predict_tiled(image_path, tile_size)[0], options['repeat']
+        )
+        pixeles = referencia.size
+        self.stdout.write(f'{"workers":>8} {"seconds":>9} {"Mpx/s":>8} {"speedup":>8}')
+        self.stdout.write(f'{"serial":>8} {base_time:9.2f} {pixeles / base_time / 1e6:8.2f} {1.0:8.2f}')
+
+        for workers in [int(w) for w in options['workers'].split(',')]:
+            # Warm-up run so pool start-up and model loading are not measured
+            service.predict_parallel(image_path, tile_size, workers)
+            duracion, mapa = self._medir(
+                lambda: service.predict_parallel(image_path, tile_size, workers)[0], options['repeat']
+            )
+            if not np.array_equal(mapa, referencia):
+                self._fallo(f'Output with {workers} workers differs from the serial path')
+            self.stdout.write(
+                f'{workers:>8} {duracion:9.2f} {pixeles / duracion / 1e6:8.2f} {base_time / duracion:8.2f}'
+            )
+
+    def bench_forest(self, image_path, options):
+        """
+        Compiled flat-array forest against scikit-learn: parity with rf.predict and pixels per second.
+        """
+        rf = get_model()
+        X_pred, _, _ = preprocess_image(image_path)
+
+        compile_time, compilado = self._medir(lambda: CompiledForest.from_sklearn(rf), 1)
+        self.stdout.write(
+            f'Compiled {compilado.n_estimators} trees ({len(compilado.feature)} nodes, '
+            f'max depth {compilado.max_depth}) in {compile_time:.2f}s'
+        )
+
+        sk_time, y_sk = self._medir(lambda: rf.predict(X_pred), options['repeat'])
+        flat_time, y_flat = self._medir(lambda: compilado.predict(X_pred), options['repeat'])
+
+        diferentes = int(np.count_nonzero(y_sk != y_flat))
+        if diferentes:
+            self._fallo(f'Parity check failed: {diferentes} of {len(y_sk)} pixels differ')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Parity check passed on {len(y_sk)} pixels'))
+
+        self.stdout.write(f'{"predictor":>12} {"seconds":>9} {"Mpx/s":>8}')
+        self.stdout.write(f'{"sklearn":>12} {sk_time:9.2f} {len(X_pred) / sk_time / 1e6:8.2f}')
+        self.stdout.write(f'{"compiled":>12} {flat_time:9.2f} {len(X_pred) / flat_time / 1e6:8.2f}')
+
+    def bench_startup(self, image_path, options):
+        """
+        Cold start of a fresh process: joblib.load of the pickle against mapping the compiled artifact.
+        Each loader runs in its own interpreter and also times a first prediction, which is when
+        mapped pages are actually faulted in.
+        """
+        model_path = get_model_path()
+        artifact_path = get_artifact_path()
+        if not os.path.exists(os.path.join(artifact_path, 'metadata.json')):
+            self.stdout.write(f'Compiled artifact not found, converting {model_path}...')
+            convert_model(model_path=model_path, artifact_path=artifact_path)
+
+        cargadores = {
+            'joblib': f"import joblib; modelo = joblib.load({str(model_path)!r})",
+            'mmap': f"from api.ml.forest import CompiledForest; modelo = CompiledForest.load({str(artifact_path)!r})",
+        }
+        plantilla = (
+            "import time, resource, numpy as np\n"
+            "inicio = time.perf_counter()\n"
+            "{cargar}\n"
+            "carga = time.perf_counter() - inicio\n"
+            "X = np.random.default_rng(0).random((10000, 5), dtype=np.float32) * 0.3\n"
+            "inicio = time.perf_counter()\n"
+            "modelo.predict(X)\n"
+            "prediccion = time.perf_counter() - inicio\n"
+            # ru_maxrss survives exec on Linux and would report the parent's peak, VmHWM does not
+            "try:\n"
+            "    pico = [int(l.split()[1]) for l in open('/proc/self/status') if l.startswith('VmHWM')][0]\n"
+            "except OSError:\n"
+            "    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss\n"
+            "print(carga, prediccion, pico)\n"
+        )
+
+        self.stdout.write(f'{"loader":>8} {"load ms":>10} {"1st predict ms":>15} {"peak RSS MB":>12}')
+        for nombre, cargar in cargadores.items():
+            resultados = []
+            for _ in range(max(options['repeat'], 1)):
+                salida = subprocess.run(
+                    [sys.executable, '-c', plantilla.format(cargar=cargar)],
+                    cwd=str(settings.BASE_DIR), capture_output=True, text=True, check=True
+                )
+                resultados.append([float(v) for v in salida.stdout.split()])
+            carga, prediccion, rss = min(resultados)
+            self.stdout.write(f'{nombre:>8} {carga * 1000:10.1f} {prediccion * 1000:15.1f} {rss / 1024:12.1f}')
+
+    def _medir_memoria(self, funcion):
+        tracemalloc.start()
+        try:
+            inicio = time.perf_counter()
+            resultado = funcion()
+            duracion = time.perf_counter() - inicio
+            pico = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return duracion, pico, resultado
+
+    def bench_read(self, image_path, options):
+        """
+        Band-by-band reading against the band-selection-aware single multi-band read.
+        """
+        with rasterio.open(image_path) as src:
+            bytes_banda = src.height * src.width * np.dtype(src.dtypes[0]).itemsize
+            n_indices = len(indices_bandas(src.count))
+
+        lectores = [
+            # band 1 is read once more just to get the shape
+            ('per-band', lambda: _leer_bandas_por_banda(image_path)[0], n_indices + 1),
+            ('selected', lambda: leer_bandas(image_path, CARACTERISTICAS)[0], None),
+        ]
+
+        referencia = None
+        self.stdout.write(f'{"reader":>10} {"seconds":>9} {"bands read":>11} {"MB decoded":>11} {"peak MB":>9}')
+        for nombre, lector, bandas_leidas in lectores:
+            mejor = None
+            for _ in range(max(options['repeat'], 1)):
+                medida = self._medir_memoria(lector)
+                mejor = medida if mejor is None or medida[0] < mejor[0] else mejor
+            duracion, pico, bandas = mejor
+            if bandas_leidas is None:
+                bandas_leidas = len(bandas)
+
+            if referencia is None:
+                referencia = bandas
+            elif any(not np.array_equal(referencia[b], bandas[b]) for b in bandas):
+                self._fallo(f'{nombre} reader returns different values')
+
+            self.stdout.write(
+                f'{nombre:>10} {duracion:9.3f} {bandas_leidas:11d} '
+                f'{bandas_leidas * bytes_banda / 1e6:11.1f} {pico / 1e6:9.1f}'
+            )
+
+    def bench_preprocess(self, image_path, options):
+        """
+        Peak traced memory of building the feature matrix, relative to the matrix itself.
+        Fails when the current preprocess_image goes over --max-peak-ratio, so copies creeping
+        back into the preprocessing are caught.
+        """
+        constructores = [
+            ('dstack', lambda: _preprocess_apilando(image_path)),
+            ('in-place', lambda: preprocess_image(image_path)[0]),
+        ]
+
+        self.stdout.write(f'{"builder":>10} {"seconds":>9} {"matrix MB":>10} {"peak MB":>9} {"peak/matrix":>12}')
+        referencia, ratio = None, None
+        for nombre, constructor in constructores:
+            duracion, pico, X = self._medir_memoria(constructor)
+            ratio = pico / X.nbytes
+            if referencia is None:
+                referencia = X
+            elif not np.array_equal(referencia, X):
+                self._fallo(f'{nombre} builder returns a different feature matrix')
+            self.stdout.write(
+                f'{nombre:>10} {duracion:9.3f} {X.nbytes / 1e6:10.1f} {pico / 1e6:9.1f} {ratio:12.2f}'
+            )
+            del X
+
+        if ratio > options['max_peak_ratio']:
+            raise CommandError(
+                f'preprocess_image peak memory is {ratio:.2f}x the feature matrix '
+                f'(limit {options["max_peak_ratio"]:.2f}x)'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Peak memory within {options["max_peak_ratio"]:.2f}x of the feature matrix'))
+
+    def bench_extract(self, image_path, options):
+        """
+        Training sample extraction against the number of pool workers, over synthetic scenes.
+        Samples must be identical for every worker count.
+        """
+        imagenes = [
+            crear_escena_sintetica(os.path.join(options['tmp'], f'train_{i}.tif'), options['size'], options['size'], seed=i)
+            for i in range(options['scenes'])
+        ]
+        self.stdout.write(f"{len(imagenes)} training scenes of {options['size']}x{options['size']}")
+
+        def extraer(workers):
+            resultados = [r for r in iterar_muestras(imagenes, workers) if r is not None]
+            return np.concatenate([r[0] for r in resultados]), np.concatenate([r[1] for r in resultados])
+
+        # Every run decodes the scenes, the feature store is measured by the features suite
+        override_settings(ML_FEATURE_CACHE_ENABLED=False).enable()
+        referencia, base_time = None, None
+        self.stdout.write(f'{"workers":>8} {"seconds":>9} {"scenes/s":>9} {"speedup":>8}')
+        for workers in [1] + [int(w) for w in options['workers'].split(',') if int(w) > 1]:
+            duracion, (X, y) = self._medir(lambda: extraer(workers), options['repeat'])
+            if referencia is None:
+                referencia, base_time = (X, y), duracion
+            elif not (np.array_equal(referencia[0], X) and np.array_equal(referencia[1], y)):
+                self._fallo(f'Samples with {workers} workers differ from the serial run')
+            self.stdout.write(
+                f'{workers:>8} {duracion:9.2f} {len(imagenes) / duracion:9.2f} {base_time / duracion:8.2f}'
+            )
+
+    def bench_render(self, image_path, options):
+        """
+        matplotlib figure rendering against the palette PNG encoder, at several map sizes.
+        """
+        from django.conf import settings as django_settings
+        max_size = getattr(django_settings, 'ML_RESULT_PREVIEW_MAX_SIZE', None)
+        renderers = [
+            ('matplotlib', _render_matplotlib),
+            ('palette', lambda mapa: render_classification(mapa)),
+            (f'palette/{max_size}', lambda mapa: render_classification(mapa, max_size)),
+        ]
+
+        # Warm-up so imports and font caches are not measured
+        for _, renderer in renderers:
+            renderer(np.zeros((8, 8), dtype=np.uint8))
+
+        self.stdout.write(f'{"size":>6} {"renderer":>14} {"seconds":>9} {"peak MB":>9} {"PNG KB":>8}')
+        for lado in [int(v) for v in options['sizes'].split(',')]:
+            # Blocky two-class map, closer to a real classification than noise
+            rng = np.random.default_rng(0)
+            bloques = rng.integers(0, 2, size=(-(-lado // 16), -(-lado // 16)), dtype=np.uint8)
+            mapa = np.kron(bloques, np.ones((16, 16), dtype=np.uint8))[:lado, :lado]
+
+            for nombre, renderer in renderers:
+                mejor = None
+                for _ in range(max(options['repeat'], 1)):
+                    medida = self._medir_memoria(lambda: renderer(mapa))
+                    mejor = medida if mejor is None or medida[0] < mejor[0] else mejor
+                duracion, pico, png = mejor
+                self.stdout.write(f'{lado:>6} {nombre:>14} {duracion:9.3f} {pico / 1e6:9.1f} {len(png) / 1024:8.1f}')
+
+    def bench_preview(self, image_path, options):
+        """
+        Full-resolution RGB preview against decimated reads, with and without overviews,
+        for several output sizes.
+        """
+        con_overviews = os.path.join(options['tmp'], 'overviews.tif')
+        with rasterio.open(image_path) as src:
+            perfil = src.profile
+            self.stdout.write(f'Input: {src.width}x{src.height}, {src.count} bands')
+            with rasterio.open(con_overviews, 'w', **perfil) as dst:
+                dst.write(src.read())
+        with rasterio.open(con_overviews, 'r+') as dst:
+            dst.build_overviews([2, 4, 8, 16], rasterio.enums.Resampling.average)
+
+        self.stdout.write(f'{"size":>6} {"preview":>12} {"seconds":>9} {"peak MB":>9} {"PNG KB":>8}')
+        for lado in [int(v) for v in options['sizes'].split(',')]:
+            generadores = [
+                ('full-res', lambda: _preview_completo(image_path, lado)),
+                ('decimated', lambda: render_original_preview(image_path, lado)),
+                ('overviews', lambda: render_original_preview(con_overviews, lado)),
+            ]
+            for nombre, generador in generadores:
+                mejor = None
+                for _ in range(max(options['repeat'], 1)):
+                    medida = self._medir_memoria(generador)
+                    mejor = medida if mejor is None or medida[0] < mejor[0] else mejor
+                duracion, pico, png = mejor
+                self.stdout.write(f'{lado:>6} {nombre:>12} {duracion:9.3f} {pico / 1e6:9.1f} {len(png) / 1024:8.1f}')
+
+    def bench_cog(self, image_path, options):
+        """
+        Classification GeoTIFF written with the input profile against COG output, on a blocky
+        class map the size of the scene: write time, file size and layout.
+        """
+        with rasterio.open(image_path) as src:
+            perfil = src.profile
+        # The legacy writer keeps the input layout, which is usually striped and uncompressed
+        perfil_entrada = dict(perfil, tiled=False, compress=None)
+        perfil_entrada.pop('blockxsize', None)
+        perfil_entrada.pop('blockysize', None)
+
+        rng = np.random.default_rng(0)
+        alto, ancho = perfil['height'], perfil['width']
+        bloques = rng.integers(0, 2, size=(-(-alto // 16), -(-ancho // 16)), dtype=np.uint8)
+        mapa = np.kron(bloques, np.ones((16, 16), dtype=np.uint8))[:alto, :ancho]
+
+        service = ClassifierService()
+        escritores = [
+            ('input', lambda ruta: service.save_classification(mapa, dict(perfil_entrada), ruta, cog=False)),
+            ('cog/deflate', lambda ruta: write_cog(mapa, perfil, ruta, compress='DEFLATE')),
+            ('cog/lzw', lambda ruta: write_cog(mapa, perfil, ruta, compress='LZW')),
+        ]
+
+        self.stdout.write(f'{"writer":>12} {"seconds":>9} {"MB":>8} {"block":>10} {"overviews":>10}')
+        for nombre, escritor in escritores:
+            ruta = os.path.join(options['tmp'], f"{nombre.replace('/', '_')}.tif")
+            duracion, _ = self._medir(lambda: escritor(ruta), options['repeat'])
+            with rasterio.open(ruta) as dst:
+                bloque = 'x'.join(str(v) for v in dst.block_shapes[0])
+                overviews = len(dst.overviews(1))
+                if not np.array_equal(dst.read(1), mapa):
+                    self._fallo(f'{nombre} output differs from the class map')
+            self.stdout.write(f'{nombre:>12} {duracion:9.3f} {os.path.getsize(ruta) / 1e6:8.2f} {bloque:>10} {overviews:>10}')
+
+    def bench_nodata(self, image_path, options):
+        """
+        Prediction with every pixel fed to the model against nodata masking, on copies of the scene
+        whose left columns are blanked to a declared nodata value. Valid pixels must get the same
+        labels and empty ones CLASE_SIN_DATOS.
+        """
+        with rasterio.open(image_path) as src:
+            perfil = dict(src.profile, nodata=0)
+            datos = src.read()
+
+        service = ClassifierService()
+        self.stdout.write(f'{"empty":>6} {"all px s":>9} {"masked s":>9} {"speedup":>8}')
+        for fraccion in [float(f) for f in options['empty'].split(',')]:
+            columnas = int(round(perfil['width'] * fraccion))
+            ruta = os.path.join(options['tmp'], f'vacia_{fraccion}.tif')
+            escena = datos.copy()
+            escena[:, :, :columnas] = 0
+            with rasterio.open(ruta, 'w', **perfil) as dst:
+                dst.write(escena)
+            del escena
+
+            with override_settings(ML_NODATA_MASKING=False):
+                base_time, referencia = self._medir(
+                    lambda: service.predict(ruta, tiled=False, workers=1)[0], options['repeat'])
+            duracion, mapa = self._medir(lambda: service.predict(ruta, tiled=False, workers=1)[0], options['repeat'])
+            if not (np.array_equal(mapa[:, columnas:], referencia[:, columnas:])
+                    and (mapa[:, :columnas] == CLASE_SIN_DATOS).all()):
+                self._fallo(f'Masked output differs with {fraccion:.0%} empty')
+            self.stdout.write(f'{fraccion:>6.0%} {base_time:9.2f} {duracion:9.2f} {base_time / duracion:8.2f}')
+
+    def bench_features(self, image_path, options):
+        """
+        Serial sample extraction decoding every scene, against a cold and a warm feature store.
+        Samples must be identical in all three runs.
+        """
+        imagenes = [
+            crear_escena_sintetica(os.path.join(options['tmp'], f'train_{i}.tif'), options['size'], options['size'], seed=i)
+            for i in range(options['scenes'])
+        ]
+        self.stdout.write(f"{len(imagenes)} training scenes of {options['size']}x{options['size']}")
+
+        def extraer():
+            resultados = [r for r in iterar_muestras(imagenes, 1) if r is not None]
+            return np.concatenate([r[0] for r in resultados]), np.concatenate([r[1] for r in resultados])
+
+        store_dir = os.path.join(options['tmp'], 'feature_cache')
+        ejecuciones = [
+            ('no store', dict(ML_FEATURE_CACHE_ENABLED=False)),
+            ('cold', dict(ML_FEATURE_CACHE_ENABLED=True, ML_FEATURE_CACHE_DIR=store_dir)),
+            ('warm', dict(ML_FEATURE_CACHE_ENABLED=True, ML_FEATURE_CACHE_DIR=store_dir)),
+        ]
+
+        referencia = None
+        self.stdout.write(f'{"run":>9} {"seconds":>9} {"scenes/s":>9} {"store MB":>9}')
+        for nombre, ajustes in ejecuciones:
+            with override_settings(**ajustes):
+                duracion, (X, y) = self._medir(extraer, 1)
+            if referencia is None:
+                referencia = (X, y)
+            elif not (np.array_equal(referencia[0], X) and np.array_equal(referencia[1], y)):
+                self._fallo(f'Samples of the {nombre} run differ')
+            tamano = sum(os.path.getsize(os.path.join(d, f)) for d, _, fs in os.walk(store_dir) for f in fs) if os.path.isdir(store_dir) else 0
+            self.stdout.write(f'{nombre:>9} {duracion:9.2f} {len(imagenes) / duracion:9.2f} {tamano / 1e6:9.1f}')
+
+    def bench_sampling(self, image_path, options):
+        """
+        Seed mask and balanced sampling of one scene, old engine against the current one,
+        on bands already loaded. Positives must match and negatives must be distinct pixels
+        outside the mask (which negatives are drawn differs between the engines).
+        """
+        bandas, _, referencia_shape = leer_bandas(image_path)
+        self.stdout.write(f'{"engine":>8} {"seconds":>9} {"peak MB":>9} {"samples":>10}')
+        referencia = None
+        for nombre, motor in [('legacy', _muestrear_legacy), ('current', _muestrear)]:
+            mejor = None
+            for _ in range(max(options['repeat'], 1)):
+                medida = self._medir_memoria(lambda: motor(bandas, referencia_shape, 0))
+                mejor = medida if mejor is None or medida[0] < mejor[0] else mejor
+            duracion, pico, (X, mascara) = mejor
+            n_pos = int(np.count_nonzero(mascara))
+            if referencia is None:
+                referencia = X
+            elif X.shape != referencia.shape or not np.array_equal(X[:n_pos], referencia[:n_pos]):
+                self._fallo(f'{nombre} engine returns different positive samples')
+            self.stdout.write(f'{nombre:>8} {duracion:9.3f} {pico / 1e6:9.1f} {len(X):10d}')
+
+        # Negatives of the current engine: distinct pixels, all outside the mask
+        mascara = calcular_mascara_semilla(bandas, referencia_shape)
+        indices = muestrear_negativos(mascara, min(int(mascara.sum()), int((~mascara).sum())), np.random.default_rng(0))
+        if mascara.ravel()[indices].any() or len(np.unique(indices)) != len(indices):
+            raise CommandError('Negative samples overlap the seed mask or repeat pixels')
+        self.stdout.write(self.style.SUCCESS('Positives identical, negatives distinct and outside the mask'))
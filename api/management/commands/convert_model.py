@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from api.ml.model_loader import convert_model, get_model_path, get_artifact_path
+import os
+
+class Command(BaseCommand):
+    help = 'Convert a trained model pickle into a precompiled, memory-mappable artifact'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', type=str, required=False, help='Path to the model pickle (defaults to modelo_rf_cienagas.pkl)')
+        parser.add_argument('--output', type=str, required=False, help='Directory for the compiled artifact')
+
+    def handle(self, *args, **options):
+        model_path = options['model'] or get_model_path()
+        artifact_path = options['output'] or get_artifact_path()
+
+        if not os.path.exists(model_path):
+            self.stdout.write(self.style.ERROR(f'Model not found: {model_path}'))
+            return
+
+        self.stdout.write(f'Converting model: {model_path}...')
+        try:
+            output = convert_model(model_path=model_path, artifact_path=artifact_path)
+            self.stdout.write(self.style.SUCCESS(f'Compiled model saved to: {output}'))
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Conversion failed: {str(e)}'))
@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from api.ml.classifier import ClassifierService
 import os
+import time
 import numpy as np
 
 class Command(BaseCommand):
@@ -9,6 +10,11 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('--image', type=str, required=True, help='Path to the image to classify')
         parser.add_argument('--output', type=str, required=False, help='Path to save the output classification')
+        parser.add_argument('--format', choices=['cog', 'gtiff'], required=False,
+                            help='Output layout: cog (tiled, compressed, overviews) or gtiff (input profile); defaults to ML_OUTPUT_COG')
+        parser.add_argument('--tiled', action='store_true', help='Classify the image window by window to bound memory usage')
+        parser.add_argument('--workers', type=int, required=False, help='Worker processes for parallel tiled inference')
+        parser.add_argument('--tile-size', type=int, required=False, help='Tile size in pixels for tiled inference (defaults to the raster block layout)')
 
     def handle(self, *args, **options):
         image_path = options['image']
@@ -22,15 +28,26 @@ class Command(BaseCommand):
         
         service = ClassifierService()
         try:
-            classification_map, perfil = service.predict(image_path)
+            classification_map, perfil = service.predict(
+                image_path,
+                tiled=options['tiled'] or None,
+                tile_size=options['tile_size'],
+                workers=options['workers']
+            )
             
             unique, counts = np.unique(classification_map, return_counts=True)
             stats = dict(zip(unique, counts))
             self.stdout.write(self.style.SUCCESS(f'Classification successful! Stats: {stats}'))
 
             if output_path:
-                service.save_classification(classification_map, perfil, output_path)
-                self.stdout.write(self.style.SUCCESS(f'Saved classification to: {output_path}'))
+                cog = None if options['format'] is None else options['format'] == 'cog'
+                inicio = time.perf_counter()
+                service.save_classification(classification_map, perfil, output_path, cog=cog)
+                duracion = time.perf_counter() - inicio
+                self.stdout.write(self.style.SUCCESS(
+                    f'Saved classification to: {output_path} '
+                    f'({os.path.getsize(output_path) / 1e6:.2f} MB in {duracion:.2f}s)'
+                ))
             
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'Error during classification: {str(e)}'))
@@ -1,5 +1,5 @@
 from django.core.management.base import BaseCommand
-from api.ml.trainer import train_model
+from api.ml.trainer import train_model, TrainingInProgressError
 import os
 
 class Command(BaseCommand):
@@ -20,6 +20,32 @@ class Command(BaseCommand):
         self.stdout.write(f'Starting training with images from: {train_path}')
         try:
             metrics = train_model(train_path, test_path)
+            evaluacion = metrics.pop('evaluation', None)
             self.stdout.write(self.style.SUCCESS(f'Training completed successfully! Metrics: {metrics}'))
+            if evaluacion is not None:
+                self._reporte(evaluacion)
+        except TrainingInProgressError as e:
+            self.stdout.write(self.style.ERROR(f'Training not started: {str(e)}'))
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'Training failed: {str(e)}'))
+
+    def _reporte(self, evaluacion):
+        """
+        Test-set metrics against the seed-mask pseudo-labels, overall and per scene.
+        """
+        (tn, fp), (fn, tp) = evaluacion['confusion_matrix']
+        self.stdout.write(
+            f"\nTest set: {evaluacion['test_images']} images, {evaluacion['pixels']} pixels, {evaluacion['seconds']:.2f}s\n"
+            f"  recall {evaluacion['recall']:.4f}  precision {evaluacion['precision']:.4f}  "
+            f"F1 {evaluacion['f1']:.4f}  accuracy {evaluacion['accuracy']:.4f}\n"
+            f"  confusion matrix (rows: pseudo-label 0/1, columns: predicted 0/1): [[{tn}, {fp}], [{fn}, {tp}]]"
+        )
+        self.stdout.write(f'\n{"image":>30} {"pixels":>11} {"recall":>8} {"precision":>10} {"F1":>8} {"seconds":>9}')
+        for escena in evaluacion['scenes']:
+            if 'error' in escena:
+                self.stdout.write(f"{escena['image']:>30} {escena['error']}")
+                continue
+            self.stdout.write(
+                f"{escena['image']:>30} {escena['pixels']:11d} {escena['recall']:8.4f} "
+                f"{escena['precision']:10.4f} {escena['f1']:8.4f} {escena['seconds']:9.2f}"
+            )
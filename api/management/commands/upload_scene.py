@@ -0,0 +1,86 @@
+from django.core.management.base import BaseCommand, CommandError
+from concurrent.futures import ThreadPoolExecutor
+import urllib.request
+import urllib.error
+import hashlib
+import json
+import time
+import os
+
+class Command(BaseCommand):
+    help = 'Upload a large scene to a running server with the resumable chunked upload API, sending chunks in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=str, help='Scene to upload')
+        parser.add_argument('--server', type=str, default='http://localhost:8000', help='Base URL of the server')
+        parser.add_argument('--workers', type=int, default=4, help='Chunks uploaded in parallel')
+        parser.add_argument('--chunk-mb', type=int, required=False, help='Chunk size in MB (defaults to the server setting)')
+        parser.add_argument('--resume', type=str, required=False, help='Upload id of an interrupted upload to resume')
+        parser.add_argument('--retries', type=int, default=3, help='Attempts per chunk')
+        parser.add_argument('--no-analyze', action='store_true', help='Only store the scene, without queueing its analysis')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.isfile(path):
+            raise CommandError(f'File not found: {path}')
+        base = options['server'].rstrip('/') + '/api/uploads/'
+
+        if options['resume']:
+            sesion = self._json('GET', f"{base}{options['resume']}/")
+        else:
+            datos = {'filename': os.path.basename(path), 'size': os.path.getsize(path)}
+            if options['chunk_mb']:
+                datos['chunk_size'] = options['chunk_mb'] * 1024 * 1024
+            sesion = self._json('POST', base, json.dumps(datos).encode(), {'Content-Type': 'application/json'})
+
+        pendientes = [i for i in range(sesion['chunks']) if i not in set(sesion['received'])]
+        self.stdout.write(f"Upload {sesion['upload_id']}: {len(pendientes)} of {sesion['chunks']} chunks "
+                          f"of {sesion['chunk_size'] / 1024 ** 2:.1f} MB to send")
+
+        inicio = time.perf_counter()
+        enviados = 0
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as pool:
+            futuros = [pool.submit(self._enviar_chunk, path, sesion, i, options['retries']) for i in pendientes]
+            for futuro in futuros:
+                try:
+                    enviados += futuro.result()
+                except CommandError:
+                    pool.shutdown(cancel_futures=True)
+                    raise CommandError(f"Upload interrupted, resume it with --resume {sesion['upload_id']}")
+        segundos = time.perf_counter() - inicio
+        self.stdout.write(f'Sent {enviados / 1024 ** 2:.1f} MB in {segundos:.1f}s '
+                          f'({enviados / 1024 ** 2 / max(segundos, 1e-9):.1f} MB/s, {options["workers"]} workers)')
+
+        url = sesion['complete_url'] + ('?analyze=0' if options['no_analyze'] else '')
+        resultado = self._json('POST', url)
+        self.stdout.write(self.style.SUCCESS(f"Completed: {resultado['uploaded_file_url']}"))
+        if resultado.get('status_url'):
+            self.stdout.write(f"Analysis job {resultado['id']}: {resultado['status_url']}")
+
+    def _enviar_chunk(self, path, sesion, index, reintentos):
+        inicio = index * sesion['chunk_size']
+        with open(path, 'rb') as f:
+            f.seek(inicio)
+            datos = f.read(sesion['chunk_size'])
+        headers = {
+            'Content-Type': 'application/octet-stream',
+            'Content-Range': f"bytes {inicio}-{inicio + len(datos) - 1}/{sesion['size']}",
+            'X-Chunk-SHA256': hashlib.sha256(datos).hexdigest(),
+        }
+        for intento in range(1, reintentos + 1):
+            try:
+                self._json('PUT', sesion['upload_url'], datos, headers)
+                return len(datos)
+            except CommandError as e:
+                self.stderr.write(f'Chunk {index}, attempt {intento}/{reintentos}: {e}')
+        raise CommandError(f'Chunk {index} failed')
+
+    def _json(self, metodo, url, datos=None, headers=None):
+        pedido = urllib.request.Request(url, data=datos, headers=headers or {}, method=metodo)
+        try:
+            with urllib.request.urlopen(pedido) as respuesta:
+                return json.loads(respuesta.read() or b'{}')
+        except urllib.error.HTTPError as e:
+            raise CommandError(f'{metodo} {url}: {e.code} {e.read().decode(errors="replace")}')
+        except urllib.error.URLError as e:
+            raise CommandError(f'{metodo} {url}: {e.reason}')
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='details',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AlterField(
+            model_name='job',
+            name='kind',
+            field=models.CharField(choices=[('analysis', 'Analysis'), ('training', 'Training')], max_length=20),
+        ),
+    ]
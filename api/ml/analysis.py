@@ -0,0 +1,219 @@
+import os
+import time
+import base64
+from django.conf import settings
+from django.urls import reverse
+from api.ml.classifier import ClassifierService
+from api.ml.rendering import render_classification, render_original_preview
+from api.ml.model_loader import get_versioned_predictor
+from api.ml.batch import ConcatenatedClassifier
+from api.ml.preprocessor import CLASE_SIN_DATOS
+from api.ml.result_cache import get_result_cache, hash_file
+from api.ml.instrumentation import etapa
+
+def png_data_url(png_bytes):
+    if png_bytes is None:
+        return None
+    with etapa('base64'):
+        return f"data:image/png;base64,{base64.b64encode(png_bytes).decode('utf-8')}"
+
+# Response fields and the stored artifact each one points to
+RESULT_ARTIFACTS = {
+    "result_image_url": "resultado.png",
+    "original_image_url": "original.png",
+    "classification_url": "clasificacion.tif",
+}
+CONTENT_TYPES = {
+    ".png": "image/png",
+    ".tif": "image/tiff",
+}
+
+def analyze_image(file_path, progress=None, content_hash=None, preview=True):
+    """
+    Runs the full analysis of an uploaded image: RGB preview, classification and rendering.
+    The outputs are stored as addressable artifacts in the result store, under an id built
+    from the file's content hash (computed when not given) and the model version; with
+    ML_RESULT_CACHE_ENABLED an existing result for the same id is reused.
+    progress, if given, is called with the completed fraction and the current stage.
+    Returns {"result_id": ..., "cached": bool}.
+    """
+    def reportar(fraccion, etapa):
+        if progress is not None:
+            progress(fraccion, etapa)
+
+    store = get_result_cache()
+    # The version of the model that will classify it, not just the one on disk right now
+    model_version = get_versioned_predictor()[1]
+    result_id = store.key(content_hash or hash_file(file_path), model_version)
+
+    if getattr(settings, 'ML_RESULT_CACHE_ENABLED', True):
+        entry = store.get(result_id)
+        if entry is not None:
+            if preview and entry.file('original.png') is None:
+                original_png = render_original_preview(file_path)
+                if original_png is not None:
+                    store.add_file(result_id, 'original.png', original_png)
+            reportar(1.0, 'done')
+            return {"result_id": result_id, "cached": True}
+
+    original_png = None
+    if preview:
+        reportar(0.0, 'preview')
+        original_png = render_original_preview(file_path)
+
+    # Classification takes most of the time, map its progress to 10%-90%
+    reportar(0.1, 'classification')
+    service = ClassifierService()
+    classification_map, perfil = service.predict(
+        file_path,
+        progress=lambda fraccion: reportar(0.1 + 0.8 * fraccion, 'classification'),
+        model_version=model_version,
+    )
+
+    reportar(0.9, 'rendering')
+    guardar_resultado(store, result_id, model_version, file_path, classification_map, perfil, original_png,
+                      on_saving=lambda: reportar(0.95, 'saving'))
+    reportar(1.0, 'done')
+
+    return {"result_id": result_id, "cached": False}
+
+def guardar_resultado(store, result_id, model_version, file_path, classification_map, perfil, original_png,
+                      on_saving=None):
+    """
+    Renders the classification PNG and stores it with the GeoTIFF and the RGB preview under result_id.
+    """
+    result_png = render_classification(
+        classification_map, getattr(settings, 'ML_RESULT_PREVIEW_MAX_SIZE', None), transparent_index=CLASE_SIN_DATOS
+    )
+
+    if on_saving is not None:
+        on_saving()
+    tif_path = os.path.join(store.root, f".{result_id}-{os.getpid()}.tif")
+    os.makedirs(store.root, exist_ok=True)
+    ClassifierService().save_classification(classification_map, perfil, tif_path)
+    store.put(result_id, {
+        'clasificacion.tif': tif_path,
+        'resultado.png': result_png,
+        'original.png': original_png,
+    }, meta={
+        'model_version': model_version,
+        'source': os.path.basename(file_path),
+        'source_path': os.path.abspath(file_path),
+        'width': int(classification_map.shape[1]),
+        'height': int(classification_map.shape[0]),
+    })
+
+def analyze_batch(entradas, progress=None, preview=True):
+    """
+    Analyzes several images together. entradas is a list of dicts with file_path and optionally
+    content_hash and name. Cached results are reused; the other scenes are classified with
+    shared predict calls over concatenated pixel blocks (ConcatenatedClassifier), whose feature
+    buffer is limited to ML_BATCH_MEMORY_MB, and each result is stored as soon as its scene is done.
+    Returns {"results": [...], "timing": {...}} with one result per input, in input order.
+    """
+    inicio_lote = time.perf_counter()
+    tiempos = {'hashing': 0.0, 'classification': 0.0, 'preview': 0.0, 'saving': 0.0}
+    store = get_result_cache()
+    predictor, model_version = get_versioned_predictor()
+    reutilizar = getattr(settings, 'ML_RESULT_CACHE_ENABLED', True)
+
+    resultados = []
+    por_clasificar = {}  # result_id -> indices of the inputs with that content
+    for i, entrada in enumerate(entradas):
+        inicio = time.perf_counter()
+        result_id = store.key(entrada.get('content_hash') or hash_file(entrada['file_path']), model_version)
+        tiempos['hashing'] += time.perf_counter() - inicio
+
+        resultados.append({"name": entrada.get('name') or os.path.basename(entrada['file_path']),
+                           "result_id": result_id, "cached": False})
+        if reutilizar and store.get(result_id) is not None:
+            resultados[i]["cached"] = True
+        else:
+            por_clasificar.setdefault(result_id, []).append(i)
+
+    terminadas = len(entradas) - sum(len(indices) for indices in por_clasificar.values())
+    def reportar(etapa):
+        if progress is not None:
+            progress(terminadas / max(len(entradas), 1), etapa, files_done=terminadas, files_total=len(entradas))
+    reportar('classification')
+
+    clasificador = ConcatenatedClassifier(
+        predictor,
+        getattr(settings, 'ML_BATCH_MEMORY_MB', 512) * 1024 * 1024,
+        getattr(settings, 'ML_TILE_SIZE', None),
+    )
+    escenas = [(result_id, entradas[indices[0]]['file_path']) for result_id, indices in por_clasificar.items()]
+    clasificadas = clasificador.classify(escenas)
+    while True:
+        inicio = time.perf_counter()
+        siguiente = next(clasificadas, None)
+        tiempos['classification'] += time.perf_counter() - inicio
+        if siguiente is None:
+            break
+
+        result_id, classification_map, perfil, error = siguiente
+        indices = por_clasificar[result_id]
+        if error is None:
+            file_path = entradas[indices[0]]['file_path']
+            inicio = time.perf_counter()
+            original_png = render_original_preview(file_path) if preview else None
+            tiempos['preview'] += time.perf_counter() - inicio
+
+            inicio = time.perf_counter()
+            guardar_resultado(store, result_id, model_version, file_path, classification_map, perfil, original_png)
+            tiempos['saving'] += time.perf_counter() - inicio
+            del classification_map
+        for i in indices:
+            if error is not None:
+                resultados[i] = {"name": resultados[i]["name"], "error": str(error)}
+        terminadas += len(indices)
+        reportar('classification')
+
+    timing = {f"{etapa}_seconds": round(segundos, 3) for etapa, segundos in tiempos.items()}
+    timing.update(
+        total_seconds=round(time.perf_counter() - inicio_lote, 3),
+        files=len(entradas),
+        classified=len(escenas),
+        cached=sum(1 for r in resultados if r.get("cached")),
+        failed=sum(1 for r in resultados if "error" in r),
+        pixels=clasificador.pixels,
+        predict_calls=clasificador.predict_calls,
+    )
+    return {"results": resultados, "timing": timing}
+
+def build_result_payload(result_id, inline=False):
+    """
+    Response fields of a stored result: artifact URLs, or base64 data URLs for the PNGs
+    when inline (the response format used before results were addressable).
+    Missing artifacts (e.g. no RGB preview) are returned as None.
+    """
+    entry = get_result_cache().get(result_id)
+    if entry is None:
+        raise FileNotFoundError(f"Result not found: {result_id}")
+
+    payload = {"result_id": result_id}
+    for campo, nombre in RESULT_ARTIFACTS.items():
+        if entry.file(nombre) is None:
+            payload[campo] = None
+        elif inline and nombre.endswith('.png'):
+            payload[campo] = png_data_url(entry.read(nombre))
+        else:
+            payload[campo] = reverse('result_artifact', args=[result_id, nombre])
+    payload["result_url"] = reverse('result_detail', args=[result_id])
+    # XYZ template for web maps (Leaflet / OpenLayers), see ResultTileView
+    payload["tiles_url"] = payload["result_url"] + "tiles/{z}/{x}/{y}.png"
+    return payload
+
+def build_batch_payload(batch, uploaded_file_urls=None):
+    """
+    Response of analyze_batch: each successful result gets its artifact URLs
+    (and the URL of its upload, when given).
+    """
+    results = []
+    for i, resultado in enumerate(batch["results"]):
+        if "result_id" in resultado:
+            resultado = dict(resultado, **build_result_payload(resultado["result_id"]))
+        if uploaded_file_urls and uploaded_file_urls[i]:
+            resultado["uploaded_file_url"] = uploaded_file_urls[i]
+        results.append(resultado)
+    return {"results": results, "timing": batch["timing"]}
@@ -0,0 +1,286 @@
+import os
+import time
+import queue
+import threading
+import numpy as np
+import rasterio
+from api.ml.classifier import ClassifierService
+from api.ml.model_loader import get_predictor
+from api.ml.instrumentation import etapa
+from api.ml.preprocessor import preprocess_valid_pixels, predecir_pixeles, ventanas_lectura, CARACTERISTICAS, CLASE_SIN_DATOS
+
+ETAPAS = ('read', 'classify', 'write')
+
+# Marks the end of the stream between pipeline stages
+_FIN = object()
+
+class EstadisticasEtapa:
+    def __init__(self):
+        self.seconds = 0.0
+        self.scenes = 0
+        self.pixels = 0
+
+    def sumar(self, segundos, pixeles):
+        self.seconds += segundos
+        self.scenes += 1
+        self.pixels += pixeles
+
+class BatchClassifier:
+    """
+    Classifies a list of (input, output) scenes through a three-stage pipeline: a reader thread
+    builds the feature matrices of the next windows while the current one is classified, and a
+    writer thread saves the previous map. Reading and classification are joined by a queue of
+    queue_size windows (ML_TILE_SIZE tiles or the raster's own blocks), so at most queue_size + 2
+    window feature matrices are alive at once whatever the scene size; the classified maps
+    (one byte per pixel) queue up to queue_size scenes for the writer. The model is loaded once.
+
+    Outputs are written to a temporary name and renamed when complete, so an interrupted run
+    never leaves a partial file that a resumed run would take as done.
+    """
+    def __init__(self, queue_size=1, cog=None, on_result=None, tile_size=None):
+        self.queue_size = max(queue_size, 1)
+        self.cog = cog
+        self.tile_size = tile_size
+        # Called as on_result(input, output, error) from the writer / main thread
+        self.on_result = on_result
+        self.stats = {etapa: EstadisticasEtapa() for etapa in ETAPAS}
+        self.failed = []
+        self.done = []
+        self.wall_seconds = 0.0
+
+    def run(self, tareas):
+        model = get_predictor()
+        service = ClassifierService()
+        leidas = queue.Queue(self.queue_size)
+        clasificadas = queue.Queue(self.queue_size)
+        detener = threading.Event()
+
+        lector = threading.Thread(target=self._leer, args=(tareas, leidas, detener), daemon=True)
+        escritor = threading.Thread(target=self._escribir, args=(service, clasificadas, detener), daemon=True)
+
+        inicio_lote = time.perf_counter()
+        lector.start()
+        escritor.start()
+        try:
+            escena = None  # [input, output, map, profile, classification seconds] of the scene being classified
+            while True:
+                item = leidas.get()
+                if item is _FIN:
+                    break
+                tipo = item[0]
+                if tipo == 'inicio':
+                    _, entrada, salida, shape, perfil = item
+                    escena = [entrada, salida, np.full(shape, CLASE_SIN_DATOS, dtype=np.uint8), perfil, 0.0]
+                elif tipo == 'error':
+                    # The reader failed partway, the scene's map is dropped
+                    escena = None
+                elif escena is None:
+                    # Windows of a scene that failed to classify
+                    continue
+                elif tipo == 'ventana':
+                    _, window, X, validos = item
+                    del item
+                    inicio = time.perf_counter()
+                    try:
+                        filas, columnas = window.toslices()
+                        escena[2][filas, columnas] = predecir_pixeles(model, X, validos).reshape(
+                            int(window.height), int(window.width))
+                    except Exception as e:
+                        self._fallo(escena[0], escena[1], e)
+                        escena = None
+                        continue
+                    finally:
+                        del X, validos
+                    escena[4] += time.perf_counter() - inicio
+                else:
+                    entrada, salida, mapa, perfil, segundos = escena
+                    escena = None
+                    self.stats['classify'].sumar(segundos, mapa.size)
+                    _poner(clasificadas, (entrada, salida, mapa, perfil), detener)
+                    del mapa
+        except BaseException:
+            detener.set()
+            raise
+        finally:
+            _poner(clasificadas, _FIN, detener)
+            escritor.join()
+            self.wall_seconds = time.perf_counter() - inicio_lote
+        return self
+
+    def _leer(self, tareas, leidas, detener):
+        """
+        Queues each scene as ('inicio', ...), one ('ventana', window, X, validos) per window and
+        ('fin',), or ('error',) when it fails after its start was queued.
+        """
+        try:
+            for entrada, salida in tareas:
+                if detener.is_set():
+                    return
+                inicio = time.perf_counter()
+                segundos = 0.0
+                comenzada = False
+                try:
+                    with rasterio.open(entrada) as src:
+                        shape = (src.height, src.width)
+                        _poner(leidas, ('inicio', entrada, salida, shape, src.profile), detener)
+                        comenzada = True
+                        for window in ventanas_lectura(src, self.tile_size):
+                            X, validos = preprocess_valid_pixels(src, window)
+                            segundos += time.perf_counter() - inicio
+                            _poner(leidas, ('ventana', window, X, validos), detener)
+                            del X, validos
+                            if detener.is_set():
+                                return
+                            inicio = time.perf_counter()
+                except Exception as e:
+                    if comenzada:
+                        _poner(leidas, ('error',), detener)
+                    self._fallo(entrada, salida, e)
+                    continue
+                self.stats['read'].sumar(segundos, shape[0] * shape[1])
+                _poner(leidas, ('fin',), detener)
+        finally:
+            _poner(leidas, _FIN, detener)
+
+    def _escribir(self, service, clasificadas, detener):
+        while True:
+            item = _tomar(clasificadas, detener)
+            if item is _FIN:
+                return
+            entrada, salida, mapa, perfil = item
+            del item
+
+            inicio = time.perf_counter()
+            temporal = f"{salida}.tmp-{os.getpid()}"
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+                service.save_classification(mapa, perfil, temporal, cog=self.cog)
+                os.replace(temporal, salida)
+            except Exception as e:
+                if os.path.exists(temporal):
+                    os.remove(temporal)
+                self._fallo(entrada, salida, e)
+                continue
+            self.stats['write'].sumar(time.perf_counter() - inicio, mapa.size)
+            self.done.append(entrada)
+            if self.on_result is not None:
+                self.on_result(entrada, salida, None)
+
+    def _fallo(self, entrada, salida, error):
+        self.failed.append((entrada, str(error)))
+        if self.on_result is not None:
+            self.on_result(entrada, salida, error)
+
+def _poner(cola, item, detener):
+    """
+    Blocking put that gives up once the pipeline is being torn down.
+    """
+    while not detener.is_set():
+        try:
+            cola.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            continue
+    if item is _FIN:
+        # The consumer may still be waiting for the end of the stream
+        try:
+            cola.put_nowait(item)
+        except queue.Full:
+            pass
+
+def _tomar(cola, detener):
+    """
+    Blocking get that returns the end marker once the pipeline is torn down and drained.
+    """
+    while True:
+        try:
+            return cola.get(timeout=0.5)
+        except queue.Empty:
+            if detener.is_set():
+                return _FIN
+
+class ConcatenatedClassifier:
+    """
+    Classifies several scenes with shared predict calls: windows of consecutive scenes are
+    packed into one feature buffer of at most max_bytes, and each full buffer is predicted
+    at once, so small scenes don't each pay the per-call overhead of the forest.
+    Only valid pixels are packed; empty ones are left as CLASE_SIN_DATOS in the scene maps.
+    Memory stays bounded by the buffer plus the uint8 maps of the scenes still in it.
+    """
+    def __init__(self, model, max_bytes, tile_size=None):
+        self.model = model
+        self.filas = max(int(max_bytes) // (len(CARACTERISTICAS) * 4), 1)
+        self.tile_size = tile_size
+        self.predict_calls = 0
+        self.pixels = 0
+
+    def classify(self, escenas):
+        """
+        escenas is a list of (key, path). Yields (key, classification_map, perfil, error)
+        as each scene completes; a scene that cannot be read is yielded with its error.
+        """
+        buffer = np.empty((self.filas, len(CARACTERISTICAS)), dtype=np.float32, order='F')
+        pendientes = []  # (key, window, valid mask, first row, rows) of the windows in the buffer
+        ocupadas = 0
+        abiertas = {}  # key -> [map, perfil, windows still in the buffer, fully read]
+
+        def vaciar():
+            nonlocal ocupadas
+            if ocupadas:
+                with etapa('predict'):
+                    y = self.model.predict(buffer[:ocupadas])
+                self.predict_calls += 1
+                self.pixels += ocupadas
+                with etapa('reshape'):
+                    for clave, window, validos, inicio, n in pendientes:
+                        escena = abiertas[clave]
+                        filas, columnas = window.toslices()
+                        destino = escena[0][filas, columnas]
+                        if validos is None:
+                            destino[...] = y[inicio:inicio + n].reshape(destino.shape)
+                        else:
+                            destino[validos.reshape(destino.shape)] = y[inicio:inicio + n]
+                        escena[2] -= 1
+            pendientes.clear()
+            ocupadas = 0
+            return self._completas(abiertas)
+
+        for clave, ruta in escenas:
+            try:
+                with rasterio.open(ruta) as src:
+                    abiertas[clave] = [np.full((src.height, src.width), CLASE_SIN_DATOS, dtype=np.uint8), src.profile, 0, False]
+                    for window in ventanas_lectura(src, self.tile_size):
+                        X_win, validos = preprocess_valid_pixels(src, window)
+                        n = len(X_win)
+                        if n == 0:
+                            continue
+                        if ocupadas + n > self.filas:
+                            yield from vaciar()
+                        if n > self.filas:
+                            # Window larger than the whole buffer: predicted on its own
+                            filas, columnas = window.toslices()
+                            abiertas[clave][0][filas, columnas] = predecir_pixeles(self.model, X_win, validos).reshape(int(window.height), int(window.width))
+                            self.predict_calls += 1
+                            self.pixels += n
+                            continue
+                        buffer[ocupadas:ocupadas + n] = X_win
+                        pendientes.append((clave, window, validos, ocupadas, n))
+                        abiertas[clave][2] += 1
+                        ocupadas += n
+                abiertas[clave][3] = True
+            except Exception as e:
+                # Drop the scene's windows from the buffer; the others keep their place
+                abiertas.pop(clave, None)
+                pendientes[:] = [p for p in pendientes if p[0] != clave]
+                yield clave, None, None, e
+                continue
+            yield from self._completas(abiertas)
+
+        yield from vaciar()
+
+    @staticmethod
+    def _completas(abiertas):
+        listas = [clave for clave, escena in abiertas.items() if escena[3] and escena[2] == 0]
+        for clave in listas:
+            mapa, perfil, _, _ = abiertas.pop(clave)
+            yield clave, mapa, perfil, None
@@ -1,36 +1,118 @@
 import os
 import rasterio
 import numpy as np
-from api.ml.preprocessor import preprocess_image
-from api.ml.model_loader import get_model
+from django.conf import settings
+from api.ml.preprocessor import preprocess_valid_pixels, predecir_pixeles, ventanas_lectura, CLASE_SIN_DATOS
+from api.ml.model_loader import get_versioned_predictor, ModelVersionChanged
+from api.ml.parallel import ParallelTileClassifier
+from api.ml.cog import write_cog
+from api.ml.instrumentation import etapa
+
+def cargar_modelo(model_version=None):
+    """
+    The predictor, checked against model_version when one is given.
+    """
+    model, version = get_versioned_predictor()
+    if model_version is not None and version != model_version:
+        raise ModelVersionChanged(model_version, version)
+    return model
 
 class ClassifierService:
-    def predict(self, image_path):
+    def predict(self, image_path, tiled=None, tile_size=None, workers=None, progress=None, model_version=None):
         """
         Loads the model, preprocesses the image, and returns the classification result.
+        When tiled (or ML_TILED_INFERENCE is set) the image is classified window by window.
+        With more than one worker the windows are classified on a process pool.
+        progress, if given, is called with the fraction of the image classified so far.
+        model_version, if given, is the version the result will be stored under; a different
+        model loaded since is refused instead of being mixed up with it.
         """
+        if workers is None:
+            workers = getattr(settings, 'ML_INFERENCE_WORKERS', 1)
+        if workers > 1:
+            return self.predict_parallel(image_path, tile_size, workers, progress, model_version)
+
+        if tiled is None:
+            tiled = getattr(settings, 'ML_TILED_INFERENCE', False)
+        if tiled:
+            return self.predict_tiled(image_path, tile_size, progress, model_version)
+
         # 1. Load Model
-        model = get_model()
+        model = cargar_modelo(model_version)
 
-        # 2. Preprocess Image
-        X_pred, original_shape, perfil = preprocess_image(image_path)
+        # 2. Preprocess Image (only the pixels with data)
+        with rasterio.open(image_path) as src:
+            perfil = src.profile
+            original_shape = (src.height, src.width)
+            X_pred, validos = preprocess_valid_pixels(src)
 
-        # 3. Predict
-        y_pred = model.predict(X_pred)
+        # 3. Predict, empty pixels get CLASE_SIN_DATOS
+        y_pred = predecir_pixeles(model, X_pred, validos)
 
         # 4. Reshape to original image dimensions
-        classification_map = y_pred.reshape(original_shape)
+        with etapa('reshape'):
+            classification_map = y_pred.reshape(original_shape)
+
+        if progress is not None:
+            progress(1.0)
+        return classification_map, perfil
+
+    def predict_tiled(self, image_path, tile_size=None, progress=None, model_version=None):
+        """
+        Classifies the image one window at a time, writing into a preallocated uint8 map.
+        Peak memory depends on the window size instead of the scene size.
+        """
+        if tile_size is None:
+            tile_size = getattr(settings, 'ML_TILE_SIZE', None)
+
+        model = cargar_modelo(model_version)
+
+        with rasterio.open(image_path) as src:
+            perfil = src.profile
+            classification_map = np.zeros((src.height, src.width), dtype=np.uint8)
+            total = src.height * src.width
+            procesados = 0
+
+            for window in ventanas_lectura(src, tile_size):
+                X_win, validos = preprocess_valid_pixels(src, window)
+                y_win = predecir_pixeles(model, X_win, validos)
+                filas, columnas = window.toslices()
+                with etapa('reshape'):
+                    classification_map[filas, columnas] = y_win.reshape(int(window.height), int(window.width))
+
+                procesados += len(y_win)
+                if progress is not None:
+                    progress(procesados / max(total, 1))
 
         return classification_map, perfil
 
-    def save_classification(self, classification_map, perfil, output_path):
+    def predict_parallel(self, image_path, tile_size=None, workers=None, progress=None, model_version=None):
         """
-        Saves the classification result as a GeoTIFF.
+        Classifies the image windows on a process pool writing into a shared-memory map.
+        """
+        if tile_size is None:
+            tile_size = getattr(settings, 'ML_TILE_SIZE', None)
+        # The workers read and classify their windows, so this is timed as a whole
+        with etapa('predict'):
+            return ParallelTileClassifier(workers).predict(image_path, tile_size, progress, model_version)
+
+    def save_classification(self, classification_map, perfil, output_path, cog=None):
         """
-        # Update profile for the output
-        perfil.update(dtype=rasterio.uint8, count=1)
-        
-        with rasterio.open(output_path, "w", **perfil) as dst:
-            dst.write(classification_map.astype(rasterio.uint8), 1)
-        
-        return output_path
+        Saves the classification result as a GeoTIFF, with CLASE_SIN_DATOS as its nodata value.
+        By default (ML_OUTPUT_COG) it is written as a tiled, compressed COG with overviews;
+        with cog=False the input profile is reused as before.
+        """
+        if cog is None:
+            cog = getattr(settings, 'ML_OUTPUT_COG', True)
+        with etapa('save_classification'):
+            if cog:
+                return write_cog(classification_map, perfil, output_path,
+                                 compress=getattr(settings, 'ML_OUTPUT_COMPRESS', None))
+
+            # Update profile for the output
+            perfil.update(dtype=rasterio.uint8, count=1, nodata=CLASE_SIN_DATOS)
+
+            with rasterio.open(output_path, "w", **perfil) as dst:
+                dst.write(classification_map.astype(rasterio.uint8), 1)
+
+            return output_path
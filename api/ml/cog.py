@@ -0,0 +1,48 @@
+import rasterio
+from rasterio.io import MemoryFile
+from rasterio.shutil import copy as copiar_dataset
+from api.ml.preprocessor import CLASE_SIN_DATOS
+
+# Creation options of the classification COGs: 512 px tiles, lossless compression with
+# horizontal differencing (long runs of the same class compress to almost nothing) and
+# internal overviews built with MODE so reduced levels keep the majority class, never a blend
+# (pixels without data are left out of the vote)
+OPCIONES_COG = {
+    'BLOCKSIZE': 512,
+    'COMPRESS': 'DEFLATE',
+    'PREDICTOR': 2,
+    'OVERVIEW_RESAMPLING': 'MODE',
+}
+
+def perfil_salida(perfil):
+    """
+    Georeferencing of the input profile for a single-band uint8 output, without its block layout
+    or compression. The input nodata value could collide with a class label, so the output
+    declares CLASE_SIN_DATOS, the label of the pixels left unclassified.
+    """
+    return {
+        'driver': 'GTiff',
+        'height': perfil['height'],
+        'width': perfil['width'],
+        'count': 1,
+        'dtype': rasterio.uint8,
+        'crs': perfil.get('crs'),
+        'transform': perfil.get('transform'),
+        'nodata': CLASE_SIN_DATOS,
+    }
+
+def write_cog(classification_map, perfil, output_path, compress=None):
+    """
+    Writes a class map as a Cloud-Optimized GeoTIFF: tiled, compressed and with internal
+    overviews, laid out so viewers can range-read single tiles or a reduced level.
+    The map is staged in an in-memory GeoTIFF and copied through GDAL's COG driver.
+    """
+    opciones = dict(OPCIONES_COG)
+    if compress:
+        opciones['COMPRESS'] = compress.upper()
+
+    with MemoryFile() as memfile:
+        with memfile.open(**perfil_salida(perfil)) as dataset:
+            dataset.write(classification_map.astype(rasterio.uint8, copy=False), 1)
+            copiar_dataset(dataset, output_path, driver='COG', **opciones)
+    return output_path
@@ -0,0 +1,153 @@
+import os
+import time
+import django
+import numpy as np
+import rasterio
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from rasterio.windows import Window
+from api.ml.preprocessor import preprocess_valid_pixels, ventanas_lectura, leer_stack
+from api.ml.model_loader import get_predictor
+from api.ml.seed_mask import calcular_mascara_semilla
+from api.ml.parallel import contexto_pool
+
+# Confusion matrix cells, counted as bincount(label * 2 + prediction)
+CELDAS = ('tn', 'fp', 'fn', 'tp')
+
+# Per-process state of the evaluation workers
+_eval_model = None
+_eval_src = None
+
+def _init_evaluador():
+    """
+    Pool initializer: loads the model just saved by the training run, one thread per worker.
+    """
+    global _eval_model
+    django.setup()
+    _eval_model = get_predictor()
+    if hasattr(_eval_model, 'n_jobs'):
+        _eval_model.n_jobs = 1
+
+def evaluar_ventana(model, src, window):
+    """
+    Classifies one window and compares it with the seed-mask pseudo-labels of the same pixels
+    (1 inside the nir / swir1 / swir2 signature thresholds, as used to build the training set).
+    Empty pixels (nodata, masked or fill) are not counted.
+    Returns the [tn, fp, fn, tp] counts, or None when the image has none of the seed bands.
+    """
+    alto, ancho = int(window.height), int(window.width)
+    stack, presentes = leer_stack(src, ['nir', 'swir1', 'swir2'], window=window)
+    mascara = calcular_mascara_semilla({nombre: stack[i] for i, nombre in enumerate(presentes)}, (alto, ancho))
+    if mascara is None:
+        return None
+
+    X, validos = preprocess_valid_pixels(src, window)
+    etiquetas = mascara.ravel() if validos is None else mascara.ravel()[validos]
+    if len(X) == 0:
+        return np.zeros(4, dtype=np.intp)
+    y_pred = model.predict(X) == 1
+    return np.bincount(etiquetas.astype(np.intp) * 2 + y_pred, minlength=4)
+
+def _evaluar_ventana_worker(image_path, ventana):
+    global _eval_src
+    if _eval_src is None or _eval_src.name != image_path:
+        if _eval_src is not None:
+            _eval_src.close()
+        _eval_src = rasterio.open(image_path)
+
+    inicio = time.perf_counter()
+    conteos = evaluar_ventana(_eval_model, _eval_src, Window(*ventana))
+    return conteos, time.perf_counter() - inicio
+
+def metricas_confusion(conteos):
+    """
+    Recall, precision and F1 of the cienaga class (1), plus accuracy, from [tn, fp, fn, tp].
+    """
+    tn, fp, fn, tp = (int(c) for c in conteos)
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    total = tn + fp + fn + tp
+    return {
+        "recall": round(recall, 4),
+        "precision": round(precision, 4),
+        "f1": round(f1, 4),
+        "accuracy": round((tp + tn) / total, 4) if total else 0.0,
+        "confusion_matrix": [[tn, fp], [fn, tp]],
+    }
+
+def evaluate_scenes(imagenes, model=None, workers=None, tile_size=None, progress=None):
+    """
+    Evaluates the model on the test scenes against seed-mask pseudo-labels.
+    The scenes are streamed window by window, on a process pool when workers > 1 (each worker
+    loads the saved model), and only the 2x2 confusion counts of each window are kept.
+    progress, if given, is called with the fraction of windows evaluated.
+    Returns the overall metrics and per-scene metrics with their classification time.
+    """
+    inicio_total = time.perf_counter()
+    ventanas = []
+    for ruta in imagenes:
+        with rasterio.open(ruta) as src:
+            ventanas += [
+                (os.path.abspath(ruta), (int(w.col_off), int(w.row_off), int(w.width), int(w.height)))
+                for w in ventanas_lectura(src, tile_size)
+            ]
+
+    escenas = {os.path.abspath(ruta): {"conteos": np.zeros(4, dtype=np.int64), "seconds": 0.0, "labels": True}
+               for ruta in imagenes}
+
+    def acumular(ruta, conteos, segundos):
+        escena = escenas[ruta]
+        escena["seconds"] += segundos
+        if conteos is None:
+            escena["labels"] = False
+        else:
+            escena["conteos"] += conteos
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    hechas = 0
+    if workers <= 1:
+        model = model if model is not None else get_predictor()
+        abiertas = {}
+        try:
+            for ruta, ventana in ventanas:
+                if ruta not in abiertas:
+                    abiertas[ruta] = rasterio.open(ruta)
+                inicio = time.perf_counter()
+                conteos = evaluar_ventana(model, abiertas[ruta], Window(*ventana))
+                acumular(ruta, conteos, time.perf_counter() - inicio)
+                hechas += 1
+                if progress is not None:
+                    progress(hechas / len(ventanas))
+        finally:
+            for src in abiertas.values():
+                src.close()
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=contexto_pool(), initializer=_init_evaluador) as executor:
+            futures = {executor.submit(_evaluar_ventana_worker, ruta, ventana): ruta for ruta, ventana in ventanas}
+            for future in as_completed(futures):
+                conteos, segundos = future.result()
+                acumular(futures[future], conteos, segundos)
+                hechas += 1
+                if progress is not None:
+                    progress(hechas / len(ventanas))
+
+    total = np.zeros(4, dtype=np.int64)
+    por_escena = []
+    for ruta, escena in escenas.items():
+        detalle = {"image": os.path.basename(ruta), "seconds": round(escena["seconds"], 3)}
+        if escena["labels"]:
+            total += escena["conteos"]
+            detalle.update(pixels=int(escena["conteos"].sum()), **metricas_confusion(escena["conteos"]))
+        else:
+            detalle["error"] = "Missing nir/swir bands for pseudo-labels"
+        por_escena.append(detalle)
+
+    metrics = metricas_confusion(total)
+    metrics.update(
+        test_images=len(imagenes),
+        pixels=int(total.sum()),
+        seconds=round(time.perf_counter() - inicio_total, 3),
+        scenes=por_escena,
+    )
+    return metrics
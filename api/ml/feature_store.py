@@ -0,0 +1,101 @@
+import os
+import shutil
+import hashlib
+import numpy as np
+import rasterio
+from django.conf import settings
+from api.ml.preprocessor import CARACTERISTICAS, indices_bandas
+from api.ml.result_cache import ResultCache, CacheEntry
+from api.ml.seed_mask import valores_firma
+
+# Bands training reads: the model features plus the seed mask bands
+BANDAS_ENTRENAMIENTO = CARACTERISTICAS + [nombre for nombre in valores_firma if nombre not in CARACTERISTICAS]
+
+def get_feature_store():
+    """
+    On-disk store of the raw training bands, or None unless ML_FEATURE_CACHE_ENABLED is set.
+    It is a ResultCache under its own root and size limit, so entries are written atomically.
+    """
+    if not getattr(settings, 'ML_FEATURE_CACHE_ENABLED', False):
+        return None
+    root = getattr(settings, 'ML_FEATURE_CACHE_DIR', None) or os.path.join(settings.MEDIA_ROOT, 'feature_cache')
+    return ResultCache(root, getattr(settings, 'ML_FEATURE_CACHE_MAX_BYTES', 20 * 1024 ** 3))
+
+def clave_escena(ruta_imagen):
+    """
+    Store key of a scene: its resolved path, size and mtime, so a rewritten file is read again.
+    """
+    stat = os.stat(ruta_imagen)
+    firma = f"{os.path.realpath(ruta_imagen)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha256(firma.encode()).hexdigest()[:32]
+
+def leer_bandas_cacheadas(ruta_imagen, store=None):
+    """
+    The training bands (BANDAS_ENTRENAMIENTO) of a scene, unscaled in the raster's own dtype:
+    callers scale them block by block (escalar_reflectancia), so no scene-sized float32 copy is
+    made. They are served from the feature store when the scene is unchanged, as read-only
+    memory maps of the stored stack, so no raster is decoded and nothing is copied.
+
+    Scenes are only added while the store has room: when it is full, entries of rewritten or
+    deleted scenes are dropped, and if that is not enough the scene is read without storing it.
+    Repeated training passes over more scenes than fit then keep hitting the same stored subset,
+    where least-recently-used eviction would evict each scene just before it is needed again.
+    Returns (bandas, referencia_shape, from_cache).
+    """
+    store = store if store is not None else get_feature_store()
+    if store is None:
+        crudo, presentes = _leer_escena(ruta_imagen)
+        return _por_nombre(crudo, presentes), crudo.shape[1:], False
+
+    clave = clave_escena(ruta_imagen)
+    entry = store.get(clave)
+    if entry is not None and entry.file('bandas.npy') is not None:
+        crudo = np.load(entry.file('bandas.npy'), mmap_mode='r')
+        return _por_nombre(crudo, entry.meta['bands']), tuple(entry.meta['shape']), True
+
+    crudo, presentes = _leer_escena(ruta_imagen)
+    shape = crudo.shape[1:]
+    if _hay_lugar(store, crudo.nbytes):
+        os.makedirs(store.root, exist_ok=True)
+        temporal = os.path.join(store.root, f".{clave}-{os.getpid()}.npy")
+        np.save(temporal, crudo)
+        store.put(clave, {'bandas.npy': temporal}, meta={
+            'source': os.path.realpath(ruta_imagen),
+            'bands': presentes,
+            'shape': list(shape),
+            'dtype': str(crudo.dtype),
+        })
+    return _por_nombre(crudo, presentes), shape, False
+
+def _leer_escena(ruta_imagen):
+    """
+    Reads the training bands the scene has, in its own dtype, with one multi-band read.
+    """
+    with rasterio.open(ruta_imagen) as src:
+        bandas_disponibles = indices_bandas(src.count)
+        presentes = [nombre for nombre in BANDAS_ENTRENAMIENTO if nombre in bandas_disponibles]
+        if not presentes:
+            return np.empty((0, src.height, src.width), dtype=src.dtypes[0]), presentes
+        return src.read(indexes=[bandas_disponibles[nombre] for nombre in presentes]), presentes
+
+def _por_nombre(crudo, presentes):
+    # Bands of one stack, each entry a view into it
+    return {nombre: crudo[i] for i, nombre in enumerate(presentes)}
+
+def _hay_lugar(store, tamano):
+    """
+    Whether an entry of tamano bytes fits in the store, after dropping the entries whose
+    source scene changed or no longer exists. Valid entries are never evicted for a new one.
+    """
+    if store.size() + tamano <= store.max_bytes:
+        return True
+    for entrada in store._entries():
+        path = entrada[2]
+        try:
+            source = CacheEntry(path).meta.get('source')
+            vigente = source is not None and clave_escena(source) == os.path.basename(path)
+        except (FileNotFoundError, ValueError):
+            vigente = False
+        if not vigente:
+            shutil.rmtree(path, ignore_errors=True)
+    return store.size() + tamano <= store.max_bytes
@@ -0,0 +1,208 @@
+import os
+import json
+import time
+import shutil
+import numpy as np
+
+# Arrays stored as raw .npy buffers in a compiled model artifact
+ARRAYS_ARTEFACTO = ('feature', 'threshold', 'children_left', 'value', 'roots', 'classes')
+VERSION_ARTEFACTO = 1
+
+class CompiledForest:
+    """
+    Random Forest flattened into structure-of-arrays form: the nodes of every tree
+    are concatenated into feature, threshold, child and leaf-value arrays.
+
+    Nodes are renumbered breadth-first so the right child always follows the left one
+    (next node = children_left + (x > threshold)). Leaves point to themselves with an
+    infinite threshold, so every tree can be walked level by level with the same step.
+    """
+    def __init__(self, feature, threshold, children_left, value, roots, classes, max_depth):
+        self.feature = feature
+        self.threshold = threshold
+        self.children_left = children_left
+        self.value = value
+        self.roots = roots
+        self.classes = classes
+        self.max_depth = int(max_depth)
+        self.metadata = {}
+
+    @property
+    def n_estimators(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    @classmethod
+    def from_sklearn(cls, rf):
+        """
+        Compiles a fitted RandomForestClassifier (single output).
+        """
+        features, thresholds, lefts, values, roots = [], [], [], [], []
+        offset = 0
+        max_depth = 0
+
+        for estimator in rf.estimators_:
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+
+            # Breadth-first order keeps both children of a node next to each other
+            orden = [0]
+            for nodo in orden:
+                if tree.children_left[nodo] != -1:
+                    orden.extend((tree.children_left[nodo], tree.children_right[nodo]))
+            orden = np.asarray(orden, dtype=np.intp)
+            nuevo_indice = np.empty(n_nodes, dtype=np.intp)
+            nuevo_indice[orden] = np.arange(n_nodes)
+
+            hijos = tree.children_left[orden]
+            es_hoja = hijos == -1
+            left = np.where(es_hoja, np.arange(n_nodes), nuevo_indice[np.where(es_hoja, 0, hijos)])
+
+            # Trees compare float32 inputs against float64 thresholds; rounding the threshold
+            # down to the nearest float32 gives the same split for every float32 value
+            threshold64 = tree.threshold[orden]
+            threshold = threshold64.astype(np.float32)
+            redondeado_arriba = threshold.astype(np.float64) > threshold64
+            threshold[redondeado_arriba] = np.nextafter(threshold[redondeado_arriba], np.float32(-np.inf))
+            threshold[es_hoja] = np.inf
+
+            # Per-tree class probabilities, as averaged by RandomForestClassifier.predict_proba
+            value = tree.value[orden, 0, :].astype(np.float64)
+            totales = value.sum(axis=1, keepdims=True)
+            value = np.divide(value, totales, out=np.zeros_like(value), where=totales > 0)
+
+            features.append(np.where(es_hoja, 0, tree.feature[orden]))
+            thresholds.append(threshold)
+            lefts.append(left + offset)
+            values.append(value)
+            roots.append(offset)
+
+            offset += n_nodes
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(
+            feature=np.concatenate(features).astype(np.intp),
+            threshold=np.concatenate(thresholds),
+            children_left=np.concatenate(lefts).astype(np.intp),
+            value=np.concatenate(values),
+            roots=np.asarray(roots, dtype=np.intp),
+            classes=np.asarray(rf.classes_),
+            max_depth=max_depth,
+        )
+
+    def save(self, ruta_artefacto, metadata=None):
+        """
+        Writes the forest as a directory of .npy files plus metadata.json.
+        The directory is built aside and swapped in, so readers never see a partial artifact
+        and processes still mapping the previous files keep valid pages.
+        """
+        ruta_artefacto = os.path.abspath(ruta_artefacto)
+        temporal = f"{ruta_artefacto}.tmp-{os.getpid()}"
+        anterior = f"{ruta_artefacto}.old-{os.getpid()}"
+        shutil.rmtree(temporal, ignore_errors=True)
+        os.makedirs(temporal)
+
+        for nombre in ARRAYS_ARTEFACTO:
+            np.save(os.path.join(temporal, f"{nombre}.npy"), np.ascontiguousarray(getattr(self, nombre)))
+
+        meta = dict(metadata or {})
+        meta.update(
+            format_version=VERSION_ARTEFACTO,
+            n_estimators=self.n_estimators,
+            n_nodes=self.n_nodes,
+            max_depth=self.max_depth,
+        )
+        with open(os.path.join(temporal, 'metadata.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+
+        if os.path.exists(ruta_artefacto):
+            os.replace(ruta_artefacto, anterior)
+        os.replace(temporal, ruta_artefacto)
+        shutil.rmtree(anterior, ignore_errors=True)
+        return ruta_artefacto
+
+    @classmethod
+    def load(cls, ruta_artefacto, mmap_mode='r', intentos=3):
+        """
+        Loads an artifact written by save. With mmap_mode='r' the node arrays are mapped
+        read-only, so loading is near instant and workers share pages through the OS cache.
+        A load that overlaps a save (files missing, or metadata.json replaced while the arrays
+        were read) is retried, so arrays of two different artifacts are never mixed.
+        """
+        for intento in range(intentos):
+            try:
+                forest = cls._cargar(ruta_artefacto, mmap_mode)
+                if read_metadata(ruta_artefacto) == forest.metadata:
+                    return forest
+            except FileNotFoundError:
+                if intento == intentos - 1:
+                    raise
+            time.sleep(0.05)
+        raise RuntimeError(f"Model artifact at {ruta_artefacto} changed while it was being loaded")
+
+    @classmethod
+    def _cargar(cls, ruta_artefacto, mmap_mode):
+        metadata = read_metadata(ruta_artefacto)
+        if metadata.get('format_version') != VERSION_ARTEFACTO:
+            raise ValueError(f"Unsupported model artifact version in {ruta_artefacto}: {metadata.get('format_version')}")
+
+        arrays = {}
+        for nombre in ARRAYS_ARTEFACTO:
+            # classes may hold objects (string labels), which cannot be memory-mapped
+            modo = None if nombre == 'classes' else mmap_mode
+            array = np.load(os.path.join(ruta_artefacto, f"{nombre}.npy"), mmap_mode=modo, allow_pickle=nombre == 'classes')
+            # Plain ndarray views over the map avoid np.memmap overhead on every gather
+            arrays[nombre] = np.asarray(array)
+
+        forest = cls(max_depth=metadata['max_depth'], **arrays)
+        forest.metadata = metadata
+        return forest
+
+    def _hojas(self, X_bloque):
+        """
+        Walks every tree over a pixel block and returns the leaf index per (tree, pixel).
+        Paths are laid out tree by tree so each step reads one tree's nodes at a time,
+        and paths that reached a leaf are dropped once they are a sizeable fraction.
+        """
+        n_pixeles, n_features = X_bloque.shape
+        X_plano = np.ascontiguousarray(X_bloque).ravel()
+
+        nodos = np.repeat(self.roots, n_pixeles)
+        base = np.tile(np.arange(n_pixeles, dtype=np.intp) * n_features, len(self.roots))
+        posiciones = np.arange(len(nodos), dtype=np.intp)
+        hojas = np.empty_like(nodos)
+
+        while True:
+            siguientes = self.children_left[nodos] + (X_plano[base + self.feature[nodos]] > self.threshold[nodos])
+            terminados = siguientes == nodos
+            n_terminados = np.count_nonzero(terminados)
+            nodos = siguientes
+
+            if n_terminados == len(nodos):
+                hojas[posiciones] = nodos
+                break
+            if n_terminados > 0.3 * len(nodos):
+                hojas[posiciones[terminados]] = nodos[terminados]
+                activos = ~terminados
+                nodos, base, posiciones = nodos[activos], base[activos], posiciones[activos]
+
+        return hojas.reshape(len(self.roots), n_pixeles)
+
+    def predict_proba(self, X, block_size=2048):
+        # Same input conversion as sklearn's trees
+        X = np.asarray(X, dtype=np.float32)
+        proba = np.empty((X.shape[0], self.value.shape[1]), dtype=np.float64)
+        for inicio in range(0, X.shape[0], block_size):
+            hojas = self._hojas(X[inicio:inicio + block_size])
+            proba[inicio:inicio + block_size] = self.value[hojas].sum(axis=0) / len(self.roots)
+        return proba
+
+    def predict(self, X, block_size=2048):
+        return self.classes.take(np.argmax(self.predict_proba(X, block_size), axis=1), axis=0)
+
+def read_metadata(ruta_artefacto):
+    with open(os.path.join(ruta_artefacto, 'metadata.json')) as f:
+        return json.load(f)
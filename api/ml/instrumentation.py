@@ -0,0 +1,309 @@
+import os
+import sys
+import json
+import time
+import logging
+import functools
+import threading
+import tracemalloc
+import contextlib
+from django.conf import settings
+try:
+    import resource
+except ImportError:  # Windows: no peak memory reporting
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Per-thread stack of open stages and of active collectors (one per request or job)
+_local = threading.local()
+
+# Process-wide totals per stage for /api/metrics: [calls, wall s, cpu s, max tracemalloc peak bytes]
+_registro = {}
+_registro_lock = threading.Lock()
+
+try:
+    _TAMANO_PAGINA = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    _TAMANO_PAGINA = 4096
+
+def pico_memoria_mb():
+    """
+    Lifetime high-water mark of this process's resident memory, in MB (None where unavailable).
+    It never goes down, so it says nothing about a single stage; see rss_actual_mb.
+    """
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024, 1)
+
+def rss_actual_mb():
+    """
+    Current resident memory of this process in MB, from /proc/self/statm (None elsewhere).
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            paginas = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return paginas * _TAMANO_PAGINA / (1024 * 1024)
+
+class PicoRSS:
+    """
+    Peak resident memory of this process above its level when the block started, in MB,
+    sampled every intervalo seconds by a background thread (spikes shorter than that are
+    missed, and other threads' allocations count). mb is None where /proc is unavailable.
+    """
+    def __init__(self, intervalo=0.05):
+        self.intervalo = intervalo
+        self.inicio = None
+        self.pico = None
+        self._fin = threading.Event()
+
+    def __enter__(self):
+        self.inicio = self.pico = rss_actual_mb()
+        if self.inicio is not None:
+            self._hilo = threading.Thread(target=self._muestrear, daemon=True)
+            self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.inicio is not None:
+            self._fin.set()
+            self._hilo.join()
+            self._tomar()
+        return False
+
+    def _muestrear(self):
+        while not self._fin.wait(self.intervalo):
+            self._tomar()
+
+    def _tomar(self):
+        actual = rss_actual_mb()
+        if actual is not None and actual > self.pico:
+            self.pico = actual
+
+    @property
+    def mb(self):
+        return None if self.inicio is None else round(self.pico - self.inicio, 1)
+
+def habilitada():
+    return getattr(settings, 'ML_INSTRUMENTATION', False)
+
+class _EtapaNula:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULA = _EtapaNula()
+
+class _Etapa:
+    """
+    One timed stage: wall time, CPU time of the process, change of the process's resident memory
+    from the start to the end of the stage (memory freed inside the stage does not show, and
+    other threads' allocations do) and, with ML_INSTRUMENTATION_TRACEMALLOC, the peak of Python
+    allocations above the stage's start.
+    """
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.pico_hijos = 0
+
+    def __enter__(self):
+        pila = _pila()
+        self.traza = getattr(settings, 'ML_INSTRUMENTATION_TRACEMALLOC', False)
+        if self.traza:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            actual, pico = tracemalloc.get_traced_memory()
+            # Resetting the peak would hide the parent's, so it keeps what was reached so far
+            if pila:
+                pila[-1].pico_hijos = max(pila[-1].pico_hijos, pico)
+            tracemalloc.reset_peak()
+            self.memoria_inicio = actual
+        pila.append(self)
+        self.rss_inicio = rss_actual_mb()
+        self.cpu_inicio = time.process_time()
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.inicio
+        cpu = time.process_time() - self.cpu_inicio
+        pila = _pila()
+        pila.pop()
+        pico_traza = None
+        if self.traza and tracemalloc.is_tracing():
+            pico = max(tracemalloc.get_traced_memory()[1], self.pico_hijos)
+            pico_traza = max(pico - self.memoria_inicio, 0)
+            if pila:
+                pila[-1].pico_hijos = max(pila[-1].pico_hijos, pico)
+        rss_fin = rss_actual_mb()
+        delta_rss = None if rss_fin is None or self.rss_inicio is None else rss_fin - self.rss_inicio
+        _registrar(self.nombre, wall, cpu, delta_rss, pico_traza)
+        return False
+
+def etapa(nombre):
+    """
+    Context manager timing a pipeline stage. With ML_INSTRUMENTATION off it is a shared
+    no-op object, so instrumented code only pays a settings lookup.
+    """
+    if not habilitada():
+        return _NULA
+    return _Etapa(nombre)
+
+def _pila():
+    if not hasattr(_local, 'etapas'):
+        _local.etapas = []
+    return _local.etapas
+
+def _registrar(nombre, wall, cpu, delta_rss, pico_traza):
+    with _registro_lock:
+        totales = _registro.setdefault(nombre, [0, 0.0, 0.0, 0])
+        totales[0] += 1
+        totales[1] += wall
+        totales[2] += cpu
+        if pico_traza is not None:
+            totales[3] = max(totales[3], pico_traza)
+
+    colectores = getattr(_local, 'colectores', None)
+    if colectores:
+        colectores[-1].sumar(nombre, wall, cpu, delta_rss, pico_traza)
+    else:
+        # Stage outside any request or job (e.g. a management command)
+        logger.info(json.dumps({
+            "event": "stage", "stage": nombre, "wall_ms": round(wall * 1000, 3), "cpu_ms": round(cpu * 1000, 3),
+            "rss_delta_mb": _redondear(delta_rss), "tracemalloc_peak_mb": _mb(pico_traza),
+        }))
+
+def _mb(valor):
+    return None if valor is None else round(valor / (1024 * 1024), 1)
+
+def _redondear(valor):
+    return None if valor is None else round(valor, 1)
+
+class Medicion:
+    """
+    Stages recorded while a request or job runs, added up per stage name
+    (a tiled prediction runs the same stages once per window). rss_delta_mb is the net change
+    of resident memory over all the calls of a stage.
+    """
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.etapas = {}
+        self.inicio = time.perf_counter()
+        self.total = None
+
+    def sumar(self, nombre, wall, cpu, delta_rss, pico_traza):
+        datos = self.etapas.setdefault(nombre, {"calls": 0, "wall": 0.0, "cpu": 0.0, "rss_delta": None, "tracemalloc_peak": None})
+        datos["calls"] += 1
+        datos["wall"] += wall
+        datos["cpu"] += cpu
+        if delta_rss is not None:
+            datos["rss_delta"] = (datos["rss_delta"] or 0.0) + delta_rss
+        if pico_traza is not None:
+            datos["tracemalloc_peak"] = max(datos["tracemalloc_peak"] or 0, pico_traza)
+
+    def server_timing(self):
+        """
+        Server-Timing header value: one metric per stage with its wall time in ms, plus the total.
+        """
+        partes = [
+            f'{nombre};dur={datos["wall"] * 1000:.1f}' + (f';desc="{datos["calls"]} calls"' if datos["calls"] > 1 else '')
+            for nombre, datos in self.etapas.items()
+        ]
+        if self.total is not None:
+            partes.append(f'total;dur={self.total * 1000:.1f}')
+        return ', '.join(partes)
+
+    def as_dict(self):
+        return {
+            "event": "stages",
+            "name": self.nombre,
+            "total_ms": None if self.total is None else round(self.total * 1000, 3),
+            "rss_mb": _redondear(rss_actual_mb()),
+            # Lifetime high-water mark of the process, not of this request or job
+            "max_rss_mb": pico_memoria_mb(),
+            "stages": {
+                nombre: {
+                    "calls": datos["calls"],
+                    "wall_ms": round(datos["wall"] * 1000, 3),
+                    "cpu_ms": round(datos["cpu"] * 1000, 3),
+                    "rss_delta_mb": _redondear(datos["rss_delta"]),
+                    "tracemalloc_peak_mb": _mb(datos["tracemalloc_peak"]),
+                }
+                for nombre, datos in self.etapas.items()
+            },
+        }
+
+@contextlib.contextmanager
+def medir(nombre):
+    """
+    Collects the stages run by this thread inside the block and logs them as one structured
+    record at the end. Yields the Medicion, or None when instrumentation is off.
+    """
+    if not habilitada():
+        yield None
+        return
+    medicion = Medicion(nombre)
+    if not hasattr(_local, 'colectores'):
+        _local.colectores = []
+    _local.colectores.append(medicion)
+    try:
+        yield medicion
+    finally:
+        _local.colectores.pop()
+        medicion.total = time.perf_counter() - medicion.inicio
+        logger.info(json.dumps(medicion.as_dict()))
+
+def server_timing(vista):
+    """
+    Decorator for view methods: measures the request (including reading the upload) and adds
+    its stages to the response as a Server-Timing header. A no-op with instrumentation off.
+    """
+    @functools.wraps(vista)
+    def envoltura(self, request, *args, **kwargs):
+        with medir(f"{request.method} {request.path}") as medicion:
+            if medicion is not None:
+                with etapa('upload'):
+                    # Parses the body now, so its reading is measured apart from the analysis
+                    request.FILES
+            response = vista(self, request, *args, **kwargs)
+        if medicion is not None:
+            response['Server-Timing'] = medicion.server_timing()
+        return response
+    return envoltura
+
+def prometheus_metrics():
+    """
+    Stage totals of this process in the Prometheus text exposition format.
+    """
+    with _registro_lock:
+        totales = {nombre: list(valores) for nombre, valores in _registro.items()}
+
+    lineas = []
+    series = [
+        ('imageanalyzer_stage_calls_total', 'counter', 'Times each pipeline stage ran', 0),
+        ('imageanalyzer_stage_seconds_total', 'counter', 'Wall time spent in each pipeline stage', 1),
+        ('imageanalyzer_stage_cpu_seconds_total', 'counter', 'Process CPU time spent in each pipeline stage', 2),
+        ('imageanalyzer_stage_tracemalloc_peak_bytes', 'gauge', 'Largest traced Python allocation peak of each stage', 3),
+    ]
+    for metrica, tipo, ayuda, i in series:
+        lineas.append(f'# HELP {metrica} {ayuda}')
+        lineas.append(f'# TYPE {metrica} {tipo}')
+        for nombre in sorted(totales):
+            lineas.append(f'{metrica}{{stage="{nombre}"}} {totales[nombre][i]}')
+
+    rss = rss_actual_mb()
+    if rss is not None:
+        lineas.append('# HELP imageanalyzer_rss_bytes Current resident memory of this process')
+        lineas.append('# TYPE imageanalyzer_rss_bytes gauge')
+        lineas.append(f'imageanalyzer_rss_bytes {int(rss * 1024 * 1024)}')
+    pico = pico_memoria_mb()
+    if pico is not None:
+        lineas.append('# HELP imageanalyzer_peak_rss_bytes Highest resident memory of this process since it started')
+        lineas.append('# TYPE imageanalyzer_peak_rss_bytes gauge')
+        lineas.append(f'imageanalyzer_peak_rss_bytes {int(pico * 1024 * 1024)}')
+    return '\n'.join(lineas) + '\n'
@@ -1,10 +1,86 @@
+import hashlib
 import joblib
 import os
+import threading
 from django.conf import settings
+from api.ml.forest import CompiledForest, read_metadata
+
+class ModelVersionChanged(RuntimeError):
+    """
+    The model was replaced while a prediction that expected a given version was running.
+    """
+    def __init__(self, esperada, cargada):
+        super().__init__(f"Model changed during the prediction (expected {esperada}, loaded {cargada}), retry it")
+        self.esperada = esperada
+        self.cargada = cargada
+
+def get_model_path():
+    # TODO: Update this path when the user provides the model file
+    return os.path.join(settings.BASE_DIR, 'modelo_rf_cienagas.pkl')
+
+def get_artifact_path():
+    """
+    Directory of the precompiled, memory-mappable version of the model.
+    """
+    return getattr(settings, 'ML_MODEL_ARTIFACT_PATH', None) or os.path.join(settings.BASE_DIR, 'modelo_rf_cienagas_compilado')
+
+def get_model_version():
+    """
+    Identifier of the current model file, it changes whenever the model is retrained.
+    Returns None when there is no model.
+    """
+    try:
+        stat = os.stat(get_model_path())
+    except FileNotFoundError:
+        return None
+    return version_archivo(stat)
+
+def version_archivo(stat):
+    return f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+def version_archivo_fuente(source):
+    """
+    Model version of the pickle a compiled artifact was built from (its metadata 'source').
+    """
+    return f"{source['size']:x}-{source['mtime_ns']:x}"
+
+def huella_archivo(ruta):
+    """
+    Size, mtime and sha256 of a file, used to tie a compiled artifact to its source pickle.
+    """
+    sha256 = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(bloque)
+        stat = os.fstat(f.fileno())
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256.hexdigest()}
+
+def convert_model(model=None, model_path=None, artifact_path=None):
+    """
+    Compiles a trained forest (or the pickle at model_path) and writes it as a memory-mappable artifact.
+    """
+    model_path = model_path or get_model_path()
+    artifact_path = artifact_path or get_artifact_path()
+    if model is None:
+        model = joblib.load(model_path)
+
+    metadata = {}
+    if os.path.exists(model_path):
+        metadata['source'] = dict(huella_archivo(model_path), path=os.path.abspath(model_path))
+
+    return CompiledForest.from_sklearn(model).save(artifact_path, metadata)
 
 class ModelLoader:
+    """
+    Keeps the loaded models of this process. Each one remembers the model version it was
+    loaded from and is reloaded once the pickle changes, e.g. after a retrain in another process.
+    """
     _instance = None
     _model = None
+    _version = None
+    _compiled = None
+    _compiled_version = None
+    _lock = threading.Lock()
 
     @classmethod
     def get_instance(cls):
@@ -13,16 +89,103 @@ class ModelLoader:
         return cls._instance
 
     def load_model(self):
-        if self._model is None:
-            # TODO: Update this path when the user provides the model file
-            model_path = os.path.join(settings.BASE_DIR, 'modelo_rf_cienagas.pkl')
-            if not os.path.exists(model_path):
-                raise FileNotFoundError(f"Model file not found at {model_path}. Please upload the model file.")
-            
-            print(f"Loading model from {model_path}...")
-            self._model = joblib.load(model_path)
-            print("Model loaded successfully.")
-        return self._model
+        return self.load_versioned_model()[0]
+
+    def load_versioned_model(self):
+        """
+        Returns (model, version), with the version of the pickle the model was loaded from.
+        """
+        with self._lock:
+            version = get_model_version()
+            if self._model is None or (version is not None and version != self._version):
+                model_path = get_model_path()
+                if not os.path.exists(model_path):
+                    raise FileNotFoundError(f"Model file not found at {model_path}. Please upload the model file.")
+
+                print(f"Loading model from {model_path}...")
+                # The version is taken from the open file, so a pickle renamed over it meanwhile
+                # is not loaded under the previous version
+                with open(model_path, 'rb') as f:
+                    self._model = joblib.load(f)
+                    self._version = version_archivo(os.fstat(f.fileno()))
+                print("Model loaded successfully.")
+            return self._model, self._version
+
+    def load_compiled_model(self):
+        return self.load_versioned_compiled_model()[0]
+
+    def load_versioned_compiled_model(self):
+        with self._lock:
+            version = get_model_version()
+            if self._compiled is not None and (version is None or version == self._compiled_version):
+                return self._compiled, self._compiled_version
+
+            artifact_path = get_artifact_path()
+            if self._artifact_is_current(artifact_path):
+                print(f"Mapping compiled model from {artifact_path}...")
+                self._compiled = CompiledForest.load(artifact_path, mmap_mode='r')
+                # Version of the pickle the artifact was built from, as checked by _artifact_is_current
+                source = self._compiled.metadata.get('source')
+                self._compiled_version = version_archivo_fuente(source) if source else version
+                print(f"Model compiled: {self._compiled.n_estimators} trees, {self._compiled.n_nodes} nodes.")
+                return self._compiled, self._compiled_version
+
+        # Compiling from the pickle goes through load_versioned_model, which takes the lock
+        print("Compiling model into flat arrays...")
+        model, version = self.load_versioned_model()
+        compiled = CompiledForest.from_sklearn(model)
+        print(f"Model compiled: {compiled.n_estimators} trees, {compiled.n_nodes} nodes.")
+        with self._lock:
+            self._compiled, self._compiled_version = compiled, version
+        return compiled, version
+
+    def _artifact_is_current(self, artifact_path):
+        """
+        The artifact is used when it exists and was built from the current pickle (or the pickle is gone).
+        Only size and mtime are compared so the check stays cheap at startup.
+        """
+        if not os.path.exists(os.path.join(artifact_path, 'metadata.json')):
+            return False
+        model_path = get_model_path()
+        if not os.path.exists(model_path):
+            return True
+
+        source = read_metadata(artifact_path).get('source', {})
+        stat = os.stat(model_path)
+        if source.get('size') == stat.st_size and source.get('mtime_ns') == stat.st_mtime_ns:
+            return True
+        print(f"Compiled model at {artifact_path} is stale, run convert_model to rebuild it.")
+        return False
+
+    def reset(self):
+        """
+        Drops the cached models so the next request loads the newly trained one.
+        """
+        with self._lock:
+            self._model = None
+            self._version = None
+            self._compiled = None
+            self._compiled_version = None
 
 def get_model():
     return ModelLoader.get_instance().load_model()
+
+def get_compiled_model():
+    return ModelLoader.get_instance().load_compiled_model()
+
+def get_predictor():
+    """
+    Returns the object used for inference: the compiled forest when ML_COMPILED_FOREST is set,
+    otherwise the scikit-learn model. The compiled forest starts instantly and shares its pages
+    across processes but predicts slower (see ML_COMPILED_FOREST in settings), so it is opt-in.
+    """
+    return get_versioned_predictor()[0]
+
+def get_versioned_predictor():
+    """
+    Returns (predictor, version). Results must be stored under this version, the one the
+    predictor was actually loaded from, rather than a fresh get_model_version().
+    """
+    if getattr(settings, 'ML_COMPILED_FOREST', False):
+        return ModelLoader.get_instance().load_versioned_compiled_model()
+    return ModelLoader.get_instance().load_versioned_model()
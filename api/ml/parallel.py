@@ -0,0 +1,133 @@
+import os
+import atexit
+import multiprocessing
+import django
+import numpy as np
+import rasterio
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.conf import settings
+from multiprocessing.shared_memory import SharedMemory
+from rasterio.windows import Window
+from api.ml.preprocessor import preprocess_valid_pixels, predecir_pixeles, ventanas_lectura
+from api.ml.model_loader import get_versioned_predictor, ModelVersionChanged
+
+# Per-process state of the pool workers: the model is loaded once per worker. Datasets and
+# the shared output are opened per task, so nothing of a finished job stays alive in them.
+_worker_model = None
+_worker_version = None
+
+_executors = {}
+
+def contexto_pool():
+    """
+    Start method of the process pools (ML_POOL_START_METHOD, spawn by default). Pools are
+    created from job queue threads, and forking a threaded process can copy a lock held by
+    another thread into the child, deadlocking it.
+    """
+    return multiprocessing.get_context(getattr(settings, 'ML_POOL_START_METHOD', None) or 'spawn')
+
+def _init_worker():
+    """
+    Pool initializer: sets Django up (needed with the spawn start method) and loads the model once.
+    """
+    django.setup()
+    _modelo_worker()
+
+def _modelo_worker(model_version=None):
+    """
+    The worker's model, reloaded when the parent expects another version (a retrain since the
+    pool started). Raises ModelVersionChanged if the expected version is not the one on disk.
+    """
+    global _worker_model, _worker_version
+    if _worker_model is None or (model_version is not None and model_version != _worker_version):
+        _worker_model, _worker_version = get_versioned_predictor()
+        # Parallelism comes from the pool, one thread per worker avoids oversubscription
+        if hasattr(_worker_model, 'n_jobs'):
+            _worker_model.n_jobs = 1
+    if model_version is not None and model_version != _worker_version:
+        raise ModelVersionChanged(model_version, _worker_version)
+    return _worker_model
+
+def _clasificar_ventana(image_path, shm_name, shape, ventana, model_version=None):
+    """
+    Worker task: reads one window from the GeoTIFF, classifies it and writes the labels
+    into the shared output map. Only the window offsets travel through the pool.
+    """
+    col_off, row_off, ancho, alto = ventana
+    model = _modelo_worker(model_version)
+    with rasterio.open(image_path) as src:
+        X_win, validos = preprocess_valid_pixels(src, Window(col_off, row_off, ancho, alto))
+    y_win = predecir_pixeles(model, X_win, validos)
+
+    # Pool workers share the parent's resource tracker, which unlinks the segment once
+    shm = SharedMemory(name=shm_name)
+    mapa = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+    try:
+        mapa[row_off:row_off + alto, col_off:col_off + ancho] = y_win.reshape(alto, ancho)
+    finally:
+        # The buffer cannot be released while a view of it is alive
+        mapa = None
+        shm.close()
+    return alto * ancho
+
+def get_executor(workers):
+    """
+    Returns the process pool for the given worker count, creating it on first use.
+    Pools are kept alive so each worker loads the model only once.
+    """
+    if workers not in _executors:
+        _executors[workers] = ProcessPoolExecutor(max_workers=workers, mp_context=contexto_pool(),
+                                                  initializer=_init_worker)
+    return _executors[workers]
+
+@atexit.register
+def shutdown_executors():
+    for executor in _executors.values():
+        executor.shutdown(wait=False, cancel_futures=True)
+    _executors.clear()
+
+class ParallelTileClassifier:
+    """
+    Classifies the windows of a GeoTIFF on a process pool. Workers read their own
+    window and write labels into a shared-memory uint8 map, so no pixel data is pickled.
+    """
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+
+    def predict(self, image_path, tile_size=None, progress=None, model_version=None):
+        image_path = os.path.abspath(image_path)
+        with rasterio.open(image_path) as src:
+            perfil = src.profile
+            shape = (src.height, src.width)
+            ventanas = [
+                (int(w.col_off), int(w.row_off), int(w.width), int(w.height))
+                for w in ventanas_lectura(src, tile_size)
+            ]
+
+        executor = get_executor(self.workers)
+        shm = SharedMemory(create=True, size=max(shape[0] * shape[1], 1))
+        mapa = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+        try:
+            futures = [
+                executor.submit(_clasificar_ventana, image_path, shm.name, shape, ventana, model_version)
+                for ventana in ventanas
+            ]
+            total = max(shape[0] * shape[1], 1)
+            procesados = 0
+            try:
+                for future in as_completed(futures):
+                    procesados += future.result()
+                    if progress is not None:
+                        progress(procesados / total)
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+            classification_map = mapa.copy()
+        finally:
+            # Drop the view before closing, the buffer cannot be released while exported
+            mapa = None
+            shm.close()
+            shm.unlink()
+
+        return classification_map, perfil
@@ -1,7 +1,21 @@
 import numpy as np
 import rasterio
-from rasterio.enums import Resampling
+from django.conf import settings
+from rasterio.enums import MaskFlags, Resampling
 from rasterio.warp import reproject
+from rasterio.windows import Window
+from api.ml.instrumentation import etapa
+
+CARACTERISTICAS = ['blue', 'green', 'red', 'nir', 'swir1']
+
+# Label written for pixels without data; never one of the model's classes
+CLASE_SIN_DATOS = 255
+
+# Raw band values are divided by this (in float32) to get reflectance, as leer_stack does
+ESCALA_REFLECTANCIA = 10000.0
+
+# Target number of pixels per window when the raster is striped and no tile size is given
+PIXELES_POR_VENTANA = 1024 * 1024
 
 def resample_banda(banda_origen, perfil, referencia_shape):
     """
@@ -19,52 +33,211 @@ def resample_banda(banda_origen, perfil, referencia_shape):
     )
     return banda_resample
 
-def leer_bandas(ruta_imagen):
+def indices_bandas(num_bandas):
+    """
+    Maps band names to their 1-based index in the image, based on the band count.
+    """
+    # Mapping based on the provided script
+    bandas_disponibles = {}
+    if num_bandas >= 1: bandas_disponibles['blue'] = 1
+    if num_bandas >= 2: bandas_disponibles['green'] = 2
+    if num_bandas >= 3: bandas_disponibles['red'] = 3
+    if num_bandas >= 7: bandas_disponibles['nir'] = 7
+    if num_bandas >= 9: bandas_disponibles['swir1'] = 9
+    if num_bandas >= 10: bandas_disponibles['swir2'] = 10
+    return bandas_disponibles
+
+def leer_stack(src, nombres, window=None, out=None):
+    """
+    Reads the requested bands of an open dataset with a single multi-band read into a
+    float32 (bands, rows, cols) array and normalizes it in place (divide by 10000.0).
+    Bands the image does not have are skipped; returns the array and the names it holds, in order.
+    """
+    bandas_disponibles = indices_bandas(src.count)
+    presentes = [nombre for nombre in nombres if nombre in bandas_disponibles]
+
+    if window is None:
+        alto, ancho = src.height, src.width
+    else:
+        alto, ancho = int(window.height), int(window.width)
+    if out is None:
+        out = np.empty((len(presentes), alto, ancho), dtype=np.float32)
+
+    if presentes:
+        src.read(indexes=[bandas_disponibles[nombre] for nombre in presentes], out=out, window=window)
+        out /= 10000.0
+    return out, presentes
+
+def escalar_reflectancia(crudo):
+    """
+    float32 reflectance of a block of raw band values, normalized exactly like leer_stack.
+    """
+    valores = np.array(crudo, dtype=np.float32)
+    valores /= ESCALA_REFLECTANCIA
+    return valores
+
+def leer_bandas(ruta_imagen, caracteristicas=None):
     """
     Reads bands from a multispectral image and returns them as a dictionary.
     Normalizes values by dividing by 10000.0.
+    Only the bands named in caracteristicas are read (all known bands when None).
     """
-    with rasterio.open(ruta_imagen) as src:
+    with etapa('leer_bandas'), rasterio.open(ruta_imagen) as src:
         perfil = src.profile
-        num_bandas = src.count
-        referencia_shape = src.read(1).shape
-
-        # Mapping based on the provided script
-        bandas_disponibles = {}
-        if num_bandas >= 1: bandas_disponibles['blue'] = 1
-        if num_bandas >= 2: bandas_disponibles['green'] = 2
-        if num_bandas >= 3: bandas_disponibles['red'] = 3
-        if num_bandas >= 7: bandas_disponibles['nir'] = 7
-        if num_bandas >= 9: bandas_disponibles['swir1'] = 9
-        if num_bandas >= 10: bandas_disponibles['swir2'] = 10
-
-        bandas = {}
-        for nombre, idx in bandas_disponibles.items():
-            banda = src.read(idx).astype(np.float32) / 10000.0
-            if banda.shape != referencia_shape:
-                banda = resample_banda(banda, perfil, referencia_shape)
-            bandas[nombre] = banda
+        referencia_shape = (src.height, src.width)
 
+        if caracteristicas is None:
+            caracteristicas = list(indices_bandas(src.count))
+        stack, presentes = leer_stack(src, caracteristicas)
+
+    # Bands of a single dataset share its shape, so each entry is a view into the stack
+    bandas = {nombre: stack[i] for i, nombre in enumerate(presentes)}
     return bandas, perfil, referencia_shape
 
+def caracteristicas_presentes(num_bandas):
+    """
+    Number of CARACTERISTICAS an image with num_bandas has. Band indices grow with the band
+    count, so the bands present are always the leading features and the rest are zero-filled.
+    """
+    bandas_disponibles = indices_bandas(num_bandas)
+    return sum(1 for nombre in CARACTERISTICAS if nombre in bandas_disponibles)
+
+def matriz_caracteristicas(src, window=None):
+    """
+    Builds the (pixels, features) float32 matrix of an open dataset (or one of its windows)
+    in a single preallocated buffer. The buffer is column-major, so its transpose is a
+    contiguous (features, rows, cols) view that rasterio reads into directly; missing
+    bands are zero-filled in place. No per-band arrays or stacked copies are made.
+    """
+    if window is None:
+        alto, ancho = src.height, src.width
+    else:
+        alto, ancho = int(window.height), int(window.width)
+
+    X = np.empty((alto * ancho, len(CARACTERISTICAS)), dtype=np.float32, order='F')
+    planos = X.T.reshape(len(CARACTERISTICAS), alto, ancho)
+
+    n_presentes = caracteristicas_presentes(src.count)
+    leer_stack(src, CARACTERISTICAS[:n_presentes], window=window, out=planos[:n_presentes])
+    # If a band is missing, fill with zeros (as per original script logic)
+    planos[n_presentes:] = 0
+    return X
+
 def preprocess_image(ruta_imagen):
     """
     Prepares the image data for prediction.
     Returns the flattened feature matrix (X_pred) and the original shape for reconstruction.
     """
-    bandas, perfil, referencia_shape = leer_bandas(ruta_imagen)
-    caracteristicas = ['blue', 'green', 'red', 'nir', 'swir1']
-
-    bandas_nuevas = []
-    for nombre in caracteristicas:
-        if nombre in bandas:
-            bandas_nuevas.append(bandas[nombre])
-        else:
-            # If a band is missing, fill with zeros (as per original script logic)
-            bandas_nuevas.append(np.zeros(referencia_shape, dtype=np.float32))
-
-    bandas_apil = np.dstack(bandas_nuevas)
-    # Flatten for prediction: (pixels, features)
-    X_pred = bandas_apil.reshape(-1, bandas_apil.shape[2])
-    
-    return X_pred, bandas_apil.shape[:2], perfil
+    with etapa('preprocess'), rasterio.open(ruta_imagen) as src:
+        perfil = src.profile
+        X_pred = matriz_caracteristicas(src)
+        return X_pred, (src.height, src.width), perfil
+
+def mascara_validos(src, X, window=None):
+    """
+    Valid pixels of a feature matrix built by matriz_caracteristicas, as a boolean (pixels,)
+    array, or None when all of them are valid. A pixel is empty when the dataset's internal
+    mask or alpha band excludes it, when all the bands read for it hold the nodata value or
+    zero (the fill of scenes that declare no nodata), or when any of them is NaN. Features of
+    bands the image lacks are zero-filled, so they are left out of the comparison.
+    """
+    n_presentes = caracteristicas_presentes(src.count)
+    vacios = np.zeros(X.shape[0], dtype=bool)
+    # Fill values after the /10000 normalization, computed like leer_stack so they compare exactly
+    rellenos = {np.float32(0)}
+    if src.nodata is not None and not np.isnan(src.nodata):
+        rellenos.add(np.float32(src.nodata) / np.float32(10000.0))
+    if n_presentes:
+        for relleno in rellenos:
+            iguales = X[:, 0] == relleno
+            for j in range(1, n_presentes):
+                iguales &= X[:, j] == relleno
+            vacios |= iguales
+
+    if np.issubdtype(np.dtype(src.dtypes[0]), np.floating):
+        for j in range(n_presentes):
+            vacios |= np.isnan(X[:, j])
+
+    flags = src.mask_flag_enums[0] if src.count else []
+    if MaskFlags.per_dataset in flags or MaskFlags.alpha in flags:
+        vacios |= (src.dataset_mask(window=window) == 0).ravel()
+
+    if not vacios.any():
+        return None
+    return ~vacios
+
+def comprimir_validos(X, validos):
+    """
+    Packs the rows of the valid pixels at the top of X, column by column in place,
+    and returns the (valid pixels, features) view. Only one column is copied at a time.
+    """
+    if validos is None:
+        return X
+    n = int(np.count_nonzero(validos))
+    for j in range(X.shape[1]):
+        X[:n, j] = X[validos, j]
+    return X[:n]
+
+def predecir_pixeles(model, X, validos):
+    """
+    Predicts the compressed valid rows of X and scatters the labels back to every pixel as
+    uint8, with CLASE_SIN_DATOS for the empty ones. Scenes without empty pixels skip the scatter.
+    """
+    if validos is None:
+        with etapa('predict'):
+            return model.predict(X).astype(np.uint8, copy=False)
+    y_validos = None
+    if len(X):
+        with etapa('predict'):
+            y_validos = model.predict(X)
+    with etapa('reshape'):
+        y = np.full(len(validos), CLASE_SIN_DATOS, dtype=np.uint8)
+        if y_validos is not None:
+            y[validos] = y_validos
+    return y
+
+def preprocess_valid_pixels(src, window=None):
+    """
+    Feature matrix of the valid pixels of an open dataset (or one of its windows) and their
+    mask, as (X, validos). validos is None, and X has every pixel, when nothing is empty or
+    ML_NODATA_MASKING is off.
+    """
+    with etapa('preprocess'):
+        X = matriz_caracteristicas(src, window)
+        if not getattr(settings, 'ML_NODATA_MASKING', True):
+            return X, None
+        validos = mascara_validos(src, X, window)
+        return comprimir_validos(X, validos), validos
+
+def ventanas_lectura(src, tile_size=None):
+    """
+    Yields the windows used for tiled inference over an open dataset.
+    With tile_size, the raster is split in a tile_size x tile_size grid.
+    Otherwise the raster's own block windows are used; striped rasters get
+    their strips grouped so each window holds about PIXELES_POR_VENTANA pixels.
+    """
+    if tile_size:
+        for fila in range(0, src.height, tile_size):
+            for col in range(0, src.width, tile_size):
+                yield Window(col, fila,
+                             min(tile_size, src.width - col),
+                             min(tile_size, src.height - fila))
+        return
+
+    alto_bloque, ancho_bloque = src.block_shapes[0]
+    if ancho_bloque < src.width:
+        for _, window in src.block_windows(1):
+            yield window
+        return
+
+    filas = max(alto_bloque, PIXELES_POR_VENTANA // max(src.width, 1))
+    filas -= filas % alto_bloque
+    for fila in range(0, src.height, filas):
+        yield Window(0, fila, src.width, min(filas, src.height - fila))
+
+def preprocess_window(src, window):
+    """
+    Prepares the feature matrix (pixels, features) for a single window of an open dataset.
+    Matches preprocess_image value for value on the pixels covered by the window.
+    """
+    return matriz_caracteristicas(src, window)
@@ -0,0 +1,149 @@
+import io
+import numpy as np
+import rasterio
+from PIL import Image
+from django.conf import settings
+from api.ml.instrumentation import etapa
+
+# Class colors, taken from matplotlib's coolwarm at the ends of the 0-1 range as the
+# map used to be shown; any other label (e.g. nodata) is drawn in neutral gray
+COLORES_CLASES = {
+    0: (58, 76, 192),
+    1: (179, 3, 38),
+}
+COLOR_OTRAS = (221, 220, 219)
+
+def _paleta():
+    paleta = np.empty((256, 3), dtype=np.uint8)
+    paleta[:] = COLOR_OTRAS
+    for clase, color in COLORES_CLASES.items():
+        paleta[clase] = color
+    return paleta.ravel().tolist()
+
+# Label -> RGB lookup table, precomputed once and attached to every PNG as its palette
+PALETA_CLASES = _paleta()
+
+def reducir_mapa(classification_map, max_size):
+    """
+    Nearest-neighbour downsampling by striding, so labels are never blended.
+    """
+    if not max_size or max(classification_map.shape) <= max_size:
+        return classification_map
+    paso = -(-max(classification_map.shape) // max_size)
+    return classification_map[::paso, ::paso]
+
+def render_classification(classification_map, max_size=None, transparent_index=None):
+    """
+    Encodes the classification map as an 8-bit palette PNG: labels are written as
+    palette indices and colored through PALETA_CLASES, with no resampling or figure.
+    With max_size, the map is first downsampled so its longest side fits.
+    transparent_index, if given, is a label drawn fully transparent.
+    """
+    with etapa('render'):
+        mapa = reducir_mapa(classification_map, max_size)
+        if mapa.dtype != np.uint8:
+            mapa = mapa.astype(np.uint8)
+
+        mapa = np.ascontiguousarray(mapa)
+        alto, ancho = mapa.shape
+        imagen = Image.frombuffer('P', (ancho, alto), mapa, 'raw', 'P', 0, 1)
+        imagen.putpalette(PALETA_CLASES)
+
+        buf = io.BytesIO()
+        if transparent_index is None:
+            imagen.save(buf, format='PNG', compress_level=3)
+        else:
+            imagen.save(buf, format='PNG', compress_level=3, transparency=transparent_index)
+        result_png = buf.getvalue()
+        buf.close()
+    return result_png
+
+# Percentiles of the linear stretch, as in codigo_clasificacionRF.py
+PERCENTILES_PREVIEW = (0.5, 99.5)
+
+def forma_preview(alto, ancho, max_size):
+    """
+    Output shape that fits the longest side in max_size, keeping the aspect ratio.
+    """
+    if not max_size or max(alto, ancho) <= max_size:
+        return alto, ancho
+    escala = max_size / max(alto, ancho)
+    return max(1, int(round(alto * escala))), max(1, int(round(ancho * escala)))
+
+def limites_percentiles(banda, validos, percentiles=PERCENTILES_PREVIEW):
+    """
+    (low, high) percentiles of the valid pixels of one channel, or None when it is empty or flat.
+    """
+    valores = banda[validos]
+    if valores.size == 0:
+        return None
+    p_low, p_high = np.percentile(valores, percentiles)
+    if p_high <= p_low:
+        return None
+    return float(p_low), float(p_high)
+
+def estirar(banda, validos, limites):
+    """
+    Linear stretch of one channel between limites = (low, high), to uint8; invalid pixels are 0.
+    """
+    salida = np.zeros(banda.shape, dtype=np.uint8)
+    if limites is None:
+        return salida
+    p_low, p_high = limites
+    estirada = np.clip((banda - p_low) / (p_high - p_low), 0, 1) * 255
+    salida[validos] = estirada[validos].astype(np.uint8)
+    return salida
+
+def leer_rgb(src, alto, ancho, **kwargs):
+    """
+    Reads bands 1-3 (or band 1) of src resampled to (alto, ancho).
+    Returns float32 data and the valid-pixel mask, both shaped (bands, alto, ancho).
+    """
+    bandas_rgb = [1, 2, 3] if src.count >= 3 else [1]
+    datos = src.read(bandas_rgb, out_shape=(len(bandas_rgb), alto, ancho), masked=True, **kwargs)
+
+    # Nodata, masked and non-finite pixels are left out of the stretch and drawn black
+    validos = ~np.ma.getmaskarray(datos)
+    datos = np.ma.getdata(datos).astype(np.float32, copy=False)
+    validos &= np.isfinite(datos)
+    return datos, validos
+
+def componer_rgb(datos, validos, limites):
+    """
+    Stretches each channel with its limites into an (alto, ancho, 3) uint8 image;
+    a single band is repeated as gray.
+    """
+    rgb = np.empty(datos.shape[1:] + (3,), dtype=np.uint8)
+    for i in range(len(datos)):
+        rgb[:, :, i] = estirar(datos[i], validos[i], limites[i])
+    if len(datos) == 1:
+        rgb[:, :, 1:] = rgb[:, :, :1]
+    return rgb
+
+def render_original_preview(file_path, max_size=None):
+    """
+    Converts the uploaded TIF to an RGB PNG for display (bands 1-3, or band 1 as gray).
+    The bands are read already decimated to the output size, so GDAL serves them from the
+    overviews when the file has them, and the 0.5-99.5 percentile stretch runs on the small array.
+    Returns the PNG bytes, or None if the conversion fails.
+    """
+    if max_size is None:
+        max_size = getattr(settings, 'ML_RESULT_PREVIEW_MAX_SIZE', None) or 2048
+
+    original_png = None
+    try:
+        with etapa('preview'):
+            with rasterio.open(file_path) as src:
+                datos, validos = leer_rgb(src, *forma_preview(src.height, src.width, max_size))
+            rgb = componer_rgb(datos, validos, [limites_percentiles(d, v) for d, v in zip(datos, validos)])
+
+            img_buf = io.BytesIO()
+            Image.fromarray(rgb, mode='RGB').save(img_buf, format='PNG', compress_level=3)
+            original_png = img_buf.getvalue()
+            img_buf.close()
+    except Exception as e:
+        # If conversion fails, continue without original image
+        print(f"Warning: Could not convert TIF to PNG: {str(e)}")
+        original_png = None
+
+    return original_png
@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+from django.conf import settings
+
+def hash_file(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(bloque)
+    return sha256.hexdigest()
+
+def hash_upload(uploaded_file):
+    """
+    Hashes a Django UploadedFile chunk by chunk, leaving it ready to be saved.
+    """
+    sha256 = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        sha256.update(chunk)
+    uploaded_file.seek(0)
+    return sha256.hexdigest()
+
+def save_upload(fs, uploaded_file):
+    """
+    Saves an upload under its content hash, so uploading the same scene again reuses the
+    stored file instead of writing a renamed copy. Returns (filename, content_hash).
+    Uploads streamed by ContentAddressedUploadHandler are already stored and hashed.
+    """
+    if getattr(uploaded_file, 'content_hash', None):
+        return uploaded_file.storage_name, uploaded_file.content_hash
+    content_hash = hash_upload(uploaded_file)
+    extension = os.path.splitext(uploaded_file.name)[1].lower()
+    filename = f"{content_hash}{extension}"
+    if not fs.exists(filename):
+        filename = fs.save(filename, uploaded_file)
+    return filename, content_hash
+
+class CacheEntry:
+    """
+    A cached classification: a directory with the result files and meta.json.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+
+    def file(self, name):
+        path = os.path.join(self.path, name)
+        return path if os.path.exists(path) else None
+
+    def read(self, name):
+        path = self.file(name)
+        if path is None:
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+class ResultCache:
+    """
+    On-disk cache of classification results keyed by upload content hash and model version.
+    Entries are written aside and renamed into place, and evicted least-recently-used first
+    once the cache grows over max_bytes, results of other model versions before those of the
+    current one. The mtime of meta.json tracks the last access; entries used in the last
+    min_age seconds are never evicted, so URLs just handed out keep working even if that
+    leaves the cache over max_bytes for a while.
+    """
+    def __init__(self, root, max_bytes, min_age=0):
+        self.root = str(root)
+        self.max_bytes = max_bytes
+        self.min_age = min_age
+
+    @staticmethod
+    def valid_key(key):
+        return len(key) == 32 and all(c in '0123456789abcdef' for c in key)
+
+    def key(self, content_hash, model_version):
+        return hashlib.sha256(f"{content_hash}:{model_version}".encode()).hexdigest()[:32]
+
+    def get(self, key):
+        path = os.path.join(self.root, key)
+        try:
+            entry = CacheEntry(path)
+            os.utime(os.path.join(path, 'meta.json'))
+        except (FileNotFoundError, ValueError):
+            return None
+        return entry
+
+    def put(self, key, files, meta=None):
+        """
+        Stores an entry. files maps file names to bytes or to paths of files to move in.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        destino = os.path.join(self.root, key)
+        temporal = os.path.join(self.root, f".{key}.tmp-{os.getpid()}-{time.monotonic_ns()}")
+        os.makedirs(temporal)
+
+        for name, contenido in files.items():
+            if contenido is None:
+                continue
+            if isinstance(contenido, (bytes, bytearray)):
+                with open(os.path.join(temporal, name), 'wb') as f:
+                    f.write(contenido)
+            else:
+                shutil.move(contenido, os.path.join(temporal, name))
+        with open(os.path.join(temporal, 'meta.json'), 'w') as f:
+            json.dump(dict(meta or {}, key=key, created_at=time.time()), f)
+
+        try:
+            os.rename(temporal, destino)
+        except OSError:
+            # Another request stored the same result first, keep that one
+            shutil.rmtree(temporal, ignore_errors=True)
+        self.evict(keep=(key,), model_version=(meta or {}).get('model_version'))
+        return self.get(key)
+
+    def add_file(self, key, name, contenido):
+        """
+        Adds a file to an existing entry (e.g. a preview rendered on a later hit).
+        """
+        destino = os.path.join(self.root, key, name)
+        temporal = f"{destino}.tmp-{os.getpid()}"
+        with open(temporal, 'wb') as f:
+            f.write(contenido)
+        os.replace(temporal, destino)
+
+    def _entries(self):
+        if not os.path.isdir(self.root):
+            return []
+        entradas = []
+        for nombre in os.listdir(self.root):
+            path = os.path.join(self.root, nombre)
+            meta = os.path.join(path, 'meta.json')
+            if nombre.startswith('.') or not os.path.exists(meta):
+                continue
+            try:
+                tamano = sum(e.stat().st_size for e in os.scandir(path) if e.is_file())
+                with open(meta) as f:
+                    version = json.load(f).get('model_version')
+                entradas.append((os.stat(meta).st_mtime, tamano, path, version))
+            except (FileNotFoundError, ValueError):
+                continue
+        return entradas
+
+    def size(self):
+        return sum(entrada[1] for entrada in self._entries())
+
+    def evict(self, keep=(), model_version=None):
+        """
+        Removes entries until the cache fits in max_bytes, least recently used first and
+        entries of a model_version other than the given one before the rest. The keys in keep
+        and entries used within min_age seconds are left alone.
+        """
+        entradas = self._entries()
+        total = sum(entrada[1] for entrada in entradas)
+        limite = time.time() - self.min_age
+        entradas.sort(key=lambda e: (model_version is not None and e[3] == model_version, e[0]))
+        for mtime, tamano, path, _ in entradas:
+            if total <= self.max_bytes:
+                break
+            if os.path.basename(path) in keep or mtime > limite:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= tamano
+
+    def clear(self):
+        for entrada in self._entries():
+            shutil.rmtree(entrada[2], ignore_errors=True)
+
+def get_result_cache():
+    """
+    The configured result store. Results are always stored there so they can be served by id;
+    ML_RESULT_CACHE_ENABLED only controls whether an existing result is reused.
+    """
+    root = getattr(settings, 'ML_RESULT_CACHE_DIR', None) or os.path.join(settings.MEDIA_ROOT, 'cache')
+    return ResultCache(root, getattr(settings, 'ML_RESULT_CACHE_MAX_BYTES', 2 * 1024 ** 3),
+                       getattr(settings, 'ML_RESULT_CACHE_MIN_AGE_SECONDS', 3600))
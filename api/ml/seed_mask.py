@@ -0,0 +1,44 @@
+import numpy as np
+from api.ml.preprocessor import PIXELES_POR_VENTANA, escalar_reflectancia
+
+# Parameters from original script
+valores_firma = {
+    "nir": 0.11385695,
+    "swir1": 0.094874144,
+    "swir2": 0.052902829
+}
+
+def calcular_umbral(valor):
+    return valor * 0.7, valor * 1.3
+
+umbrales = {banda: calcular_umbral(valor) for banda, valor in valores_firma.items()}
+
+def filas_por_bloque(ancho):
+    """
+    Rows per processing block, so each block covers about PIXELES_POR_VENTANA pixels.
+    """
+    return max(1, PIXELES_POR_VENTANA // max(ancho, 1))
+
+def calcular_mascara_semilla(bandas, referencia_shape, crudas=False):
+    """
+    Seed mask: pixels inside the signature thresholds of any of nir / swir1 / swir2.
+    Computed block by block into one preallocated mask, so the comparisons and ORs run on
+    cache-sized temporaries instead of one scene-sized boolean array per band.
+    With crudas the bands hold raw values and each block is scaled as it is compared.
+    Returns None when the image has none of those bands.
+    """
+    nombres = [nombre for nombre in ['nir', 'swir1', 'swir2'] if nombre in bandas]
+    if not nombres:
+        return None
+
+    mascara = np.zeros(referencia_shape, dtype=bool)
+    paso = filas_por_bloque(referencia_shape[1])
+    for fila in range(0, referencia_shape[0], paso):
+        bloque = mascara[fila:fila + paso]
+        for nombre in nombres:
+            umbral_inf, umbral_sup = umbrales[nombre]
+            banda = bandas[nombre][fila:fila + paso]
+            if crudas:
+                banda = escalar_reflectancia(banda)
+            bloque |= (banda >= umbral_inf) & (banda <= umbral_sup)
+    return mascara
@@ -0,0 +1,162 @@
+import io
+import math
+import threading
+import contextlib
+from collections import OrderedDict
+from functools import lru_cache
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.transform import from_bounds
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import transform_bounds
+from PIL import Image
+from django.conf import settings
+from api.ml.preprocessor import CLASE_SIN_DATOS
+from api.ml.rendering import render_classification, leer_rgb, componer_rgb, limites_percentiles, forma_preview
+
+# Web Mercator (EPSG:3857) XYZ grid, as used by Leaflet / OpenLayers / MapLibre
+TILE_SIZE = 256
+MERCATOR = 'EPSG:3857'
+ORIGEN_MERCATOR = math.pi * 6378137.0
+MAX_ZOOM = 24
+
+# Label outside the classified scene (and of its empty pixels), drawn transparent in classification tiles
+SIN_DATOS = CLASE_SIN_DATOS
+
+TILE_LAYERS = ('classification', 'rgb')
+
+def limites_tile(z, x, y):
+    """
+    Web Mercator bounds (left, bottom, right, top) of tile z/x/y.
+    """
+    lado = 2 * ORIGEN_MERCATOR / 2 ** z
+    return (
+        -ORIGEN_MERCATOR + x * lado,
+        ORIGEN_MERCATOR - (y + 1) * lado,
+        -ORIGEN_MERCATOR + (x + 1) * lado,
+        ORIGEN_MERCATOR - y * lado,
+    )
+
+def tile_valido(z, x, y):
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+@lru_cache(maxsize=256)
+def limites_mercator(path, mtime_ns):
+    """
+    Web Mercator bounds of a raster (mtime_ns invalidates the cache entry).
+    """
+    with rasterio.open(path) as src:
+        return transform_bounds(src.crs, MERCATOR, *src.bounds)
+
+def tile_en_escena(path, mtime_ns, z, x, y):
+    """
+    Whether tile z/x/y overlaps the raster at path; tiles that don't are never rendered.
+    """
+    left, bottom, right, top = limites_tile(z, x, y)
+    e_left, e_bottom, e_right, e_top = limites_mercator(path, mtime_ns)
+    return left < e_right and right > e_left and bottom < e_top and top > e_bottom
+
+def nivel_overview(src, resolucion_tile):
+    """
+    Index of the coarsest overview still at least as fine as the tile resolution
+    (None for full resolution), so a zoomed-out tile reads a reduced level.
+    """
+    left, bottom, right, top = transform_bounds(src.crs, MERCATOR, *src.bounds)
+    resolucion = max((right - left) / src.width, (top - bottom) / src.height)
+    nivel = None
+    for i, factor in enumerate(src.overviews(1)):
+        if resolucion * factor <= resolucion_tile:
+            nivel = i
+    return nivel
+
+@contextlib.contextmanager
+def abrir_tile(path, z, x, y, **kwargs):
+    """
+    Opens the raster at path warped onto the pixel grid of tile z/x/y, reading from the
+    overview level that matches the zoom. Only the source blocks under the tile are read.
+    """
+    limites = limites_tile(z, x, y)
+    with rasterio.open(path) as src:
+        nivel = nivel_overview(src, (limites[2] - limites[0]) / TILE_SIZE)
+    with rasterio.open(path, overview_level=nivel) as src:
+        with WarpedVRT(src, crs=MERCATOR, transform=from_bounds(*limites, TILE_SIZE, TILE_SIZE),
+                       width=TILE_SIZE, height=TILE_SIZE, **kwargs) as vrt:
+            yield vrt
+
+def render_classification_tile(path, z, x, y):
+    """
+    Palette PNG tile of a classification raster; pixels outside the scene are transparent.
+    Nearest resampling over MODE overviews keeps labels unblended at every zoom.
+    """
+    with abrir_tile(path, z, x, y, nodata=SIN_DATOS, resampling=Resampling.nearest) as vrt:
+        mapa = vrt.read(1)
+    return render_classification(mapa, transparent_index=SIN_DATOS)
+
+@lru_cache(maxsize=64)
+def limites_rgb(path, mtime_ns):
+    """
+    Per-channel stretch limits of a scene, computed once on a decimated read so every
+    tile of the scene is stretched the same way (mtime_ns invalidates the cache entry).
+    """
+    with rasterio.open(path) as src:
+        datos, validos = leer_rgb(src, *forma_preview(src.height, src.width, 1024))
+    return [limites_percentiles(d, v) for d, v in zip(datos, validos)]
+
+def render_rgb_tile(path, mtime_ns, z, x, y):
+    """
+    RGBA PNG tile of the source scene with the 0.5-99.5 percentile stretch of the preview.
+    """
+    limites = limites_rgb(path, mtime_ns)
+    with abrir_tile(path, z, x, y, add_alpha=True, resampling=Resampling.bilinear) as vrt:
+        datos, validos = leer_rgb(vrt, TILE_SIZE, TILE_SIZE)
+        alfa = vrt.read(vrt.count)
+
+    rgba = np.empty((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8)
+    rgba[:, :, :3] = componer_rgb(datos, validos, limites)
+    rgba[:, :, 3] = np.where(validos.all(axis=0), alfa, 0)
+
+    buf = io.BytesIO()
+    Image.fromarray(rgba, mode='RGBA').save(buf, format='PNG', compress_level=3)
+    return buf.getvalue()
+
+class TileCache:
+    """
+    In-process LRU cache of encoded tiles. Result ids never change content, so entries
+    need no invalidation; max_tiles bounds memory (a 256 px tile is a few KB to ~100 KB).
+    """
+    def __init__(self, max_tiles):
+        self.max_tiles = max_tiles
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is None:
+                self.misses += 1
+                return None
+            self._tiles.move_to_end(key)
+            self.hits += 1
+            return tile
+
+    def put(self, key, tile):
+        with self._lock:
+            self._tiles[key] = tile
+            self._tiles.move_to_end(key)
+            while len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._tiles.clear()
+
+_tile_cache = None
+
+def get_tile_cache():
+    global _tile_cache
+    if _tile_cache is None:
+        _tile_cache = TileCache(getattr(settings, 'ML_TILE_CACHE_SIZE', 1024))
+    return _tile_cache
@@ -1,126 +1,331 @@
 import os
 import glob
+import contextlib
+import collections
+import django
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import joblib
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, training is not guarded across processes
+    fcntl = None
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import recall_score, classification_report
 from django.conf import settings
-from api.ml.preprocessor import leer_bandas
+from api.ml.preprocessor import CARACTERISTICAS, ESCALA_REFLECTANCIA
+from api.ml.seed_mask import umbrales, filas_por_bloque, calcular_mascara_semilla
+from api.ml.feature_store import leer_bandas_cacheadas
+from api.ml.model_loader import ModelLoader, convert_model
+from api.ml.evaluation import evaluate_scenes
+from api.ml.parallel import shutdown_executors, contexto_pool
+from api.ml.instrumentation import PicoRSS
 
-def train_model(ruta_carpeta_train, ruta_carpeta_test):
+# Root of the per-image seeds used to sample non-cienaga pixels
+SEMILLA_MUESTREO = 42
+
+def muestrear_negativos(mascara, num_no, rng):
     """
-    Trains the Random Forest model using images from the specified directories.
-    Saves the trained model to the base directory.
+    Flat indices of num_no pixels drawn uniformly without replacement from outside the mask,
+    in ascending order. The picks are first split among row blocks with a multivariate
+    hypergeometric draw (exactly how a uniform sample falls across blocks), then drawn inside
+    each block, so no scene-sized coordinate or permutation array is ever built.
     """
-    print(f"Training started. Train dir: {ruta_carpeta_train}, Test dir: {ruta_carpeta_test}")
-    
-    imagenes_train = glob.glob(os.path.join(ruta_carpeta_train, "*.tif"))
-    imagenes_test = glob.glob(os.path.join(ruta_carpeta_test, "*.tif"))
+    paso = filas_por_bloque(mascara.shape[1]) * mascara.shape[1]
+    plano = mascara.ravel()
+    inicios = range(0, plano.size, paso)
+    negativos = np.array([len(plano[i:i + paso]) - np.count_nonzero(plano[i:i + paso]) for i in inicios], dtype=np.int64)
+    por_bloque = rng.multivariate_hypergeometric(negativos, num_no)
 
-    if not imagenes_train:
-        raise ValueError(f"No .tif images found in training directory: {ruta_carpeta_train}")
+    seleccion = []
+    for inicio, disponibles, elegidos in zip(inicios, negativos, por_bloque):
+        if elegidos == 0:
+            continue
+        indices = np.flatnonzero(~plano[inicio:inicio + paso])
+        if elegidos < disponibles:
+            indices = indices[np.sort(rng.choice(disponibles, elegidos, replace=False))]
+        seleccion.append(indices + inicio)
+    return np.concatenate(seleccion) if seleccion else np.empty(0, dtype=np.intp)
 
-    # Parameters from original script
-    valores_firma = {
-        "nir": 0.11385695,
-        "swir1": 0.094874144,
-        "swir2": 0.052902829
-    }
+def reunir_caracteristicas(bandas, indices, crudas=False):
+    """
+    Gathers the feature rows of the given flat pixel indices straight from the band arrays
+    (only the CARACTERISTICAS the image has, as the original script stacks them).
+    With crudas the bands hold raw values and only the gathered rows are scaled.
+    """
+    nombres = [b for b in CARACTERISTICAS if b in bandas]
+    X = np.empty((len(indices), len(nombres)), dtype=np.float32)
+    for j, nombre in enumerate(nombres):
+        X[:, j] = np.ravel(bandas[nombre]).take(indices)
+    if crudas:
+        X /= ESCALA_REFLECTANCIA
+    return X
+
+def extraer_muestras(ruta_imagen, seed, max_muestras=None):
+    """
+    Extracts the balanced training samples of one image: every pixel of the seed mask
+    (class 1) and as many randomly chosen pixels outside it (class 0).
+    With max_muestras, at most max_muestras // 2 pixels of each class are kept.
+    Returns (X, y), or None when the image yields no samples.
+    """
+    try:
+        bandas, referencia_shape, cacheada = leer_bandas_cacheadas(ruta_imagen)
+    except Exception as e:
+        print(f"Error reading {ruta_imagen}: {e}")
+        return None
+    print(f"Processing training image: {os.path.basename(ruta_imagen)}{' (cached features)' if cacheada else ''}")
+
+    # Create seed mask based on thresholds (the bands are unscaled, see leer_bandas_cacheadas)
+    mascara_semilla = calcular_mascara_semilla(bandas, referencia_shape, crudas=True)
+    if mascara_semilla is None:
+        print(f"Skipping {ruta_imagen}: Missing required bands for mask generation.")
+        return None
+
+    # Class 1: Cienaga
+    indices_cienaga = np.flatnonzero(mascara_semilla)
+    # Handle case where there are no pixels for a class
+    if len(indices_cienaga) == 0:
+        print(f"No cienaga pixels found in {ruta_imagen}")
+        return None
+
+    rng = np.random.default_rng(seed)
+    if max_muestras and len(indices_cienaga) > max_muestras // 2:
+        # Per-scene sample budget: uniform subset of the seed pixels
+        elegidos = rng.choice(len(indices_cienaga), max(max_muestras // 2, 1), replace=False)
+        indices_cienaga = indices_cienaga[np.sort(elegidos)]
 
-    def calcular_umbral(valor):
-        return valor * 0.7, valor * 1.3
+    # Class 0: Non-Cienaga
+    num_no = min(len(indices_cienaga), mascara_semilla.size - np.count_nonzero(mascara_semilla))
+    if num_no == 0:
+        return None
+    indices_no = muestrear_negativos(mascara_semilla, num_no, rng)
+
+    X = reunir_caracteristicas(bandas, np.concatenate([indices_cienaga, indices_no]), crudas=True)
+    y = np.concatenate([np.ones(len(indices_cienaga), dtype=int), np.zeros(len(indices_no), dtype=int)])
+    return X, y
+
+def iterar_muestras(imagenes, workers=None, max_muestras=None):
+    """
+    Yields extraer_muestras for each image, in input order. With more than one worker
+    the images are processed on a process pool; each image gets its own seed spawned
+    from SEMILLA_MUESTREO, so the samples are the same whatever the worker count.
+    At most one image per worker is in flight: the next one is only submitted once the
+    head-of-line result has been consumed, so finished samples never pile up behind a
+    slow scene.
+    """
+    if workers is None:
+        workers = getattr(settings, 'ML_TRAIN_WORKERS', None) or os.cpu_count() or 1
+    seeds = np.random.SeedSequence(SEMILLA_MUESTREO).spawn(len(imagenes))
+
+    if workers <= 1 or len(imagenes) <= 1:
+        for ruta_imagen, seed in zip(imagenes, seeds):
+            yield extraer_muestras(ruta_imagen, seed, max_muestras)
+        return
+
+    workers = min(workers, len(imagenes))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=contexto_pool(),
+                             initializer=django.setup) as executor:
+        pendientes = collections.deque()
+        for ruta_imagen, seed in zip(imagenes, seeds):
+            if len(pendientes) == workers:
+                yield pendientes.popleft().result()
+            pendientes.append(executor.submit(extraer_muestras, ruta_imagen, seed, max_muestras))
+        while pendientes:
+            yield pendientes.popleft().result()
+
+class AlmacenMuestras:
+    """
+    Disk-backed training set: samples are appended to raw files as each scene is extracted
+    and mapped back as read-only np.memmap arrays, so the full set never has to sit in
+    Python lists or be concatenated in memory.
+    """
+    def __init__(self, directorio):
+        self.ruta_X = os.path.join(directorio, 'X.f32')
+        self.ruta_y = os.path.join(directorio, 'y.i64')
+        self._X = open(self.ruta_X, 'wb')
+        self._y = open(self.ruta_y, 'wb')
+        self.n_muestras = 0
+        self.n_caracteristicas = None
 
-    umbrales = {banda: calcular_umbral(valor) for banda, valor in valores_firma.items()}
+    def agregar(self, X, y):
+        if self.n_caracteristicas is None:
+            self.n_caracteristicas = X.shape[1]
+        elif X.shape[1] != self.n_caracteristicas:
+            raise ValueError(f"Training images have different band sets: {X.shape[1]} features, expected {self.n_caracteristicas}")
+        self._X.write(np.ascontiguousarray(X, dtype=np.float32).tobytes())
+        self._y.write(np.ascontiguousarray(y, dtype=np.int64).tobytes())
+        self.n_muestras += len(y)
 
-    X_total, y_total = [], []
+    def mapear(self):
+        self._X.close()
+        self._y.close()
+        X = np.memmap(self.ruta_X, dtype=np.float32, mode='r', shape=(self.n_muestras, self.n_caracteristicas))
+        y = np.memmap(self.ruta_y, dtype=np.int64, mode='r', shape=(self.n_muestras,))
+        return X, y
 
-    for ruta_imagen in imagenes_train:
-        print(f"Processing training image: {os.path.basename(ruta_imagen)}")
+def bloques_entrenamiento(n_muestras, n_caracteristicas, limite_bytes):
+    """
+    Number of chunks the training set is fitted in so each chunk's samples fit in limite_bytes
+    (1 when there is no limit or everything fits).
+    """
+    if not limite_bytes:
+        return 1
+    bytes_muestra = n_caracteristicas * 4 + 8
+    return max(1, -(-n_muestras * bytes_muestra // limite_bytes))
+
+def guardar_modelo(rf, model_path):
+    """
+    Writes the pickle next to model_path and renames it over the old one, so processes that
+    reload on a new size / mtime never read a half-written model.
+    """
+    temporal = f"{model_path}.tmp-{os.getpid()}"
+    try:
+        joblib.dump(rf, temporal)
+        os.replace(temporal, model_path)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+class TrainingInProgressError(Exception):
+    pass
+
+@contextlib.contextmanager
+def bloqueo_entrenamiento():
+    """
+    Exclusive, non-blocking lock held for the whole training run, so two trainings
+    (from any process) never fit at the same time nor race on writing the model file.
+    """
+    ruta_lock = os.path.join(settings.BASE_DIR, "modelo_rf_cienagas.lock")
+    with open(ruta_lock, "w") as lock:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise TrainingInProgressError("Another training run is already in progress")
         try:
-            bandas, perfil, referencia_shape = leer_bandas(ruta_imagen)
-        except Exception as e:
-            print(f"Error reading {ruta_imagen}: {e}")
-            continue
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
 
-        # Create seed mask based on thresholds
-        mascaras = {}
-        for nombre in ['nir', 'swir1', 'swir2']:
-            if nombre in bandas:
-                umbral_inf, umbral_sup = umbrales[nombre]
-                mascaras[nombre] = (bandas[nombre] >= umbral_inf) & (bandas[nombre] <= umbral_sup)
+def train_model(ruta_carpeta_train, ruta_carpeta_test, progress=None):
+    """
+    Trains the Random Forest model using images from the specified directories.
+    Saves the trained model to the base directory.
+    progress, if given, is called as progress(fraction, stage, **details).
+    """
+    with bloqueo_entrenamiento():
+        return _train_model(ruta_carpeta_train, ruta_carpeta_test, progress)
 
-        if not mascaras:
-            print(f"Skipping {ruta_imagen}: Missing required bands for mask generation.")
-            continue
+def _train_model(ruta_carpeta_train, ruta_carpeta_test, progress=None):
+    def reportar(fraccion, etapa, **detalles):
+        if progress is not None:
+            progress(fraccion, etapa, **detalles)
 
-        mascara_semilla = np.zeros(referencia_shape, dtype=bool)
-        for m in mascaras.values():
-            mascara_semilla |= m
-
-        caracteristicas = ['blue', 'green', 'red', 'nir', 'swir1']
-        # Ensure all features exist
-        valid_features = [b for b in caracteristicas if b in bandas]
-        if len(valid_features) != len(caracteristicas):
-             # If missing features, we might need to handle it or skip. 
-             # For now, let's assume we need all of them or just use what we have, 
-             # but the model expects specific features.
-             # The original script just stacks what is available in 'caracteristicas'
-             pass
-
-        bandas_apiladas = np.dstack([bandas[b] for b in caracteristicas if b in bandas])
-
-        # Class 1: Cienaga
-        X_cienaga = bandas_apiladas[mascara_semilla]
-        y_cienaga = np.ones(X_cienaga.shape[0], dtype=int)
-
-        # Class 0: Non-Cienaga
-        no_cienaga_idx = np.where(~mascara_semilla)
-        # Handle case where there are no pixels for a class
-        if X_cienaga.shape[0] == 0:
-            print(f"No cienaga pixels found in {ruta_imagen}")
-            continue
-            
-        num_no = min(X_cienaga.shape[0], len(no_cienaga_idx[0]))
-        if num_no == 0:
-             continue
+    print(f"Training started. Train dir: {ruta_carpeta_train}, Test dir: {ruta_carpeta_test}")
+    
+    # Sorted so per-image seeds, and therefore the samples, don't depend on directory order
+    imagenes_train = sorted(glob.glob(os.path.join(ruta_carpeta_train, "*.tif")))
+    imagenes_test = sorted(glob.glob(os.path.join(ruta_carpeta_test, "*.tif")))
+
+    if not imagenes_train:
+        raise ValueError(f"No .tif images found in training directory: {ruta_carpeta_train}")
+
+    max_muestras = getattr(settings, 'ML_TRAIN_MAX_SAMPLES_PER_SCENE', None)
+    limite_bytes = getattr(settings, 'ML_TRAIN_MEMORY_BYTES', None)
+    n_arboles = 200
 
-        seleccion_no = np.random.choice(len(no_cienaga_idx[0]), num_no, replace=False)
-        X_no = bandas_apiladas[no_cienaga_idx[0][seleccion_no],
-                                no_cienaga_idx[1][seleccion_no], :]
-        y_no = np.zeros(X_no.shape[0], dtype=int)
+    # Samples are streamed to disk scene by scene and fitted from a memory map. The peak is the
+    # growth of this process's resident memory over extraction and fit, not its lifetime maximum
+    # (a server worker has run earlier analyses); pool workers are separate processes.
+    with PicoRSS() as memoria, \
+            tempfile.TemporaryDirectory(prefix="muestras_", dir=getattr(settings, 'ML_TRAIN_TMP_DIR', None)) as directorio:
+        almacen = AlmacenMuestras(directorio)
 
-        X_total.append(np.vstack([X_cienaga, X_no]))
-        y_total.append(np.concatenate([y_cienaga, y_no]))
+        reportar(0.0, "extracting", images_processed=0, images_total=len(imagenes_train), samples=0)
+        for i, resultado in enumerate(iterar_muestras(imagenes_train, max_muestras=max_muestras)):
+            if resultado is not None:
+                almacen.agregar(*resultado)
+            del resultado
+            # Sample extraction is reported as the first 60% of the run
+            reportar(0.6 * (i + 1) / len(imagenes_train), "extracting",
+                     images_processed=i + 1, images_total=len(imagenes_train), samples=almacen.n_muestras)
 
-    if not X_total:
-        raise ValueError("No training data could be extracted from the images.")
+        if almacen.n_muestras == 0:
+            raise ValueError("No training data could be extracted from the images.")
 
-    X = np.vstack(X_total)
-    y = np.concatenate(y_total)
+        X, y = almacen.mapear()
+        print(f"Total samples: {X.shape[0]}, Features: {X.shape[1]}")
 
-    print(f"Total samples: {X.shape[0]}, Features: {X.shape[1]}")
+        # Over the memory limit the forest is grown with warm_start, a share of the trees per chunk.
+        # Chunk k takes every k-th sample, so each chunk mixes all scenes and both classes.
+        n_bloques = bloques_entrenamiento(X.shape[0], X.shape[1], limite_bytes)
+        if n_bloques > n_arboles:
+            print(f"Warning: {n_bloques} chunks needed for the memory limit but only {n_arboles} trees, using {n_arboles} chunks.")
+            n_bloques = n_arboles
 
-    # Train Random Forest
-    rf = RandomForestClassifier(
-        n_estimators=200,
-        max_depth=None,
-        random_state=42,
-        n_jobs=-1
-    )
-    rf.fit(X, y)
-    print("Model trained successfully.")
+        # Train Random Forest
+        rf = RandomForestClassifier(
+            n_estimators=0,
+            max_depth=None,
+            random_state=42,
+            n_jobs=-1,
+            warm_start=n_bloques > 1
+        )
+        for bloque in range(n_bloques):
+            reportar(0.6 + 0.25 * bloque / n_bloques, "fitting", images_processed=len(imagenes_train),
+                     images_total=len(imagenes_train), samples=X.shape[0], chunk=bloque + 1, chunks=n_bloques)
+            rf.n_estimators += n_arboles // n_bloques + (bloque < n_arboles % n_bloques)
+            if n_bloques == 1:
+                rf.fit(X, y)
+            else:
+                rf.fit(np.ascontiguousarray(X[bloque::n_bloques]), np.ascontiguousarray(y[bloque::n_bloques]))
+        n_muestras = X.shape[0]
+        del X, y
+    print(f"Model trained successfully ({rf.n_estimators} trees in {n_bloques} chunk(s), peak memory +{memoria.mb} MB).")
 
     # Save Model
+    reportar(0.85, "saving", images_processed=len(imagenes_train), images_total=len(imagenes_train), samples=n_muestras)
     model_path = os.path.join(settings.BASE_DIR, "modelo_rf_cienagas.pkl")
-    joblib.dump(rf, model_path)
+    guardar_modelo(rf, model_path)
     print(f"Model saved to {model_path}")
 
+    # Precompiled, memory-mappable copy, only read with ML_COMPILED_FOREST
+    # (otherwise the convert_model command builds it on demand)
+    artifact_path = None
+    if getattr(settings, 'ML_COMPILED_FOREST', False):
+        artifact_path = convert_model(rf, model_path)
+        print(f"Compiled model saved to {artifact_path}")
+    ModelLoader.get_instance().reset()
+    # Inference pools loaded the previous model in their initializer
+    shutdown_executors()
+
+    # Cached results are keyed by model version, so the new model no longer reuses them, but
+    # they stay servable for clients holding their URLs until evicted (previous versions first)
+
     # Evaluation (Optional, if test images exist)
-    metrics = {"model_path": model_path}
+    metrics = {
+        "model_path": model_path,
+        "artifact_path": artifact_path,
+        "samples": int(n_muestras),
+        "trees": rf.n_estimators,
+        "chunks": n_bloques,
+        "peak_memory_mb": memoria.mb,
+    }
     if imagenes_test:
-        # Logic to evaluate on test set could go here, 
-        # but for now we just return success.
-        pass
+        # Pseudo-labels come from the same seed mask used for training, so these metrics
+        # measure how well the forest generalizes that rule to unseen scenes
+        print(f"Evaluating on {len(imagenes_test)} test images...")
+        evaluacion = evaluate_scenes(
+            imagenes_test,
+            model=rf,
+            workers=getattr(settings, 'ML_TRAIN_WORKERS', None) or os.cpu_count() or 1,
+            tile_size=getattr(settings, 'ML_TILE_SIZE', None),
+            progress=lambda fraccion: reportar(0.9 + 0.1 * fraccion, "evaluating", images_total=len(imagenes_test)),
+        )
+        print(f"Test recall: {evaluacion['recall']}, precision: {evaluacion['precision']}, F1: {evaluacion['f1']}")
+        metrics["evaluation"] = evaluacion
 
     return metrics
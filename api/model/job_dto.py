@@ -0,0 +1,8 @@
+from rest_framework import serializers
+from api.entity.job import Job
+
+class JobDto(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = ('id', 'kind', 'status', 'progress', 'stage', 'details', 'result', 'error',
+                  'created_at', 'started_at', 'finished_at')
@@ -1 +1,2 @@
 from api.entity.uploaded_image import UploadedImage
+from api.entity.job import Job
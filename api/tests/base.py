@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import joblib
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from sklearn.ensemble import RandomForestClassifier
+from django.test import TestCase, override_settings
+from api.ml.model_loader import ModelLoader
+
+def crear_escena(ruta, alto, ancho, bandas=10, tiled=False, nodata=None, seed=0):
+    """
+    Small synthetic uint16 GeoTIFF with reflectances in the model's range (0 - 0.3 after scaling).
+    """
+    datos = np.random.default_rng(seed).integers(1, 3000, size=(bandas, alto, ancho)).astype(np.uint16)
+    perfil = dict(driver='GTiff', height=alto, width=ancho, count=bandas, dtype='uint16',
+                  crs='EPSG:32618', transform=from_origin(500000, 1000000, 10, 10))
+    if tiled:
+        perfil.update(tiled=True, blockxsize=64, blockysize=64)
+    if nodata is not None:
+        perfil['nodata'] = nodata
+    with rasterio.open(ruta, 'w', **perfil) as dst:
+        dst.write(datos)
+    return ruta
+
+class MLTestCase(TestCase):
+    """
+    Runs against a small forest saved in a temporary BASE_DIR, so the tests never load or
+    overwrite the real model.
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = tempfile.mkdtemp()
+        cls.ajustes = override_settings(
+            BASE_DIR=cls.tmp,
+            MEDIA_ROOT=os.path.join(cls.tmp, 'media'),
+            ML_MODEL_ARTIFACT_PATH=os.path.join(cls.tmp, 'compilado'),
+            ML_INFERENCE_WORKERS=1,
+            ML_TILED_INFERENCE=False,
+            ML_COMPILED_FOREST=False,
+            ML_NODATA_MASKING=True,
+            ML_INSTRUMENTATION=False,
+        )
+        cls.ajustes.enable()
+
+        rng = np.random.default_rng(1)
+        X = rng.random((3000, 5), dtype=np.float32) * 0.3
+        y = ((X[:, 3] > 0.08) & (X[:, 3] < 0.15)).astype(int)
+        cls.rf = RandomForestClassifier(n_estimators=10, max_depth=12, random_state=0, n_jobs=1).fit(X, y)
+        cls.model_path = os.path.join(cls.tmp, 'modelo_rf_cienagas.pkl')
+        joblib.dump(cls.rf, cls.model_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.ajustes.disable()
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        # A fresh loader, so every test class loads its own model
+        ModelLoader._instance = None
+        self.addCleanup(setattr, ModelLoader, '_instance', None)
+
+    def ruta(self, nombre):
+        return os.path.join(self.tmp, nombre)
+
+    def ruta_media(self, nombre):
+        os.makedirs(os.path.join(self.tmp, 'media'), exist_ok=True)
+        return os.path.join(self.tmp, 'media', nombre)
@@ -0,0 +1,89 @@
+import hashlib
+from unittest import mock
+from django.urls import reverse
+from api.chunked_upload import MIN_CHUNK_SIZE
+from api.entity.job import Job
+from api.tests.base import MLTestCase, crear_escena
+
+class ChunkedUploadTests(MLTestCase):
+    def setUp(self):
+        super().setUp()
+        with open(crear_escena(self.ruta('escena.tif'), 200, 200), 'rb') as f:
+            self.contenido = f.read()
+        response = self.client.post(reverse('chunked_upload'), {
+            "filename": "escena.tif", "size": len(self.contenido), "chunk_size": MIN_CHUNK_SIZE
+        })
+        self.assertEqual(response.status_code, 201)
+        self.upload = response.json()
+        self.assertGreater(self.upload["chunks"], 2)
+
+    def enviar(self, index, datos=None, inicio=None, checksum=None):
+        inicio = index * MIN_CHUNK_SIZE if inicio is None else inicio
+        if datos is None:
+            datos = self.contenido[inicio:inicio + MIN_CHUNK_SIZE]
+        return self.client.put(
+            reverse('chunked_upload_detail', args=[self.upload["upload_id"]]), datos,
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {inicio}-{inicio + len(datos) - 1}/{len(self.contenido)}',
+            HTTP_X_CHUNK_SHA256=checksum or hashlib.sha256(datos).hexdigest(),
+        )
+
+    def estado(self):
+        return self.client.get(reverse('chunked_upload_detail', args=[self.upload["upload_id"]])).json()
+
+    def completar(self, analyze=False):
+        url = reverse('chunked_upload_complete', args=[self.upload["upload_id"]])
+        return self.client.post(url if analyze else f'{url}?analyze=0')
+
+    def enviar_todo(self):
+        for index in range(self.upload["chunks"]):
+            self.assertEqual(self.enviar(index).status_code, 200)
+
+    def test_misaligned_range_is_not_satisfiable(self):
+        response = self.enviar(0, inicio=1000)
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.contenido)}')
+
+    def test_checksum_mismatch_is_rejected(self):
+        response = self.enviar(1, checksum='0' * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.estado()["received"], [])
+
+    def test_upload_resumes_from_the_missing_chunks(self):
+        self.enviar(0)
+        self.enviar(2)
+        self.assertEqual(self.estado()["received"], [0, 2])
+        response = self.completar()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["missing"], [1] + list(range(3, self.upload["chunks"])))
+
+        for index in self.completar().json()["missing"]:
+            self.enviar(index)
+        response = self.completar()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["content_hash"], hashlib.sha256(self.contenido).hexdigest())
+
+    def test_failed_resend_drops_the_verified_chunk(self):
+        self.enviar(1)
+        datos = bytes(MIN_CHUNK_SIZE)
+        response = self.enviar(1, datos=datos, checksum=hashlib.sha256(b'otro').hexdigest())
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.estado()["received"], [])
+
+    def test_complete_is_idempotent(self):
+        self.enviar_todo()
+        primero = self.completar()
+        self.assertEqual(primero.status_code, 200)
+        self.assertEqual(self.completar().json(), primero.json())
+
+    def test_complete_enqueues_a_single_analysis(self):
+        self.enviar_todo()
+        with mock.patch('api.views_uploads.get_queue') as get_queue:
+            get_queue.return_value.submit.side_effect = lambda params: Job.objects.create(
+                kind=Job.KIND_ANALYSIS, params=params
+            )
+            primero = self.completar(analyze=True)
+            segundo = self.completar(analyze=True)
+        self.assertEqual(primero.status_code, 202)
+        self.assertEqual(segundo.json()["id"], primero.json()["id"])
+        self.assertEqual(get_queue.return_value.submit.call_count, 1)
@@ -0,0 +1,30 @@
+import io
+from unittest import mock
+import numpy as np
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from api.ml.forest import CompiledForest
+from api.ml.model_loader import get_model
+from api.ml.preprocessor import preprocess_image
+from api.tests.base import MLTestCase, crear_escena
+
+class CompiledForestTests(MLTestCase):
+    def test_compiled_forest_matches_sklearn(self):
+        X, _, _ = preprocess_image(crear_escena(self.ruta('escena.tif'), 120, 130))
+        compilado = CompiledForest.from_sklearn(self.rf)
+        np.testing.assert_array_equal(compilado.predict(X, block_size=1000), self.rf.predict(X))
+        np.testing.assert_allclose(compilado.predict_proba(X), self.rf.predict_proba(X))
+
+class BenchmarkCommandTests(MLTestCase):
+    def test_forest_parity_passes(self):
+        salida = io.StringIO()
+        call_command('benchmark_ml', 'forest', size=64, stdout=salida)
+        self.assertIn('Parity check passed', salida.getvalue())
+
+    def test_parity_failure_fails_the_command(self):
+        def predict_erroneo(forest, X, block_size=2048):
+            return 1 - get_model().predict(X)
+
+        with mock.patch.object(CompiledForest, 'predict', predict_erroneo):
+            with self.assertRaises(CommandError):
+                call_command('benchmark_ml', 'forest', size=64, stdout=io.StringIO())
@@ -0,0 +1,74 @@
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from django.test import TransactionTestCase, override_settings
+from api.entity.job import Job
+from api.jobs.queue import JobQueue, QueueFullError
+
+class JobQueueTests(TransactionTestCase):
+    """
+    The queue's worker threads use their own database connections, so these tests commit.
+    """
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        ajustes = override_settings(BASE_DIR=tmp)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.llamadas = []
+
+    def handler(self, params, progress):
+        self.llamadas.append(params)
+        progress(0.5, 'working')
+        return {"echo": params.get("n")}
+
+    def cola(self, handler=None, max_depth=5):
+        queue = JobQueue(Job.KIND_ANALYSIS, handler or self.handler, workers=1, max_depth=max_depth)
+        self.addCleanup(queue.executor.shutdown)
+        return queue
+
+    def test_submitted_job_runs_and_stores_its_result(self):
+        queue = self.cola()
+        job = queue.submit({"n": 1})
+        queue.executor.shutdown(wait=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_DONE)
+        self.assertEqual(job.result, {"echo": 1})
+        self.assertEqual(job.progress, 1.0)
+
+    def test_job_is_claimed_once(self):
+        queue = self.cola()
+        job = Job.objects.create(kind=Job.KIND_ANALYSIS, params={"n": 2})
+        queue._run(job.pk)
+        queue._run(job.pk)
+        self.assertEqual(self.llamadas, [{"n": 2}])
+
+    def test_recovery_fails_orphaned_jobs_and_reruns_queued_ones(self):
+        proceso = subprocess.Popen([sys.executable, '-c', 'pass'])
+        proceso.wait()
+        huerfano = Job.objects.create(kind=Job.KIND_ANALYSIS, status=Job.STATUS_RUNNING, worker_pid=proceso.pid)
+        en_espera = Job.objects.create(kind=Job.KIND_ANALYSIS, params={"n": 3})
+
+        queue = self.cola()
+        queue.executor.shutdown(wait=True)
+        huerfano.refresh_from_db()
+        en_espera.refresh_from_db()
+        self.assertEqual(huerfano.status, Job.STATUS_FAILED)
+        self.assertIn('Interrupted', huerfano.error)
+        self.assertEqual(en_espera.status, Job.STATUS_DONE)
+        self.assertEqual(self.llamadas, [{"n": 3}])
+
+    def test_full_queue_rejects_submissions(self):
+        liberar = threading.Event()
+        queue = self.cola(handler=lambda params, progress: liberar.wait(10), max_depth=1)
+        primero = queue.submit({})
+        try:
+            with self.assertRaises(QueueFullError) as error:
+                queue.submit({})
+            self.assertEqual(error.exception.pending_job, primero)
+        finally:
+            liberar.set()
+        queue.executor.shutdown(wait=True)
+        self.assertEqual(Job.objects.filter(kind=Job.KIND_ANALYSIS).count(), 1)
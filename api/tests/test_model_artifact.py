@@ -0,0 +1,27 @@
+import os
+import numpy as np
+from django.test import override_settings
+from api.ml.forest import CompiledForest
+from api.ml.model_loader import ModelLoader, convert_model, get_artifact_path
+from api.ml.preprocessor import preprocess_image
+from api.tests.base import MLTestCase, crear_escena
+
+class ModelArtifactTests(MLTestCase):
+    def test_saved_artifact_maps_the_same_forest(self):
+        X, _, _ = preprocess_image(crear_escena(self.ruta('escena.tif'), 60, 70))
+        ruta = CompiledForest.from_sklearn(self.rf).save(self.ruta('artefacto'))
+        cargado = CompiledForest.load(ruta, mmap_mode='r')
+        np.testing.assert_array_equal(cargado.predict(X), self.rf.predict(X))
+
+    @override_settings(ML_COMPILED_FOREST=True)
+    def test_artifact_is_only_used_for_its_source_pickle(self):
+        loader = ModelLoader.get_instance()
+        convert_model()
+        self.assertTrue(loader._artifact_is_current(get_artifact_path()))
+
+        # A retrained pickle makes the artifact stale until it is converted again
+        stat = os.stat(self.model_path)
+        os.utime(self.model_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertFalse(loader._artifact_is_current(get_artifact_path()))
+        convert_model()
+        self.assertTrue(loader._artifact_is_current(get_artifact_path()))
@@ -0,0 +1,50 @@
+import numpy as np
+import rasterio
+from django.test import override_settings
+from api.ml.classifier import ClassifierService
+from api.ml.preprocessor import CLASE_SIN_DATOS
+from api.tests.base import MLTestCase, crear_escena
+
+class NodataMaskTests(MLTestCase):
+    def _escena_con_vacios(self, nombre, bandas, nodata, valor):
+        ruta = crear_escena(self.ruta(nombre), 60, 80, bandas=bandas, nodata=nodata)
+        with rasterio.open(ruta, 'r+') as dst:
+            datos = dst.read()
+            datos[:, :10, :] = valor
+            dst.write(datos)
+        return ruta
+
+    def _comprobar(self, ruta):
+        with override_settings(ML_NODATA_MASKING=False):
+            referencia, _ = ClassifierService().predict(ruta)
+        for tiled in (False, True):
+            mapa, _ = ClassifierService().predict(ruta, tiled=tiled, tile_size=32)
+            self.assertTrue((mapa[:10] == CLASE_SIN_DATOS).all())
+            self.assertFalse((mapa[10:] == CLASE_SIN_DATOS).any())
+            np.testing.assert_array_equal(mapa[10:], referencia[10:])
+
+    def test_declared_nodata_is_masked(self):
+        self._comprobar(self._escena_con_vacios('nodata.tif', 10, 65535, 65535))
+
+    def test_declared_nodata_is_masked_when_bands_are_missing(self):
+        # Three bands: the nir and swir1 features are zero-filled, only blue/green/red hold nodata
+        self._comprobar(self._escena_con_vacios('tres_bandas.tif', 3, 65535, 65535))
+
+    def test_zero_fill_is_masked_without_nodata(self):
+        self._comprobar(self._escena_con_vacios('ceros.tif', 10, None, 0))
+
+    def test_masking_can_be_disabled(self):
+        ruta = self._escena_con_vacios('sin_mascara.tif', 10, 65535, 65535)
+        with override_settings(ML_NODATA_MASKING=False):
+            mapa, _ = ClassifierService().predict(ruta)
+        self.assertFalse((mapa == CLASE_SIN_DATOS).any())
+
+    def test_classification_geotiff_declares_nodata(self):
+        ruta = self._escena_con_vacios('salida.tif', 10, 65535, 65535)
+        service = ClassifierService()
+        mapa, perfil = service.predict(ruta)
+        for cog in (True, False):
+            salida = service.save_classification(mapa, dict(perfil), self.ruta(f'clasificacion_{cog}.tif'), cog=cog)
+            with rasterio.open(salida) as src:
+                self.assertEqual(src.nodata, CLASE_SIN_DATOS)
+                np.testing.assert_array_equal(src.read(1), mapa)
@@ -0,0 +1,16 @@
+import tracemalloc
+from api.ml.preprocessor import preprocess_image
+from api.tests.base import MLTestCase, crear_escena
+
+class PreprocessMemoryTests(MLTestCase):
+    def test_feature_matrix_is_built_without_copies(self):
+        ruta = crear_escena(self.ruta('escena.tif'), 300, 320)
+        tracemalloc.start()
+        try:
+            X, _, _ = preprocess_image(ruta)
+            pico = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(X.shape, (300 * 320, 5))
+        # Same limit as benchmark_ml preprocess --max-peak-ratio
+        self.assertLessEqual(pico / X.nbytes, 1.25)
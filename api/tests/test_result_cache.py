@@ -0,0 +1,33 @@
+import os
+from api.ml.analysis import analyze_image
+from api.ml.model_loader import ModelLoader
+from api.ml.result_cache import get_result_cache
+from api.tests.base import MLTestCase, crear_escena
+
+class ResultCacheTests(MLTestCase):
+    def test_result_is_reused_for_the_same_content_and_model(self):
+        ruta = crear_escena(self.ruta_media('escena.tif'), 60, 70)
+        primero = analyze_image(ruta)
+        self.assertFalse(primero["cached"])
+        self.assertIsNotNone(get_result_cache().get(primero["result_id"]).file('clasificacion.tif'))
+
+        segundo = analyze_image(ruta)
+        self.assertTrue(segundo["cached"])
+        self.assertEqual(segundo["result_id"], primero["result_id"])
+
+        otra = analyze_image(crear_escena(self.ruta_media('otra.tif'), 60, 70, seed=1))
+        self.assertFalse(otra["cached"])
+        self.assertNotEqual(otra["result_id"], primero["result_id"])
+
+    def test_retrained_model_gets_new_results(self):
+        ruta = crear_escena(self.ruta_media('escena.tif'), 60, 70)
+        anterior = analyze_image(ruta)
+
+        # A retrain replaces the pickle; the loaded model is refreshed on the next request
+        stat = os.stat(self.model_path)
+        os.utime(self.model_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        nuevo = analyze_image(ruta)
+        self.assertFalse(nuevo["cached"])
+        self.assertNotEqual(nuevo["result_id"], anterior["result_id"])
+        self.assertEqual(ModelLoader.get_instance().load_versioned_model()[1],
+                         get_result_cache().get(nuevo["result_id"]).meta["model_version"])
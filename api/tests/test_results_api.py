@@ -0,0 +1,81 @@
+import os
+import time
+from django.urls import reverse
+from api.ml.analysis import analyze_image
+from api.ml.result_cache import ResultCache, get_result_cache
+from api.tests.base import MLTestCase, crear_escena
+
+class ResultArtifactTests(MLTestCase):
+    def setUp(self):
+        super().setUp()
+        self.result_id = analyze_image(crear_escena(self.ruta_media('escena.tif'), 60, 70))["result_id"]
+        self.url = reverse('result_artifact', args=[self.result_id, 'clasificacion.tif'])
+        with open(get_result_cache().get(self.result_id).file('clasificacion.tif'), 'rb') as f:
+            self.contenido = f.read()
+
+    def test_detail_lists_the_artifact_urls(self):
+        response = self.client.get(reverse('result_detail', args=[self.result_id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('source_path', response.json()["metadata"])
+
+    def test_artifact_is_served_with_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.contenido)
+        self.assertIn('immutable', response['Cache-Control'])
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_byte_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=4-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.contenido[4:20])
+        self.assertEqual(response['Content-Range'], f'bytes 4-19/{len(self.contenido)}')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.contenido[-10:])
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.contenido)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.contenido)}')
+
+    def test_unknown_result_is_not_found(self):
+        self.assertEqual(self.client.get(reverse('result_detail', args=['0' * 32])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('result_artifact', args=[self.result_id, 'otro.png'])).status_code, 404)
+
+class ResultEvictionTests(MLTestCase):
+    def _envejecer(self, cache, key, segundos):
+        antes = time.time() - segundos
+        os.utime(os.path.join(cache.root, key, 'meta.json'), (antes, antes))
+
+    def test_recent_entries_are_not_evicted(self):
+        cache = ResultCache(self.ruta('resultados'), max_bytes=10, min_age=3600)
+        a, b, c = (cache.key(nombre, 'v1') for nombre in 'abc')
+        cache.put(a, {'resultado.png': b'x' * 100}, meta={'model_version': 'v1'})
+        cache.put(b, {'resultado.png': b'x' * 100}, meta={'model_version': 'v1'})
+        # Over max_bytes, but both were just written
+        self.assertIsNotNone(cache.get(a))
+        self.assertIsNotNone(cache.get(b))
+
+        self._envejecer(cache, a, 7200)
+        cache.put(c, {'resultado.png': b'x' * 100}, meta={'model_version': 'v1'})
+        self.assertIsNone(cache.get(a))
+        self.assertIsNotNone(cache.get(b))
+        self.assertIsNotNone(cache.get(c))
+
+    def test_older_model_versions_are_evicted_first(self):
+        cache = ResultCache(self.ruta('resultados'), max_bytes=10 ** 6, min_age=60)
+        actual, anterior = cache.key('a', 'v2'), cache.key('b', 'v1')
+        cache.put(actual, {'resultado.png': b'x' * 100}, meta={'model_version': 'v2'})
+        cache.put(anterior, {'resultado.png': b'x' * 100}, meta={'model_version': 'v1'})
+        self._envejecer(cache, actual, 7200)
+        self._envejecer(cache, anterior, 3600)
+
+        # The v2 entry is the least recently used, yet the v1 one goes first
+        cache.max_bytes = cache.size() - 1
+        cache.evict(model_version='v2')
+        self.assertIsNone(cache.get(anterior))
+        self.assertIsNotNone(cache.get(actual))
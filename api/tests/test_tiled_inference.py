@@ -0,0 +1,21 @@
+import numpy as np
+from api.ml.classifier import ClassifierService
+from api.ml.preprocessor import preprocess_image
+from api.tests.base import MLTestCase, crear_escena
+
+class TiledInferenceTests(MLTestCase):
+    def test_tiled_prediction_matches_full_scene(self):
+        service = ClassifierService()
+        for tiled in (False, True):
+            ruta = crear_escena(self.ruta(f'escena_{tiled}.tif'), 150, 170, tiled=tiled)
+            completo, _ = service.predict(ruta, tiled=False)
+            for tile_size in (None, 64, 1000):
+                por_ventanas, _ = service.predict(ruta, tiled=True, tile_size=tile_size)
+                self.assertEqual(por_ventanas.dtype, np.uint8)
+                np.testing.assert_array_equal(por_ventanas, completo)
+
+    def test_result_matches_model_predict(self):
+        ruta = crear_escena(self.ruta('escena.tif'), 40, 50)
+        X, shape, _ = preprocess_image(ruta)
+        mapa, _ = ClassifierService().predict(ruta)
+        np.testing.assert_array_equal(mapa, self.rf.predict(X).reshape(shape))
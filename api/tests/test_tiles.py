@@ -0,0 +1,39 @@
+import os
+from django.urls import reverse
+from api.ml.analysis import analyze_image
+from api.ml.result_cache import get_result_cache
+from api.ml.tiles import ORIGEN_MERCATOR, limites_mercator
+from api.tests.base import MLTestCase, crear_escena
+
+class ResultTileTests(MLTestCase):
+    ZOOM = 14
+
+    def setUp(self):
+        super().setUp()
+        self.result_id = analyze_image(crear_escena(self.ruta_media('escena.tif'), 200, 200))["result_id"]
+        # Tile under the center of the scene
+        path = get_result_cache().get(self.result_id).file('clasificacion.tif')
+        left, bottom, right, top = limites_mercator(path, os.stat(path).st_mtime_ns)
+        lado = 2 * ORIGEN_MERCATOR / 2 ** self.ZOOM
+        self.x = int(((left + right) / 2 + ORIGEN_MERCATOR) // lado)
+        self.y = int((ORIGEN_MERCATOR - (top + bottom) / 2) // lado)
+
+    def tile(self, z, x, y, **params):
+        return self.client.get(reverse('result_tile', args=[self.result_id, z, x, y]), params)
+
+    def test_tile_inside_the_scene(self):
+        for layer in ('classification', 'rgb'):
+            response = self.tile(self.ZOOM, self.x, self.y, layer=layer)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'image/png')
+            self.assertEqual(response['X-Tile-Cache'], 'miss')
+            self.assertEqual(self.tile(self.ZOOM, self.x, self.y, layer=layer)['X-Tile-Cache'], 'hit')
+
+    def test_tile_outside_the_scene_is_not_found(self):
+        for layer in ('classification', 'rgb'):
+            self.assertEqual(self.tile(self.ZOOM, self.x + 10, self.y, layer=layer).status_code, 404)
+
+    def test_invalid_tile_is_not_found(self):
+        self.assertEqual(self.tile(self.ZOOM, 2 ** self.ZOOM, self.y).status_code, 404)
+        self.assertEqual(self.tile(30, 0, 0).status_code, 404)
+        self.assertEqual(self.tile(self.ZOOM, self.x, self.y, layer='ndvi').status_code, 404)
@@ -0,0 +1,33 @@
+import os
+from django.urls import reverse
+from api.entity.job import Job
+from api.tests.base import MLTestCase
+
+class TrainingAPITests(MLTestCase):
+    def setUp(self):
+        super().setUp()
+        self.train_path = self.ruta('train')
+        self.test_path = self.ruta('test')
+        os.makedirs(self.train_path, exist_ok=True)
+        os.makedirs(self.test_path, exist_ok=True)
+
+    def test_second_training_request_is_rejected_while_one_is_pending(self):
+        # A running job owned by a live process (the test runner's parent) is not recovered
+        job = Job.objects.create(kind=Job.KIND_TRAINING, status=Job.STATUS_RUNNING, worker_pid=os.getppid(),
+                                 params={"train_path": self.train_path, "test_path": self.test_path})
+
+        response = self.client.post(reverse('train_model'),
+                                    {"train_path": self.train_path, "test_path": self.test_path})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["job"]["id"], str(job.pk))
+        self.assertEqual(Job.objects.filter(kind=Job.KIND_TRAINING).count(), 1)
+
+        response = self.client.get(reverse('train_model'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["id"], str(job.pk))
+
+    def test_missing_training_path_is_rejected(self):
+        response = self.client.post(reverse('train_model'),
+                                    {"train_path": self.ruta('no_existe'), "test_path": self.test_path})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Job.objects.exists())
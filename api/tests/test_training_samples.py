@@ -0,0 +1,15 @@
+import numpy as np
+from api.ml.trainer import iterar_muestras
+from api.tests.base import MLTestCase, crear_escena
+
+class TrainingSamplesTests(MLTestCase):
+    def test_samples_do_not_depend_on_the_worker_count(self):
+        imagenes = [crear_escena(self.ruta(f'escena_{i}.tif'), 80, 90, seed=i) for i in range(3)]
+        secuencial = list(iterar_muestras(imagenes, workers=1))
+        en_paralelo = list(iterar_muestras(imagenes, workers=2))
+
+        self.assertEqual(len(secuencial), len(imagenes))
+        for (X, y), (X_paralelo, y_paralelo) in zip(secuencial, en_paralelo):
+            self.assertGreater(len(y), 0)
+            np.testing.assert_array_equal(X, X_paralelo)
+            np.testing.assert_array_equal(y, y_paralelo)
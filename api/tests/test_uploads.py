@@ -0,0 +1,26 @@
+import hashlib
+import os
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from api.tests.base import MLTestCase, crear_escena
+
+class UploadTests(MLTestCase):
+    def test_non_tiff_upload_is_rejected(self):
+        archivo = SimpleUploadedFile('escena.tif', b'<html>no es una imagen</html>' * 100)
+        response = self.client.post(reverse('analyze_image_api'), {'image': archivo})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('GeoTIFF', response.json()["error"])
+        # Nothing of the rejected upload is left in MEDIA_ROOT
+        media = os.path.join(self.tmp, 'media')
+        self.assertEqual([f for f in os.listdir(media) if os.path.isfile(os.path.join(media, f))]
+                         if os.path.isdir(media) else [], [])
+
+    def test_upload_is_stored_under_its_content_hash(self):
+        with open(crear_escena(self.ruta('escena.tif'), 40, 50), 'rb') as f:
+            contenido = f.read()
+        response = self.client.post(reverse('analyze_image_api'),
+                                    {'image': SimpleUploadedFile('Escena.TIF', contenido)})
+        self.assertEqual(response.status_code, 200)
+        nombre = f"{hashlib.sha256(contenido).hexdigest()}.tif"
+        self.assertTrue(response.json()["uploaded_file_url"].endswith(nombre))
+        self.assertTrue(os.path.exists(os.path.join(self.tmp, 'media', nombre)))
@@ -0,0 +1,141 @@
+import os
+import uuid
+import hashlib
+import rasterio
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+
+# Classic TIFF and BigTIFF signatures, little and big endian
+FIRMAS_TIFF = (b'II*\x00', b'MM\x00*', b'II+\x00', b'MM\x00+')
+BYTES_CABECERA = 16
+
+def validar_cabecera_tiff(cabecera):
+    """
+    Checks the first bytes of an upload: TIFF / BigTIFF signature and a first IFD offset
+    that points past the header. Returns an error message, or None when it looks valid.
+    """
+    firma = cabecera[:4]
+    if firma not in FIRMAS_TIFF:
+        return "El archivo no es un GeoTIFF (cabecera TIFF inválida)"
+    orden = 'little' if firma.startswith(b'II') else 'big'
+    if firma[2:] in (b'*\x00', b'\x00*'):
+        offset = int.from_bytes(cabecera[4:8], orden)
+        minimo = 8
+    else:
+        offset = int.from_bytes(cabecera[8:16], orden)
+        minimo = 16
+    if offset < minimo:
+        return "El archivo no es un GeoTIFF (offset de IFD inválido)"
+    return None
+
+class StoredUpload(UploadedFile):
+    """
+    An upload already written to its final content-addressed name in MEDIA_ROOT.
+    storage_name is the name relative to the storage, path the absolute path.
+    """
+    def __init__(self, path, storage_name, content_hash, name, size, content_type=None, charset=None):
+        super().__init__(open(path, 'rb'), name, content_type, size, charset)
+        self.path = path
+        self.storage_name = storage_name
+        self.content_hash = content_hash
+
+    def temporary_file_path(self):
+        return self.path
+
+class ContentAddressedUploadHandler(FileUploadHandler):
+    """
+    Streams each uploaded file once, straight into MEDIA_ROOT: the body is written to a
+    partial file next to its destination while it is hashed, and renamed to <sha256><ext>
+    when complete (or dropped when that content is already stored). With validate_geotiff,
+    the TIFF header is checked on the first chunk and a bad upload is stopped right there,
+    with nothing more written; on completion the file must also open with rasterio.
+    Rejections are recorded in request.upload_error.
+    """
+    chunk_size = 1024 * 1024
+
+    def __init__(self, request=None, validate_geotiff=True):
+        super().__init__(request)
+        self.validate_geotiff = validate_geotiff
+        self.root = str(settings.MEDIA_ROOT)
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        directorio = os.path.join(self.root, '.incoming')
+        os.makedirs(directorio, exist_ok=True)
+        self.partial_path = os.path.join(directorio, f"{uuid.uuid4().hex}.part")
+        self.file = open(self.partial_path, 'wb')
+        self.sha256 = hashlib.sha256()
+        self.cabecera = b''
+        self.validada = not self.validate_geotiff
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.validada:
+            self.cabecera += raw_data[:BYTES_CABECERA - len(self.cabecera)]
+            if len(self.cabecera) >= BYTES_CABECERA:
+                error = validar_cabecera_tiff(self.cabecera)
+                if error is not None:
+                    self._rechazar(error)
+                self.validada = True
+        self.sha256.update(raw_data)
+        self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        self.file.close()
+        if not self.validada:
+            # Shorter than a TIFF header
+            self._rechazar(validar_cabecera_tiff(self.cabecera) or "El archivo no es un GeoTIFF")
+        if self.validate_geotiff:
+            try:
+                with rasterio.open(self.partial_path):
+                    pass
+            except Exception as e:
+                self._rechazar(f"El archivo no es un GeoTIFF legible: {e}")
+
+        content_hash = self.sha256.hexdigest()
+        storage_name = f"{content_hash}{os.path.splitext(self.file_name or '')[1].lower()}"
+        path = os.path.join(self.root, storage_name)
+        if os.path.exists(path):
+            os.remove(self.partial_path)
+        else:
+            os.replace(self.partial_path, path)
+        return StoredUpload(path, storage_name, content_hash, self.file_name, file_size,
+                            self.content_type, self.charset)
+
+    def upload_interrupted(self):
+        self._descartar()
+
+    def _rechazar(self, error):
+        self._descartar()
+        if self.request is not None:
+            self.request.upload_error = error
+        # The rest of the body is read and discarded, so the view can still answer with a 400
+        raise StopUpload(connection_reset=False)
+
+    def _descartar(self):
+        if getattr(self, 'file', None) is not None and not self.file.closed:
+            self.file.close()
+        if getattr(self, 'partial_path', None) and os.path.exists(self.partial_path):
+            os.remove(self.partial_path)
+
+def install_upload_handler(request, validate_geotiff=True):
+    """
+    Replaces the upload handlers of a request (Django or DRF) before its body is parsed.
+    """
+    django_request = getattr(request, '_request', request)
+    django_request.upload_handlers = [ContentAddressedUploadHandler(django_request, validate_geotiff)]
+    return django_request
+
+def upload_error(request):
+    return getattr(getattr(request, '_request', request), 'upload_error', None)
+
+class StreamingUploadMixin:
+    """
+    APIView mixin: installs ContentAddressedUploadHandler before DRF wraps (and may parse) the request.
+    """
+    validate_geotiff = True
+
+    def initialize_request(self, request, *args, **kwargs):
+        install_upload_handler(request, self.validate_geotiff)
+        return super().initialize_request(request, *args, **kwargs)
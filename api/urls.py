@@ -2,11 +2,25 @@ from django.urls import path
 from api.controller.image_controller import ImageController
 from api.views_ml import TrainModelView
 from api.views_ui import AnalyzeImageView
-from api.views_api import AnalyzeImageAPIView
+from api.views_api import AnalyzeImageAPIView, AnalyzeBatchAPIView
+from api.views_jobs import JobDetailView, JobListView
+from api.views_uploads import ChunkedUploadView, ChunkedUploadDetailView, ChunkedUploadCompleteView
+from api.views_metrics import MetricsView
+from api.views_results import ResultDetailView, ResultArtifactView, ResultTileView
 
 urlpatterns = [
     path('upload/', ImageController.as_view(), name='image-upload'),
     path('train/', TrainModelView.as_view(), name='train_model'),
     path('analyze/', AnalyzeImageView.as_view(), name='analyze_image'),  # HTML view (legacy)
     path('analyze-api/', AnalyzeImageAPIView.as_view(), name='analyze_image_api'),  # JSON API
+    path('analyze-batch/', AnalyzeBatchAPIView.as_view(), name='analyze_batch_api'),
+    path('uploads/', ChunkedUploadView.as_view(), name='chunked_upload'),
+    path('uploads/<str:upload_id>/', ChunkedUploadDetailView.as_view(), name='chunked_upload_detail'),
+    path('uploads/<str:upload_id>/complete/', ChunkedUploadCompleteView.as_view(), name='chunked_upload_complete'),
+    path('results/<str:result_id>/', ResultDetailView.as_view(), name='result_detail'),
+    path('results/<str:result_id>/tiles/<int:z>/<int:x>/<int:y>.png', ResultTileView.as_view(), name='result_tile'),
+    path('results/<str:result_id>/<str:name>', ResultArtifactView.as_view(), name='result_artifact'),
+    path('jobs/', JobListView.as_view(), name='job_list'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
+    path('jobs/<uuid:job_id>/', JobDetailView.as_view(), name='job_detail'),
 ]
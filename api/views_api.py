@@ -1,24 +1,29 @@
+import os
+from django.conf import settings
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from django.core.files.storage import FileSystemStorage
-from api.ml.classifier import ClassifierService
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend for server
-import matplotlib.pyplot as plt
-import io
-import base64
-from PIL import Image
-import rasterio
-import numpy as np
-
-class AnalyzeImageAPIView(APIView):
+from django.urls import reverse
+from api.ml.analysis import analyze_image, analyze_batch, build_result_payload, build_batch_payload
+from api.ml.result_cache import save_upload
+from api.upload_handler import StreamingUploadMixin, upload_error
+from api.ml.instrumentation import server_timing
+from api.entity.job import Job
+from api.jobs.queue import get_queue, QueueFullError
+from api.model.job_dto import JobDto
+
+class AnalyzeImageAPIView(StreamingUploadMixin, APIView):
     """
     API endpoint para analizar imágenes.
-    Devuelve JSON con la imagen de resultado en base64.
+    Devuelve JSON con las URLs de los resultados (con ?inline=1, las imágenes en base64).
+    Con ?async=1 encola el análisis y devuelve el id del trabajo (202).
     """
+    @server_timing
     def post(self, request):
         if 'image' not in request.FILES:
+            if upload_error(request):
+                return Response({"error": upload_error(request)}, status=status.HTTP_400_BAD_REQUEST)
             return Response(
                 {"error": "No se ha subido ninguna imagen"},
                 status=status.HTTP_400_BAD_REQUEST
@@ -26,109 +31,95 @@ class AnalyzeImageAPIView(APIView):
 
         image_file = request.FILES['image']
         fs = FileSystemStorage()
-        filename = fs.save(image_file.name, image_file)
+        filename, content_hash = save_upload(fs, image_file)
         file_path = fs.path(filename)
 
-        try:
-            # Convert TIF to PNG for display
-            original_image_url = None
+        if _is_async(request):
             try:
-                with rasterio.open(file_path) as src:
-                    # Read RGB bands (bands 1, 2, 3) or first 3 bands
-                    bands_to_read = []
-                    if src.count >= 3:
-                        bands_to_read = [1, 2, 3]  # RGB
-                    else:
-                        bands_to_read = [1] * 3  # Use first band for all channels
-                    
-                    # Read bands
-                    rgb_data = []
-                    for band_idx in bands_to_read:
-                        if band_idx <= src.count:
-                            band = src.read(band_idx)
-                            # Handle multi-dimensional arrays (remove extra dimensions)
-                            if len(band.shape) > 2:
-                                band = band[0]
-                            rgb_data.append(band)
-                        else:
-                            # If band doesn't exist, use zeros
-                            rgb_data.append(np.zeros((src.height, src.width), dtype=src.dtypes[0]))
-                    
-                    # Stack bands into RGB array
-                    if len(rgb_data) == 3:
-                        rgb_array = np.dstack(rgb_data)
-                    else:
-                        rgb_array = rgb_data[0]
-                        # Convert grayscale to RGB
-                        if len(rgb_array.shape) == 2:
-                            rgb_array = np.dstack([rgb_array, rgb_array, rgb_array])
-                    
-                    # Normalize to 0-255 range
-                    if rgb_array.dtype != np.uint8:
-                        rgb_array = rgb_array.astype(np.float32)
-                        # Handle NaN and Inf values
-                        rgb_array = np.nan_to_num(rgb_array, nan=0.0, posinf=0.0, neginf=0.0)
-                        
-                        # Normalize each channel separately
-                        for i in range(3):
-                            band = rgb_array[:, :, i]
-                            band_min = np.min(band)
-                            band_max = np.max(band)
-                            if band_max > band_min:
-                                rgb_array[:, :, i] = ((band - band_min) / (band_max - band_min) * 255).astype(np.uint8)
-                            else:
-                                rgb_array[:, :, i] = np.zeros_like(band, dtype=np.uint8)
-                        rgb_array = rgb_array.astype(np.uint8)
-                    
-                    # Ensure values are in valid range
-                    rgb_array = np.clip(rgb_array, 0, 255).astype(np.uint8)
-                    
-                    # Convert to PIL Image
-                    pil_image = Image.fromarray(rgb_array, mode='RGB')
-                    
-                    # Resize if too large (max 2048px on longest side for performance)
-                    max_size = 2048
-                    if max(pil_image.size) > max_size:
-                        ratio = max_size / max(pil_image.size)
-                        new_size = (int(pil_image.size[0] * ratio), int(pil_image.size[1] * ratio))
-                        pil_image = pil_image.resize(new_size, Image.Resampling.LANCZOS)
-                    
-                    # Convert to PNG base64
-                    img_buf = io.BytesIO()
-                    pil_image.save(img_buf, format='PNG')
-                    img_buf.seek(0)
-                    original_image_base64 = base64.b64encode(img_buf.getvalue()).decode('utf-8')
-                    img_buf.close()
-                    original_image_url = f"data:image/png;base64,{original_image_base64}"
-            except Exception as e:
-                # If conversion fails, continue without original image
-                print(f"Warning: Could not convert TIF to PNG: {str(e)}")
-                original_image_url = None
-
-            # Call ML Service
-            service = ClassifierService()
-            classification_map, perfil = service.predict(file_path)
-
-            # Generate visualization
-            plt.figure(figsize=(8, 8))
-            plt.imshow(classification_map, cmap="coolwarm")
-            plt.axis("off")
-            
-            buf = io.BytesIO()
-            plt.savefig(buf, format='png', bbox_inches='tight')
-            buf.seek(0)
-            image_base64 = base64.b64encode(buf.getvalue()).decode('utf-8')
-            buf.close()
-            plt.close()
-
-            result_image_url = f"data:image/png;base64,{image_base64}"
-
-            return Response({
-                "result_image_url": result_image_url,
-                "original_image_url": original_image_url,
+                job = get_queue(Job.KIND_ANALYSIS).submit({
+                    "file_path": file_path,
+                    "content_hash": content_hash,
+                    "uploaded_file_url": fs.url(filename),
+                })
+            except QueueFullError as e:
+                return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+            data = JobDto(job).data
+            data["status_url"] = request.build_absolute_uri(reverse('job_detail', args=[job.pk]))
+            return Response(data, status=status.HTTP_202_ACCEPTED)
+
+        try:
+            result = analyze_image(file_path, content_hash=content_hash)
+
+            data = build_result_payload(result["result_id"], inline=_is_inline(request))
+            data.update({
                 "uploaded_file_url": fs.url(filename),
+                "cached": result["cached"],
                 "message": "Imagen clasificada exitosamente"
-            }, status=status.HTTP_200_OK)
+            })
+            return Response(data, status=status.HTTP_200_OK)
+
+        except Exception as e:
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+class AnalyzeBatchAPIView(StreamingUploadMixin, APIView):
+    """
+    Analiza varias imágenes en un solo pedido: archivos subidos en "images" y/o rutas
+    del servidor en "paths". La predicción se hace por bloques de píxeles concatenados
+    de todas las escenas. Devuelve un resultado por archivo y los tiempos del lote.
+    Con ?async=1 encola el lote como un trabajo de análisis (202).
+    """
+    @server_timing
+    def post(self, request):
+        uploads = request.FILES.getlist('images')
+        paths = request.data.getlist('paths') if hasattr(request.data, 'getlist') else request.data.get('paths', [])
+        if isinstance(paths, str):
+            paths = [paths]
+        if upload_error(request):
+            return Response({"error": upload_error(request)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not uploads and not paths:
+            return Response({"error": "No se ha subido ninguna imagen ni ruta"}, status=status.HTTP_400_BAD_REQUEST)
+        max_files = getattr(settings, 'ML_BATCH_MAX_FILES', 50)
+        if len(uploads) + len(paths) > max_files:
+            return Response({"error": f"Demasiados archivos: el máximo por lote es {max_files}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        files = []
+        for path in paths:
+            file_path = _ruta_permitida(path)
+            if file_path is None:
+                return Response({"error": f"Ruta no permitida o inexistente: {path}"}, status=status.HTTP_400_BAD_REQUEST)
+            files.append({"file_path": file_path, "name": os.path.basename(file_path), "uploaded_file_url": None})
+
+        fs = FileSystemStorage()
+        for image_file in uploads:
+            filename, content_hash = save_upload(fs, image_file)
+            files.append({
+                "file_path": fs.path(filename),
+                "content_hash": content_hash,
+                "name": image_file.name,
+                "uploaded_file_url": fs.url(filename),
+            })
+
+        if _is_async(request):
+            try:
+                job = get_queue(Job.KIND_ANALYSIS).submit({"files": files})
+            except QueueFullError as e:
+                return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+            data = JobDto(job).data
+            data["status_url"] = request.build_absolute_uri(reverse('job_detail', args=[job.pk]))
+            return Response(data, status=status.HTTP_202_ACCEPTED)
+
+        try:
+            batch = analyze_batch(files)
+            data = build_batch_payload(batch, [f["uploaded_file_url"] for f in files])
+            data["message"] = f"{len(files) - batch['timing']['failed']} de {len(files)} imágenes clasificadas"
+            return Response(data, status=status.HTTP_200_OK)
 
         except Exception as e:
             return Response(
@@ -136,3 +127,25 @@ class AnalyzeImageAPIView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+def _ruta_permitida(path):
+    """
+    Resolves a server-side path, only if it is an existing file under ML_BATCH_PATH_ROOTS
+    (by default MEDIA_ROOT and the training/test directories).
+    """
+    raices = getattr(settings, 'ML_BATCH_PATH_ROOTS', None) or [
+        settings.MEDIA_ROOT, settings.ML_TRAIN_PATH, settings.ML_TEST_PATH
+    ]
+    ruta = os.path.realpath(path)
+    for raiz in raices:
+        raiz = os.path.realpath(raiz)
+        if os.path.commonpath([ruta, raiz]) == raiz and os.path.isfile(ruta):
+            return ruta
+    return None
+
+def _is_async(request):
+    valor = request.query_params.get('async', request.data.get('async', ''))
+    return str(valor).lower() in ('1', 'true', 'yes')
+
+def _is_inline(request):
+    valor = request.query_params.get('inline', request.query_params.get('base64', ''))
+    return str(valor).lower() in ('1', 'true', 'yes')
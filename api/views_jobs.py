@@ -0,0 +1,33 @@
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status
+from api.entity.job import Job
+from api.model.job_dto import JobDto
+
+class JobDetailView(APIView):
+    """
+    Status, progress and (once done) result of a background job.
+    """
+    def get(self, request, job_id):
+        try:
+            job = Job.objects.get(pk=job_id)
+        except Job.DoesNotExist:
+            return Response({"error": f"Job not found: {job_id}"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(JobDto(job).data, status=status.HTTP_200_OK)
+
+class JobListView(APIView):
+    """
+    Most recent background jobs, optionally filtered by kind and status.
+    """
+    def get(self, request):
+        jobs = Job.objects.all()
+        if request.query_params.get('kind'):
+            jobs = jobs.filter(kind=request.query_params['kind'])
+        if request.query_params.get('status'):
+            jobs = jobs.filter(status=request.query_params['status'])
+        # Results can be large, the list only reports state
+        data = [
+            {k: v for k, v in item.items() if k != 'result'}
+            for item in JobDto(jobs[:50], many=True).data
+        ]
+        return Response(data, status=status.HTTP_200_OK)
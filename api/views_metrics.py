@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.views import View
+from api.ml.instrumentation import prometheus_metrics
+
+class MetricsView(View):
+    """
+    Per-stage pipeline metrics of this process in the Prometheus text format.
+    Only served with ML_METRICS_ENDPOINT (stages are recorded with ML_INSTRUMENTATION).
+    """
+    def get(self, request):
+        if not getattr(settings, 'ML_METRICS_ENDPOINT', False):
+            raise Http404("Metrics endpoint disabled")
+        return HttpResponse(prometheus_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -2,11 +2,23 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from django.conf import settings
-from api.ml.trainer import train_model
-import threading
+from django.urls import reverse
+from api.ml.trainer import train_model, TrainingInProgressError
+from api.entity.job import Job
+from api.jobs.queue import get_queue, QueueFullError
+from api.model.job_dto import JobDto
 import os
 
 class TrainModelView(APIView):
+    def get(self, request):
+        """
+        Status of the most recent training job.
+        """
+        job = Job.objects.filter(kind=Job.KIND_TRAINING).first()
+        if job is None:
+            return Response({"error": "No training job has been submitted"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(self._job_data(request, job), status=status.HTTP_200_OK)
+
     def post(self, request):
         # Use default paths from settings if not provided
         train_path = request.data.get('train_path', settings.ML_TRAIN_PATH)
@@ -22,7 +34,24 @@ class TrainModelView(APIView):
             return Response({
                 "error": f"Test path does not exist: {test_path}"
             }, status=status.HTTP_400_BAD_REQUEST)
-        
+
+        if _is_sync(request):
+            return self._train_inline(train_path, test_path)
+
+        try:
+            job = get_queue(Job.KIND_TRAINING).submit({
+                "train_path": train_path,
+                "test_path": test_path,
+            })
+        except QueueFullError as e:
+            data = {"error": "A training job is already pending or running"}
+            if e.pending_job is not None:
+                data["job"] = self._job_data(request, e.pending_job)
+            return Response(data, status=status.HTTP_409_CONFLICT)
+
+        return Response(self._job_data(request, job), status=status.HTTP_202_ACCEPTED)
+
+    def _train_inline(self, train_path, test_path):
         try:
             metrics = train_model(train_path, test_path)
             return Response({
@@ -31,9 +60,22 @@ class TrainModelView(APIView):
                 "test_path": test_path,
                 "metrics": metrics
             }, status=status.HTTP_200_OK)
+        except TrainingInProgressError as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
         except Exception as e:
             return Response({
                 "error": str(e),
                 "train_path": train_path,
                 "test_path": test_path
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def _job_data(self, request, job):
+        data = JobDto(job).data
+        data["train_path"] = job.params.get("train_path")
+        data["test_path"] = job.params.get("test_path")
+        data["status_url"] = request.build_absolute_uri(reverse('job_detail', args=[job.pk]))
+        return data
+
+def _is_sync(request):
+    valor = request.query_params.get('sync', request.data.get('sync', ''))
+    return str(valor).lower() in ('1', 'true', 'yes')
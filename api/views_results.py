@@ -0,0 +1,178 @@
+import os
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.views import View
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status
+from api.ml.analysis import build_result_payload, CONTENT_TYPES, RESULT_ARTIFACTS
+from api.ml.result_cache import get_result_cache, ResultCache
+from api.views_api import _ruta_permitida
+from api.ml.tiles import (
+    TILE_LAYERS, tile_valido, tile_en_escena, get_tile_cache, render_classification_tile, render_rgb_tile
+)
+
+# Result ids are derived from the upload content and the model version, so an artifact
+# never changes once written and can be cached by clients indefinitely
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+class ResultDetailView(APIView):
+    """
+    Metadata and artifact URLs of a stored result (?inline=1 embeds the PNGs as base64).
+    """
+    def get(self, request, result_id):
+        if not ResultCache.valid_key(result_id):
+            return Response({"error": "Invalid result id"}, status=status.HTTP_400_BAD_REQUEST)
+        entry = get_result_cache().get(result_id)
+        if entry is None:
+            return Response({"error": f"Result not found: {result_id}"}, status=status.HTTP_404_NOT_FOUND)
+
+        data = build_result_payload(result_id, inline=_is_inline(request))
+        # The server-side path of the source scene stays internal
+        data["metadata"] = {clave: valor for clave, valor in entry.meta.items() if clave != 'source_path'}
+        return Response(data, status=status.HTTP_200_OK)
+
+class ResultArtifactView(View):
+    """
+    Streams a stored result file with ETag / Cache-Control headers.
+    Single byte ranges are honoured so COG clients can read the header and individual tiles.
+    """
+    def get(self, request, result_id, name):
+        if not ResultCache.valid_key(result_id) or name not in RESULT_ARTIFACTS.values():
+            raise Http404("Unknown result artifact")
+
+        entry = get_result_cache().get(result_id)
+        path = entry.file(name) if entry is not None else None
+        if path is None:
+            raise Http404("Result artifact not found")
+
+        etag = f'"{result_id}-{name}"'
+        rango = _parse_range(request.headers.get('Range'), os.path.getsize(path))
+        if etag in request.headers.get('If-None-Match', ''):
+            response = HttpResponseNotModified()
+        elif rango == 'invalid':
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{os.path.getsize(path)}'
+        elif rango is not None:
+            # Single byte range, e.g. a COG header or tile read by a viewer; only the range is streamed
+            inicio, fin = rango
+            response = FileResponse(
+                _TramoArchivo(path, inicio, fin - inicio + 1), status=206,
+                content_type=CONTENT_TYPES.get(os.path.splitext(name)[1], 'application/octet-stream'),
+            )
+            response['Content-Length'] = fin - inicio + 1
+            response['Content-Range'] = f'bytes {inicio}-{fin}/{os.path.getsize(path)}'
+        else:
+            response = FileResponse(
+                open(path, 'rb'),
+                content_type=CONTENT_TYPES.get(os.path.splitext(name)[1], 'application/octet-stream'),
+            )
+            if name.endswith('.tif'):
+                response['Content-Disposition'] = f'attachment; filename="{result_id}_{name}"'
+        response['ETag'] = etag
+        response['Cache-Control'] = CACHE_CONTROL
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+class ResultTileView(View):
+    """
+    XYZ Web Mercator tile of a stored result: ?layer=classification (default) renders the
+    class map, ?layer=rgb the uploaded scene. Tiles are rendered on demand from the needed
+    window / overview and kept in an in-process LRU cache; tiles outside the scene are a 404.
+    """
+    def get(self, request, result_id, z, x, y):
+        layer = request.GET.get('layer', 'classification')
+        if not ResultCache.valid_key(result_id) or layer not in TILE_LAYERS or not tile_valido(z, x, y):
+            raise Http404("Unknown tile")
+
+        etag = f'"{result_id}-{layer}-{z}-{x}-{y}"'
+        if etag in request.headers.get('If-None-Match', ''):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            response['Cache-Control'] = CACHE_CONTROL
+            return response
+
+        cache = get_tile_cache()
+        clave = (result_id, layer, z, x, y)
+        tile = cache.get(clave)
+        estado = 'hit'
+        if tile is None:
+            estado = 'miss'
+            tile = self._render(result_id, layer, z, x, y)
+            cache.put(clave, tile)
+
+        response = HttpResponse(tile, content_type='image/png')
+        response['ETag'] = etag
+        response['Cache-Control'] = CACHE_CONTROL
+        response['X-Tile-Cache'] = estado
+        return response
+
+    def _render(self, result_id, layer, z, x, y):
+        entry = get_result_cache().get(result_id)
+        if entry is None:
+            raise Http404("Result not found")
+
+        if layer == 'classification':
+            path = entry.file('clasificacion.tif')
+            if path is None:
+                raise Http404("Result raster not found")
+            if not tile_en_escena(path, os.stat(path).st_mtime_ns, z, x, y):
+                raise Http404("Tile outside the result")
+            return render_classification_tile(path, z, x, y)
+
+        # The RGB layer is read from the scene the result was computed from, an upload or a
+        # server-side path (entries stored before source_path only have the upload's name)
+        source = entry.meta.get('source_path') or (
+            entry.meta.get('source') and os.path.join(settings.MEDIA_ROOT, entry.meta['source'])
+        )
+        path = _ruta_permitida(source) if source else None
+        if path is None:
+            raise Http404("Source image not found")
+        mtime_ns = os.stat(path).st_mtime_ns
+        if not tile_en_escena(path, mtime_ns, z, x, y):
+            raise Http404("Tile outside the source image")
+        return render_rgb_tile(path, mtime_ns, z, x, y)
+
+class _TramoArchivo:
+    """
+    Read-only file-like view of length bytes of a file from inicio, streamed by FileResponse.
+    It has no name, seek or fileno, so neither Django nor the server look past the range.
+    """
+    def __init__(self, path, inicio, longitud):
+        self._archivo = open(path, 'rb')
+        self._archivo.seek(inicio)
+        self._restante = longitud
+
+    def read(self, tamano=-1):
+        if tamano is None or tamano < 0 or tamano > self._restante:
+            tamano = self._restante
+        datos = self._archivo.read(tamano)
+        self._restante -= len(datos)
+        return datos
+
+    def close(self):
+        self._archivo.close()
+
+def _parse_range(cabecera, tamano):
+    """
+    Parses a single "bytes=" range into inclusive (start, end) offsets.
+    Returns None for no or unsupported (multi-range) headers, 'invalid' when unsatisfiable.
+    """
+    if not cabecera or not cabecera.startswith('bytes=') or ',' in cabecera:
+        return None
+    inicio, _, fin = cabecera[len('bytes='):].strip().partition('-')
+    try:
+        if inicio == '':
+            # Suffix range: the last N bytes
+            inicio, fin = max(tamano - int(fin), 0), tamano - 1
+        else:
+            inicio, fin = int(inicio), min(int(fin), tamano - 1) if fin else tamano - 1
+    except ValueError:
+        return None
+    if inicio > fin or inicio >= tamano:
+        return 'invalid'
+    return inicio, fin
+
+def _is_inline(request):
+    valor = request.GET.get('inline', request.GET.get('base64', ''))
+    return str(valor).lower() in ('1', 'true', 'yes')
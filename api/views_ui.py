@@ -1,51 +1,43 @@
 from django.shortcuts import render
 from django.views import View
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from django.core.files.storage import FileSystemStorage
-from api.ml.classifier import ClassifierService
-import os
-from django.conf import settings
-import numpy as np
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend for server
-import matplotlib.pyplot as plt
-import io
-import base64
+from api.ml.analysis import analyze_image, build_result_payload
+from api.ml.result_cache import save_upload
+from api.upload_handler import install_upload_handler, upload_error
+from api.ml.instrumentation import server_timing
 
+@method_decorator(csrf_exempt, name='dispatch')
 class AnalyzeImageView(View):
+    # The CSRF check reads request.POST, so the upload handler has to be installed before it runs
+    def dispatch(self, request, *args, **kwargs):
+        install_upload_handler(request)
+        return csrf_protect(super().dispatch)(request, *args, **kwargs)
+
     def get(self, request):
         return render(request, 'api/upload.html')
 
+    @server_timing
     def post(self, request):
         if 'image' not in request.FILES:
+            if upload_error(request):
+                return render(request, 'api/upload.html', {'error': upload_error(request)})
             return render(request, 'api/upload.html', {'error': 'No se ha subido ninguna imagen'})
 
         image_file = request.FILES['image']
         fs = FileSystemStorage()
-        filename = fs.save(image_file.name, image_file)
+        filename, content_hash = save_upload(fs, image_file)
         uploaded_file_url = fs.url(filename)
         file_path = fs.path(filename)
 
         try:
-            # Call ML Service
-            service = ClassifierService()
-            classification_map, perfil = service.predict(file_path)
-
-            # Generate visualization for the web
-            plt.figure(figsize=(8, 8))
-            plt.imshow(classification_map, cmap="coolwarm")
-            plt.axis("off")
-            
-            buf = io.BytesIO()
-            plt.savefig(buf, format='png', bbox_inches='tight')
-            buf.seek(0)
-            image_base64 = base64.b64encode(buf.getvalue()).decode('utf-8')
-            buf.close()
-            plt.close()
-
-            result_image_url = f"data:image/png;base64,{image_base64}"
+            # Call ML Service (the result page only shows the classification)
+            result = analyze_image(file_path, content_hash=content_hash, preview=False)
+            payload = build_result_payload(result['result_id'])
 
             return render(request, 'api/result.html', {
-                'result_image_url': result_image_url,
+                'result_image_url': payload['result_image_url'],
                 'uploaded_file_url': uploaded_file_url
             })
 
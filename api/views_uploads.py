@@ -0,0 +1,153 @@
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.urls import reverse
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status
+from api.chunked_upload import (
+    get_upload_store, parse_content_range, UploadError, MIN_CHUNK_SIZE, MAX_CHUNK_SIZE
+)
+from api.entity.job import Job
+from api.jobs.queue import get_queue, QueueFullError
+from api.model.job_dto import JobDto
+
+class ChunkedUploadView(APIView):
+    """
+    Inicia una subida reanudable: {"filename", "size", "chunk_size" (opcional), "sha256" (opcional)}.
+    Los chunks se envían con PUT a upload_url (Content-Range + X-Chunk-SHA256), en cualquier
+    orden y en paralelo, y la subida se cierra con POST a complete_url.
+    """
+    def post(self, request):
+        filename = request.data.get('filename')
+        try:
+            size = int(request.data.get('size'))
+            chunk_size = int(request.data.get('chunk_size') or getattr(settings, 'ML_UPLOAD_CHUNK_BYTES', 8 * 1024 * 1024))
+        except (TypeError, ValueError):
+            return Response({"error": "size y chunk_size deben ser enteros"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not filename:
+            return Response({"error": "Falta filename"}, status=status.HTTP_400_BAD_REQUEST)
+        max_bytes = getattr(settings, 'ML_UPLOAD_MAX_BYTES', None)
+        if size <= 0 or (max_bytes and size > max_bytes):
+            return Response({"error": f"Tamaño inválido: {size} (máximo {max_bytes} bytes)"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not MIN_CHUNK_SIZE <= chunk_size <= MAX_CHUNK_SIZE:
+            return Response({"error": f"chunk_size debe estar entre {MIN_CHUNK_SIZE} y {MAX_CHUNK_SIZE} bytes"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            upload = get_upload_store().create(filename, size, chunk_size, sha256=request.data.get('sha256'))
+        except OSError as e:
+            return Response({"error": f"No se pudo reservar el archivo: {e}"},
+                            status=status.HTTP_507_INSUFFICIENT_STORAGE)
+        return Response(_upload_payload(request, upload), status=status.HTTP_201_CREATED)
+
+class ChunkedUploadDetailView(APIView):
+    """
+    GET: estado de la subida (chunks recibidos y faltantes, para reanudarla).
+    PUT: un chunk, con Content-Range: bytes <inicio>-<fin>/<tamaño> alineado a chunk_size
+    y X-Chunk-SHA256 con el sha256 de su contenido.
+    DELETE: cancela la subida.
+    """
+    def get(self, request, upload_id):
+        upload = get_upload_store().get(upload_id)
+        if upload is None:
+            return Response({"error": f"Subida no encontrada: {upload_id}"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(_upload_payload(request, upload), status=status.HTTP_200_OK)
+
+    def put(self, request, upload_id):
+        upload = get_upload_store().get(upload_id)
+        if upload is None:
+            return Response({"error": f"Subida no encontrada: {upload_id}"}, status=status.HTTP_404_NOT_FOUND)
+
+        rango = parse_content_range(request.headers.get('Content-Range'))
+        checksum = request.headers.get('X-Chunk-SHA256')
+        if rango is None or not checksum:
+            return Response({"error": "Se requieren los headers Content-Range y X-Chunk-SHA256"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        inicio, fin, total = rango
+        index = inicio // upload.chunk_size
+        if total != upload.size or inicio % upload.chunk_size or upload.chunk_range(index) != (inicio, fin):
+            response = Response({"error": f"El rango debe cubrir un chunk completo de {upload.chunk_size} bytes"},
+                                status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = f'bytes */{upload.size}'
+            return response
+        if int(request.META.get('CONTENT_LENGTH') or 0) != fin - inicio + 1:
+            return Response({"error": "Content-Length no coincide con Content-Range"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            digest = upload.write_chunk(index, request.stream, checksum)
+        except UploadError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"index": index, "sha256": digest, "received": len(upload.received()),
+                         "chunks": upload.chunks}, status=status.HTTP_200_OK)
+
+    def delete(self, request, upload_id):
+        if get_upload_store().get(upload_id) is None:
+            return Response({"error": f"Subida no encontrada: {upload_id}"}, status=status.HTTP_404_NOT_FOUND)
+        get_upload_store().delete(upload_id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class ChunkedUploadCompleteView(APIView):
+    """
+    Cierra la subida: verifica que estén todos los chunks, mueve el archivo al almacenamiento
+    por hash de contenido y encola su análisis (202 con el trabajo). Con ?analyze=0 solo lo guarda.
+    Repetir el pedido devuelve el mismo trabajo.
+    """
+    def post(self, request, upload_id):
+        upload = get_upload_store().get(upload_id)
+        if upload is None:
+            return Response({"error": f"Subida no encontrada: {upload_id}"}, status=status.HTTP_404_NOT_FOUND)
+
+        fs = FileSystemStorage()
+        try:
+            meta = upload.complete(fs.location)
+        except UploadError as e:
+            data = {"error": str(e), "missing": upload.missing()}
+            codigo = status.HTTP_409_CONFLICT if data["missing"] else status.HTTP_400_BAD_REQUEST
+            return Response(data, status=codigo)
+
+        uploaded_file_url = fs.url(meta['storage_name'])
+        if str(request.query_params.get('analyze', '1')).lower() in ('0', 'false', 'no'):
+            return Response({"upload_id": upload.id, "content_hash": meta['content_hash'],
+                             "uploaded_file_url": uploaded_file_url}, status=status.HTTP_200_OK)
+
+        job = Job.objects.filter(pk=meta['job_id']).first() if meta.get('job_id') else None
+        if job is None:
+            try:
+                job = get_queue(Job.KIND_ANALYSIS).submit({
+                    "file_path": fs.path(meta['storage_name']),
+                    "content_hash": meta['content_hash'],
+                    "uploaded_file_url": uploaded_file_url,
+                })
+            except QueueFullError:
+                return Response({"error": "La cola de análisis está llena, reintente más tarde "
+                                          "(la subida quedó completa, basta con repetir este pedido)"},
+                                status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            upload.meta['job_id'] = str(job.pk)
+            upload.save_meta()
+
+        data = JobDto(job).data
+        data["status_url"] = request.build_absolute_uri(reverse('job_detail', args=[job.pk]))
+        data["uploaded_file_url"] = uploaded_file_url
+        return Response(data, status=status.HTTP_202_ACCEPTED)
+
+def _upload_payload(request, upload):
+    recibidos = upload.received()
+    data = {
+        "upload_id": upload.id,
+        "filename": upload.meta['filename'],
+        "size": upload.size,
+        "chunk_size": upload.chunk_size,
+        "chunks": upload.chunks,
+        "received": recibidos,
+        "bytes_received": sum(fin - inicio + 1 for inicio, fin in map(upload.chunk_range, recibidos)),
+        "completed": upload.completed,
+        "upload_url": request.build_absolute_uri(reverse('chunked_upload_detail', args=[upload.id])),
+        "complete_url": request.build_absolute_uri(reverse('chunked_upload_complete', args=[upload.id])),
+    }
+    if upload.completed:
+        data.update(received=list(range(upload.chunks)), bytes_received=upload.size,
+                    content_hash=upload.meta['content_hash'], job_id=upload.meta.get('job_id'))
+    return data
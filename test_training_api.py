@@ -6,10 +6,19 @@ Uso: python test_training_api.py
 
 import requests
 import json
+import time
 
 # URL del API
 API_URL = "http://localhost:8000/api/train/"
 
+def wait_for_job(job):
+    """Consulta el estado del trabajo hasta que termina"""
+    while job["status"] in ("queued", "running"):
+        print(f"   ⏳ {job['status']} {job['progress'] * 100:.0f}% {job['stage']} {job.get('details', {})}")
+        time.sleep(5)
+        job = requests.get(job["status_url"]).json()
+    return job
+
 def test_training_with_defaults():
     """Prueba el entrenamiento usando las rutas por defecto"""
     print("🚀 Iniciando entrenamiento con rutas por defecto...")
@@ -22,9 +31,12 @@ def test_training_with_defaults():
         print(f"📊 Status Code: {response.status_code}")
         print()
         
-        if response.status_code == 200:
-            data = response.json()
-            print("✅ Entrenamiento exitoso!")
+        if response.status_code == 202:
+            data = wait_for_job(response.json())
+            if data["status"] == "done":
+                print("✅ Entrenamiento exitoso!")
+            else:
+                print("❌ Error en el entrenamiento:")
             print(json.dumps(data, indent=2))
         else:
             print("❌ Error en el entrenamiento:")
@@ -55,9 +67,12 @@ def test_training_with_custom_paths(train_path, test_path):
         print(f"📊 Status Code: {response.status_code}")
         print()
         
-        if response.status_code == 200:
-            result = response.json()
-            print("✅ Entrenamiento exitoso!")
+        if response.status_code == 202:
+            result = wait_for_job(response.json())
+            if result["status"] == "done":
+                print("✅ Entrenamiento exitoso!")
+            else:
+                print("❌ Error en el entrenamiento:")
             print(json.dumps(result, indent=2))
         else:
             print("❌ Error en el entrenamiento:")